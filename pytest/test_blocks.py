@@ -0,0 +1,72 @@
+from uncompyle6 import PYTHON_VERSION, IS_PYPY
+from uncompyle6.scanner import get_scanner
+from uncompyle6.scanners.blocks import StructList
+
+
+def test_end_finally():
+    def f(a):
+        try:
+            try:
+                a()
+            except A:
+                pass
+            a()
+        except B:
+            pass
+
+    scan = get_scanner(PYTHON_VERSION, IS_PYPY)
+    scan.build_instructions(f.__code__)
+    assert scan.get_block_ends() is scan.get_block_ends()
+    opc = scan.opc
+    if not hasattr(opc, "SETUP_EXCEPT"):
+        return
+    end_finallys = [inst.offset for inst in scan.insts if inst.opname == "END_FINALLY"]
+    assert len(end_finallys) == 2
+    setup_ops = [opc.SETUP_EXCEPT]
+
+    # Each try's SETUP_EXCEPT goes with the END_FINALLY after its
+    # handlers; the one from the start of the code has none.
+    setups = [inst.offset for inst in scan.insts if inst.opcode == opc.SETUP_EXCEPT]
+    next_offset = dict(
+        (inst.offset, next_inst.offset)
+        for inst, next_inst in zip(scan.insts, scan.insts[1:])
+    )
+    assert scan.end_finally(setups[0], setup_ops) is None
+    assert scan.end_finally(next_offset[setups[0]], setup_ops) == end_finallys[1]
+    assert scan.end_finally(next_offset[setups[1]], setup_ops) == end_finallys[0]
+    assert scan.end_finally(next_offset[end_finallys[0]], setup_ops) == end_finallys[1]
+
+    # This is what walking over the code gives.
+    for inst in scan.insts:
+        count = 0
+        found = None
+        for offset in scan.op_range(inst.offset, len(scan.code)):
+            if scan.code[offset] == opc.END_FINALLY:
+                if count == 0:
+                    found = offset
+                    break
+                count -= 1
+            elif scan.code[offset] in setup_ops:
+                count += 1
+        assert scan.end_finally(inst.offset, setup_ops) == found
+
+
+def test_struct_list():
+    structs = StructList([{"type": "root", "start": 0, "end": 100}])
+    structs.append({"type": "a", "start": 10, "end": 50})
+    assert structs.innermost(5)["type"] == "root"
+    assert structs.innermost(10)["type"] == "a"
+    structs.append({"type": "b", "start": 20, "end": 30})
+    structs.append({"type": "c", "start": 25, "end": 60})
+    assert structs.innermost(25)["type"] == "b"
+    assert structs.innermost(40)["type"] == "a"
+    assert structs.innermost(55)["type"] == "c"
+    assert structs.innermost(70)["type"] == "root"
+    # Going back starts over.
+    assert structs.innermost(22)["type"] == "b"
+    assert structs == [
+        {"type": "root", "start": 0, "end": 100},
+        {"type": "a", "start": 10, "end": 50},
+        {"type": "b", "start": 20, "end": 30},
+        {"type": "c", "start": 25, "end": 60},
+    ]
@@ -0,0 +1,68 @@
+import os.path
+from io import StringIO
+
+import pytest
+
+import uncompyle6.main
+from uncompyle6.cache import CachedDeparse, DecompileCache
+from uncompyle6.main import decompile_file
+from uncompyle6.semantics.parser_error import ParserError
+
+
+def get_srcdir():
+    filename = os.path.normcase(os.path.dirname(__file__))
+    return os.path.realpath(filename)
+
+
+src_dir = get_srcdir()
+os.chdir(src_dir)
+
+
+def test_cache_hit(tmpdir):
+    cache = DecompileCache(str(tmpdir))
+    in_file = "../test/bytecode_2.7/05_if.pyc"
+
+    out = StringIO()
+    deparsed = decompile_file(in_file, out, cache=cache)
+    assert not isinstance(deparsed[0], CachedDeparse)
+
+    cached_out = StringIO()
+    deparsed = decompile_file(in_file, cached_out, cache=cache)
+    assert isinstance(deparsed[0], CachedDeparse)
+    assert out.getvalue() == cached_out.getvalue()
+
+
+def test_cache_failure(tmpdir, monkeypatch):
+    cache = DecompileCache(str(tmpdir))
+    in_file = "../test/bytecode_2.7/05_if.pyc"
+
+    def code_deparse(*args, **kwargs):
+        raise ParserError("no parse", [], {})
+
+    monkeypatch.setattr(uncompyle6.main, "code_deparse", code_deparse)
+    with pytest.raises(ParserError) as error:
+        decompile_file(in_file, StringIO(), cache=cache)
+    # The cached failure is raised again with the same class and message.
+    with pytest.raises(ParserError) as cached_error:
+        decompile_file(in_file, StringIO(), cache=cache)
+    assert cached_error.type.__name__ == "ParserError"
+    assert str(cached_error.value) == str(error.value)
+
+
+def test_cache_eviction(tmpdir):
+    cache = DecompileCache(str(tmpdir), max_size=1000)
+    for i in range(10):
+        cache.put("%040x" % i, "ok", "x = %d\n" % i + "#" * 200)
+    assert sum(size for _, size, _ in cache.entries()) <= 1000
+    assert cache.get("%040x" % 9) is not None
+
+
+def test_cache_size_replace(tmpdir):
+    cache = DecompileCache(str(tmpdir), max_size=1000)
+    cache.put("%040x" % 0, "ok", "x = 0\n")
+    cache.put("%040x" % 1, "ok", "x = 1\n")
+    for i in range(20):
+        cache.put("%040x" % 1, "ok", "x = %d\n" % (i % 10) + "#" * 200)
+    # Replacing an entry over and over doesn't make the cache evict.
+    assert cache.size == sum(size for _, size, _ in cache.entries())
+    assert cache.get("%040x" % 0) is not None
@@ -0,0 +1,45 @@
+from uncompyle6 import PYTHON_VERSION, IS_PYPY
+import uncompyle6.scanner as scanner
+from uncompyle6.scanner import get_scanner
+from uncompyle6.semantics.pysource import code_deparse
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+def deparse(co):
+    out = StringIO()
+    code_deparse(co, out, PYTHON_VERSION, is_pypy=IS_PYPY)
+    return out.getvalue()
+
+
+def test_const_collections():
+    n = 40
+    source = (
+        "x = [" + ", ".join(str(i) for i in range(n)) + "]\n"
+        "y = {" + ", ".join("'k%d': %d.5" % (i, i) for i in range(n)) + "}\n"
+        "z = {\n" + "".join("    '%d',\n" % i for i in range(n)) + "}\n"
+        "w = [a, 1, 2, 3]\n"
+    )
+    co = compile(source, "<test>", "exec")
+
+    tokens, customize = get_scanner(PYTHON_VERSION, IS_PYPY).ingest(co)
+    if not IS_PYPY:
+        collapsed = [t for t in tokens if t.kind.startswith("CONST_")]
+        assert [t.attr for t in collapsed] == [n, n, n]
+        assert collapsed[0].kind == "CONST_LIST"
+        assert collapsed[0].pattr[-1].kind == "BUILD_LIST_%d" % n
+        assert collapsed[2].kind == "CONST_SET"
+
+    # The parse tree and so the source text is the same as without
+    # collapsing the constants.
+    saved = scanner.CONST_COLLECTION_MIN
+    try:
+        scanner.CONST_COLLECTION_MIN = n + 1
+        expect = deparse(co)
+    finally:
+        scanner.CONST_COLLECTION_MIN = saved
+    assert deparse(co) == expect
+    assert "'k39':39.5" in expect
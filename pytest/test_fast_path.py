@@ -0,0 +1,78 @@
+from uncompyle6 import PYTHON_VERSION, IS_PYPY
+from uncompyle6.parser import get_python_parser
+from uncompyle6.scanner import get_scanner
+from uncompyle6.semantics.pysource import code_deparse
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+def build_tree(co, fast_path):
+    scanner = get_scanner(PYTHON_VERSION, IS_PYPY)
+    tokens, customize = scanner.ingest(co)
+    p = get_python_parser(PYTHON_VERSION, is_pypy=IS_PYPY)
+    p.insts = scanner.insts
+    p.offset2inst_index = scanner.offset2inst_index
+    p.customize_grammar_rules(tokens, customize)
+    p.use_fast_path = fast_path
+    return p, tokens, p.parse(tokens)
+
+
+def test_fast_path():
+    source = """
+x = 1
+y = a.b(c, -d + 1)[x] > 2
+f(y)
+if x:
+    z = g(x) * h
+"""
+    co = compile(source, "<test>", "exec")
+    p, tokens, tree = build_tree(co, True)
+    fast_tokens = p.fast_path(tokens)
+    kinds = [t.kind for t in fast_tokens]
+    assert kinds[:3] == ["FAST_ASSIGN", "FAST_ASSIGN", "FAST_CALL_STMT"]
+    # Statements inside the "if" are left to the Earley parser.
+    assert "FAST_ASSIGN" not in kinds[3:]
+    # The instructions are kept with the token
+    assert fast_tokens[1].pattr[0] is tokens[2]
+
+    # The parse tree is the one the Earley parser makes on its own.
+    assert str(tree) == str(build_tree(co, False)[2])
+
+
+def test_fast_path_not_sure():
+    # No instructions to check the tokens against
+    co = compile("x = a + b\n", "<test>", "exec")
+    p, tokens, tree = build_tree(co, True)
+    p.insts = []
+    assert p.fast_path(tokens) is tokens
+
+    # Values from before a jump target aren't combined.
+    co = compile("x = (a if c else b) + d\n", "<test>", "exec")
+    p, tokens, tree = build_tree(co, True)
+    assert p.fast_path(tokens) is tokens
+    assert str(tree) == str(build_tree(co, False)[2])
+
+
+def test_fast_path_control_flow():
+    # The statement after the "if" is where its jumps go, and the rules
+    # for the "if" check the tokens there.
+    source = """
+def f(item, append):
+    if not append:
+        filters.insert(0, item)
+    else:
+        if item not in filters:
+            filters.append(item)
+    g()
+"""
+    co = compile(source, "<test>", "exec")
+    texts = []
+    for fast_path in (False, True):
+        out = StringIO()
+        code_deparse(co, out, PYTHON_VERSION, is_pypy=IS_PYPY, fast_path=fast_path)
+        texts.append(out.getvalue())
+    assert texts[0] == texts[1]
+    assert "\n    g()" in texts[1]
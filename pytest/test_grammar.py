@@ -1,6 +1,6 @@
-import re
+import re, threading
 from uncompyle6 import PYTHON_VERSION, PYTHON3, IS_PYPY  # , PYTHON_VERSION
-from uncompyle6.parser import get_python_parser, python_parser
+from uncompyle6.parser import get_python_parser, python_parser, nop_func
 from uncompyle6.scanner import get_scanner
 
 
@@ -144,3 +144,43 @@ def test_dup_rule():
             "context": True,
         },
     )
+
+
+def test_parser_copies_are_independent():
+    p1 = get_python_parser(PYTHON_VERSION, is_pypy=IS_PYPY)
+    p2 = get_python_parser(PYTHON_VERSION, is_pypy=IS_PYPY)
+    assert p1 is not p2
+    rule = "expr ::= expr LOAD_CONST"
+    p1.addRule(rule, nop_func)
+    assert ("expr", ("expr", "LOAD_CONST")) in p1.rule2name
+    assert ("expr", ("expr", "LOAD_CONST")) not in p2.rule2name
+    assert ("expr", ("expr", "LOAD_CONST")) not in get_python_parser(
+        PYTHON_VERSION, is_pypy=IS_PYPY
+    ).rule2name
+
+
+def test_grammar_tables_are_shared():
+    p1 = get_python_parser(PYTHON_VERSION, is_pypy=IS_PYPY)
+    p2 = get_python_parser(PYTHON_VERSION, is_pypy=IS_PYPY)
+    p1.prepare_grammar_tables()
+    p2.prepare_grammar_tables()
+    assert p1.states is p2.states
+    p2.addRule("expr ::= expr LOAD_CONST", nop_func)
+    p2.prepare_grammar_tables()
+    assert p1.states is not p2.states
+
+
+def test_grammar_tables_per_thread():
+    p1 = get_python_parser(PYTHON_VERSION, is_pypy=IS_PYPY)
+    p1.prepare_grammar_tables()
+    parsers = []
+
+    def prepare():
+        p2 = get_python_parser(PYTHON_VERSION, is_pypy=IS_PYPY)
+        p2.prepare_grammar_tables()
+        parsers.append(p2)
+
+    thread = threading.Thread(target=prepare)
+    thread.start()
+    thread.join()
+    assert p1.states is not parsers[0].states
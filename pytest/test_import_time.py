@@ -0,0 +1,107 @@
+import json, os, subprocess, sys
+
+import uncompyle6
+
+# Modules which only some options need, and which the command-line
+# programs and "import uncompyle6" shouldn't load up front.
+DEFERRED = (
+    "uncompyle6.cache",
+    "uncompyle6.pool",
+    "uncompyle6.semantics.fragments",
+    "uncompyle6.semantics.linemap",
+    "uncompyle6.verify",
+)
+
+# Packages that "import uncompyle6" and the decompiling command-line
+# program may not load any part of.
+HEAVY = ("uncompyle6.semantics", "uncompyle6.parsers", "uncompyle6.scanners")
+LIGHT_ENTRY_POINTS = ("uncompyle6", "uncompyle6.bin.uncompile", "uncompyle6.server")
+
+# What each entry point may load when it is imported, over those above.
+ENTRY_POINTS = {
+    "uncompyle6": ("uncompyle6.main", "uncompyle6.semantics.pysource"),
+    "uncompyle6.bin.uncompile": ("uncompyle6.main", "uncompyle6.semantics.pysource"),
+    "uncompyle6.bin.pydisassemble": (
+        "uncompyle6.main",
+        "uncompyle6.parser",
+        "uncompyle6.semantics.pysource",
+    ),
+    "uncompyle6.main": (),
+    "uncompyle6.server": ("uncompyle6.main", "uncompyle6.semantics.pysource"),
+}
+
+
+def run_python(args):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.dirname(os.path.dirname(uncompyle6.__file__))
+    proc = subprocess.Popen(
+        [sys.executable] + args,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    out, err = proc.communicate()
+    assert proc.returncode == 0, err
+    return out, err
+
+
+def imported_modules(module):
+    out, _ = run_python(
+        [
+            "-c",
+            "import json, sys; import %s; "
+            "print(json.dumps(sorted(sys.modules)))" % module,
+        ]
+    )
+    return set(json.loads(out))
+
+
+def test_deferred_imports():
+    for module, not_loaded in ENTRY_POINTS.items():
+        loaded = imported_modules(module)
+        assert module in loaded
+        for name in DEFERRED + not_loaded:
+            assert name not in loaded, "import %s loads %s" % (module, name)
+        if module in LIGHT_ENTRY_POINTS:
+            for name in loaded:
+                assert not name.startswith(HEAVY), "import %s loads %s" % (
+                    module,
+                    name,
+                )
+
+
+def test_import_time():
+    """
+    With -X importtime, which is in Python 3.7 and later, check that
+    starting the command-line program takes a good deal less than
+    loading the decompiler does.
+    """
+    if sys.version_info < (3, 7):
+        return
+    args = [
+        "-X",
+        "importtime",
+        "-c",
+        "import uncompyle6.bin.uncompile; import uncompyle6.main",
+    ]
+    # The first run may spend its time writing .pyc files.
+    run_python(args)
+    _, err = run_python(args)
+    # Lines are "import time: <self us> | <cumulative us> | <indented name>".
+    times = {}
+    for line in err.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:") :].split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    assert "uncompyle6.bin.uncompile" in times, err
+    assert "uncompyle6.main" in times, err
+    for name in DEFERRED:
+        assert name not in times
+    # uncompyle6.main is imported second, so what the two share is only
+    # counted against the command-line program.
+    assert 2 * times["uncompyle6.bin.uncompile"] < times["uncompyle6.main"], (
+        "import uncompyle6.bin.uncompile: %d us, uncompyle6.main: %d us"
+        % (times["uncompyle6.bin.uncompile"], times["uncompyle6.main"])
+    )
@@ -0,0 +1,71 @@
+import os.path
+
+from xdis.load import load_module
+
+from uncompyle6.semantics.pysource import code_deparse
+from uncompyle6.semantics.parallel import NestedParses, collect_code_objects
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+def get_srcdir():
+    filename = os.path.normcase(os.path.dirname(__file__))
+    return os.path.realpath(filename)
+
+
+src_dir = get_srcdir()
+os.chdir(src_dir)
+
+
+def test_collect_code_objects():
+    co = load_module("../test/bytecode_3.6/04_class_kwargs.pyc")[3]
+    codes = collect_code_objects(co)
+    assert codes[0][0] is co
+    classnames = dict((c[0].co_name, c[1]) for c in codes[1:])
+    # A class body and the methods inside it are scanned with the class name
+    assert classnames["TestABCWithInitSubclass"] == "TestABCWithInitSubclass"
+    assert classnames["test_works_with_init_subclass"] == "TestABCWithInitSubclass"
+    assert classnames["test_abstractmethod_integration"] is None
+    assert classnames["foo"] == "C"
+
+
+def test_nested_parses_same_output():
+    for path in (
+        "../test/bytecode_2.7/10_lambda.pyc",
+        "../test/bytecode_3.6/04_class_kwargs.pyc",
+        "../test/bytecode_3.6/05_36lambda.pyc",
+    ):
+        version, _, _, co, is_pypy = load_module(path)[:5]
+        serial = StringIO()
+        code_deparse(co, serial, version, is_pypy=is_pypy)
+        parallel = StringIO()
+        code_deparse(co, parallel, version, is_pypy=is_pypy, nested_procs=2)
+        assert parallel.getvalue() == serial.getvalue()
+
+
+def test_nested_parses_used(monkeypatch):
+    # Each code object is parsed once, in a worker, and the walker takes
+    # that tree.
+    entries = []
+    used = []
+    result, parse = NestedParses.result, NestedParses.parse
+
+    def recording_result(self, i):
+        entries.append(result(self, i))
+        return entries[-1]
+
+    def recording_parse(self, walker, tokens, customize, code):
+        ast = parse(self, walker, tokens, customize, code)
+        if ast is not None:
+            used.append(entries[-1] is not None and ast is entries[-1][3])
+        return ast
+
+    monkeypatch.setattr(NestedParses, "result", recording_result)
+    monkeypatch.setattr(NestedParses, "parse", recording_parse)
+    path = "../test/bytecode_3.6/04_class_kwargs.pyc"
+    version, _, _, co, is_pypy = load_module(path)[:5]
+    code_deparse(co, StringIO(), version, is_pypy=is_pypy, nested_procs=2)
+    assert used and all(used)
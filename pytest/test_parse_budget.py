@@ -0,0 +1,79 @@
+from uncompyle6 import PYTHON_VERSION, IS_PYPY
+from uncompyle6.main import main, status_msg
+from uncompyle6.parser import ParseBudget
+from uncompyle6.semantics.pysource import code_deparse
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+def make_source():
+    body = "\n".join(
+        "    if a > %d:\n        b = c(%d)\n    else:\n        b = d" % (i, i)
+        for i in range(100)
+    )
+    return (
+        "def small(a, b=2):\n    return a + b\n"
+        "def big(a, *args, **kw):\n" + body + "\n    return b\n"
+        "print(small(1))\n"
+    )
+
+
+def test_parse_budget():
+    co = compile(make_source(), "<test>", "exec")
+
+    out = StringIO()
+    deparsed = code_deparse(
+        co, out, PYTHON_VERSION, is_pypy=IS_PYPY, parse_budget=ParseBudget(items=1000)
+    )
+    assert deparsed.budget_overruns == ["big"]
+    text = out.getvalue()
+    assert "def small(a, b=2):\n    return a + b" in text
+    assert "def big(a, *args, **kw):\n    # Parse budget of 1000 Earley items" in text
+    assert "print(small(1))" in text
+    # What is left of "big" is still Python.
+    compile(text, "<deparsed>", "exec")
+
+    out = StringIO()
+    deparsed = code_deparse(co, out, PYTHON_VERSION, is_pypy=IS_PYPY)
+    assert deparsed.budget_overruns == []
+    assert "Parse budget" not in out.getvalue()
+
+
+def test_parse_budget_lambda():
+    body = " + ".join("(a if b > %d else c)" % i for i in range(100))
+    source = "f = lambda a, b, c: %s\nprint(f(1, 2, 3))\n" % body
+    co = compile(source, "<test>", "exec")
+
+    out = StringIO()
+    deparsed = code_deparse(
+        co, out, PYTHON_VERSION, is_pypy=IS_PYPY, parse_budget=ParseBudget(items=2000)
+    )
+    assert deparsed.budget_overruns == ["<lambda>"]
+    text = out.getvalue()
+    assert "f = lambda a, b, c: None\nprint(f(1, 2, 3))" in text
+    compile(text, "<deparsed>", "exec")
+
+
+def test_status_msg():
+    assert status_msg(False, 3, 2, 1, 0, False) == "decompiled 3 files: 2 okay, 1 failed"
+    assert (
+        status_msg(False, 3, 2, 1, 0, False, 1)
+        == "decompiled 3 files: 2 okay, 1 failed, 1 over parse budget"
+    )
+
+
+def test_main_over_budget(tmpdir):
+    # main() counts the files that went over, for status_msg().
+    source_file = tmpdir.join("big.py")
+    source_file.write(make_source())
+    result = main(
+        str(tmpdir),
+        str(tmpdir),
+        [],
+        [str(source_file)],
+        parse_budget=ParseBudget(items=1000),
+    )
+    assert result == (1, 1, 0, 0, 1)
@@ -0,0 +1,48 @@
+import os, time
+
+import uncompyle6.pool
+from uncompyle6.pool import pool_main
+
+
+def get_srcdir():
+    filename = os.path.normcase(os.path.dirname(__file__))
+    return os.path.realpath(filename)
+
+
+src_dir = get_srcdir()
+os.chdir(src_dir)
+
+
+def test_pool_main(tmpdir):
+    files = ["05_if.pyc", "05_ifelse.pyc", "10_lambda.pyc"]
+    totals = pool_main(
+        "../test/bytecode_2.7", str(tmpdir), files, numproc=2, max_worker_files=1
+    )
+    assert totals == (3, 3, 0, 0, 0)
+    for f in files:
+        assert tmpdir.join(f[:-1]).check()
+
+
+main = uncompyle6.pool.main
+
+
+def slow_or_crashing_main(in_base, out_base, files, *args, **kwargs):
+    if files == ["crash.pyc"]:
+        os._exit(3)
+    if files == ["slow.pyc"]:
+        time.sleep(60)
+    return main(in_base, out_base, files, *args, **kwargs)
+
+
+def test_pool_main_failures(tmpdir, monkeypatch):
+    # The workers are forked, so they pick up the patched main().
+    monkeypatch.setattr(uncompyle6.pool, "main", slow_or_crashing_main)
+    files = ["05_if.pyc", "crash.pyc", "slow.pyc", "05_ifelse.pyc"]
+    totals = pool_main(
+        "../test/bytecode_2.7", str(tmpdir), files, numproc=2, timeout=2
+    )
+    # The file that timed out and the one whose worker died are failures,
+    # and the rest are still decompiled.
+    assert totals == (4, 2, 2, 0, 0)
+    for f in ("05_if.pyc", "05_ifelse.pyc"):
+        assert tmpdir.join(f[:-1]).check()
@@ -0,0 +1,54 @@
+import json
+import os.path
+
+from uncompyle6.main import decompile_file, main
+from uncompyle6.profiling import Profile
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+def get_srcdir():
+    filename = os.path.normcase(os.path.dirname(__file__))
+    return os.path.realpath(filename)
+
+
+src_dir = get_srcdir()
+os.chdir(src_dir)
+
+
+def test_profile_decompile_file():
+    events = []
+    profile = Profile(hooks=[lambda event, phase, p: events.append((event, phase))])
+    decompile_file("../test/bytecode_2.7/05_if.pyc", StringIO(), profile=profile)
+
+    for phase in ("load", "ingest", "customize", "parse", "transform", "gen_source"):
+        assert phase in profile.times
+    for counter in ("tokens", "earley_items", "reduce_checks"):
+        assert profile.counts[counter] > 0
+    assert events[0] == ("enter", "load")
+    assert events[-1] == ("exit", "gen_source")
+    assert not profile.stack
+
+
+def test_profile_file(tmpdir):
+    profile_file = str(tmpdir.join("profile.jsonl"))
+    main(
+        "../test/bytecode_2.7",
+        str(tmpdir),
+        ["05_if.pyc", "10_lambda.pyc"],
+        [],
+        profile_file=profile_file,
+    )
+    with open(profile_file) as fp:
+        records = [json.loads(line) for line in fp]
+    assert [os.path.basename(r["file"]) for r in records] == [
+        "05_if.pyc",
+        "10_lambda.pyc",
+    ]
+    for record in records:
+        assert record["status"] == "ok"
+        assert record["counts"]["tokens"] > 0
+        assert record["times"]["parse"] > 0
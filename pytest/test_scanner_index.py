@@ -0,0 +1,120 @@
+from uncompyle6 import PYTHON_VERSION, IS_PYPY
+from uncompyle6.scanner import LinesIndex, OpcodeIndex, PrevOpIndex, get_scanner
+
+
+def test_lines_index():
+    # Line 1 covers offsets 0..3, line 2 offsets 4..9, line 5 the rest.
+    lines = LinesIndex([(0, 1), (4, 2), (4, 3), (10, 5)], 14)
+    assert len(lines) == 14
+    assert [tuple(lines[i]) for i in (0, 3, 4, 9, 10, 13)] == [
+        (1, 4),
+        (1, 4),
+        (3, 10),
+        (3, 10),
+        (5, 14),
+        (5, 14),
+    ]
+    assert lines[-1].l_no == 5 and lines[-1].next == 14
+    try:
+        lines[14]
+    except IndexError:
+        pass
+    else:
+        assert False, "expecting IndexError"
+
+
+def test_prev_op_index():
+    # Ops of sizes 1, 3, 3 and 1
+    prev_op = PrevOpIndex([0, 1, 4, 7], 9)
+    assert [prev_op[i] for i in range(9)] == [0, 0, 1, 1, 1, 4, 4, 4, 7]
+    prev_op[5] = 0
+    assert prev_op[5] == 0 and prev_op[6] == 4
+
+
+def test_scanner_indexes():
+    def f(a, b):
+        if a:
+            b = 1
+        return b
+
+    scan = get_scanner(PYTHON_VERSION, IS_PYPY)
+    scan.build_instructions(f.__code__)
+    code = scan.code
+    offsets = [inst.offset for inst in scan.insts]
+    for prev, offset in zip(offsets, offsets[1:]):
+        assert scan.prev_op[offset] == prev
+    linestarts = dict(scan.opc.findlinestarts(f.__code__))
+    for offset in offsets:
+        if offset in linestarts:
+            assert scan.lines[offset].l_no == linestarts[offset]
+    assert len(scan.lines) == len(code)
+
+
+def test_opcode_index():
+    # Ops 1 and 3 are jumps; 3 at offset 6 goes to 0 and at 9 to 4.
+    index = OpcodeIndex(
+        [(0, 1), (2, 2), (4, 1), (6, 3), (9, 3)], frozenset([1, 3]),
+        [(0, 8), (4, 8), (6, 0), (9, 4)],
+    )
+    assert index.is_start(6) and not index.is_start(5)
+    assert index.find(0, 9, [1, 3]) == [0, 4, 6]
+    assert index.find(1, 10, [2]) == [2]
+    assert index.find(0, 10, [1], 8) == [0, 4]
+    assert index.find(0, 10, [1, 2], 8) == [0, 2, 4]
+    assert index.closest(0, 10, [3], 3) == ([9], 1)
+    assert index.closest(0, 10, [1, 3], 2) == ([6, 9], 2)
+    assert index.closest(0, 9, [1, 3], 5) == ([0, 4], 3)
+    assert index.closest(0, 10, [1, 2], 4) is None
+
+
+def test_instr_helpers():
+    def f(a, b):
+        for x in a:
+            try:
+                while b:
+                    b = g(x)
+                    if b:
+                        break
+            except E:
+                continue
+        return b
+
+    scan = get_scanner(PYTHON_VERSION, IS_PYPY)
+    scan.ingest(f.__code__)
+    code = scan.code
+    opc = scan.opc
+    jumps = sorted(opc.JREL_OPS | opc.JABS_OPS)
+    offsets = [inst.offset for inst in scan.insts]
+    targets = sorted(set(scan.get_target(offset) for offset in offsets))
+    for start in offsets:
+        # What walking over the code from start gives.
+        ops = [(offset, code[offset]) for offset in scan.op_range(start, len(code))]
+        assert scan.all_instr(start, len(code), jumps) == [
+            offset for offset, op in ops if op in jumps
+        ]
+        for op in set(code[offset] for offset in offsets):
+            found = [offset for offset, op2 in ops if op2 == op]
+            assert scan.first_instr(start, len(code), op) == (found or [None])[0]
+            assert scan.last_instr(start, len(code), op) == (found or [None])[-1]
+        for target in targets:
+            found = [
+                offset
+                for offset, op in ops
+                if op in jumps and scan.get_target(offset) == target
+            ]
+            assert scan.inst_matches(start, len(code), jumps, target) == found
+            assert scan.first_instr(start, len(code), jumps, target) == (
+                found or [None]
+            )[0]
+            assert scan.last_instr(start, len(code), jumps, target) == (
+                found or [None]
+            )[-1]
+            closest = min(
+                [abs(scan.get_target(offset) - target) for offset, op in ops
+                 if op in jumps] or [None]
+            )
+            offset = scan.last_instr(start, len(code), jumps, target, False)
+            if closest is None:
+                assert offset is None
+            else:
+                assert abs(scan.get_target(offset) - target) == closest
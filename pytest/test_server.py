@@ -0,0 +1,105 @@
+import base64, os, subprocess, sys, threading, time
+
+import uncompyle6
+from uncompyle6.server import Client, ServerError, handle_request
+
+bytecode_dir = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "..", "test", "bytecode_2.7"
+)
+pyc = os.path.join(bytecode_dir, "05_if.pyc")
+
+
+def test_handle_request():
+    response = handle_request({"path": pyc})
+    assert response["status"] == "ok"
+    assert "if True:\n    b = False" in response["source"]
+    assert response["budget_overruns"] == []
+
+    # Bytecode can be sent instead of a path, and defaults filled in.
+    with open(pyc, "rb") as fp:
+        bytecode = base64.b64encode(fp.read()).decode("ascii")
+    response = handle_request({"bytecode": bytecode}, {"fragments": True})
+    assert response["status"] == "ok"
+    assert "if True:\n    b = False" in response["source"]
+    source = response["source"]
+    for name, offset, start, finish in response["fragments"]:
+        assert name == "<module>" and start <= finish <= len(source)
+    texts = [source[start:finish] for _, _, start, finish in response["fragments"]]
+    assert "True" in texts and "False" in texts
+
+    response = handle_request({"path": pyc, "linemaps": True})
+    assert "linemap" in response and "fragments" not in response
+
+    response = handle_request({"path": pyc, "colour": True})
+    assert response["status"] == "failed" and "colour" in response["error"]
+    response = handle_request({"path": os.path.join(bytecode_dir, "missing.pyc")})
+    assert response["status"] == "failed"
+
+
+def connect(socket_path, server):
+    for i in range(100):
+        try:
+            return Client(socket_path)
+        except ServerError:
+            assert server.poll() is None, server.communicate()
+            time.sleep(0.1)
+    raise AssertionError("server didn't start")
+
+
+def test_serve(tmpdir):
+    socket_path = str(tmpdir.join("u6.sock"))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.dirname(os.path.dirname(uncompyle6.__file__))
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uncompyle6.bin.uncompile",
+            "--serve",
+            socket_path,
+            "-p",
+            "2",
+            "--worker-files",
+            "1",
+            "--warm",
+            "2.7",
+        ],
+        env=env,
+        stderr=subprocess.PIPE,
+    )
+    try:
+        # Workers are replaced after each request, and serve clients
+        # at the same time.
+        responses = []
+
+        def decompile():
+            with connect(socket_path, server) as client:
+                responses.append(client.decompile(pyc))
+
+        threads = [threading.Thread(target=decompile) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(responses) == 4
+        for response in responses:
+            assert response["status"] == "ok"
+            assert "if True:\n    b = False" in response["source"]
+
+        with connect(socket_path, server) as client:
+            response = client.decompile(pyc, verify="weak", parse_items=100000)
+            assert response["status"] in ("ok", "verify failed")
+            assert "if True:\n    b = False" in response["source"]
+
+        # A second server isn't started on the same socket.
+        second = subprocess.Popen(
+            [sys.executable, "-m", "uncompyle6.bin.uncompile", "--serve", socket_path],
+            env=env,
+            stderr=subprocess.PIPE,
+        )
+        _, err = second.communicate()
+        assert second.returncode != 0 and b"already listening" in err
+    finally:
+        server.terminate()
+        server.communicate()
+    assert not os.path.exists(socket_path)
@@ -0,0 +1,51 @@
+import threading
+
+from uncompyle6 import PYTHON_VERSION, IS_PYPY
+from uncompyle6.scanner import Token, get_scanner, shared_scanner
+from uncompyle6.semantics.pysource import code_deparse
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+def test_shared_scanner():
+    scanner = shared_scanner(PYTHON_VERSION, IS_PYPY)
+    assert scanner is shared_scanner(PYTHON_VERSION, IS_PYPY, show_asm="after")
+    assert scanner.show_asm == "after"
+    assert scanner is not get_scanner(PYTHON_VERSION, IS_PYPY)
+
+    # What was worked out for the last code object is dropped.
+    scanner.ingest(test_shared_scanner.__code__)
+    scanner.setTokenClass(dict)
+    assert scanner.insts
+    scanner = shared_scanner(PYTHON_VERSION, IS_PYPY)
+    assert not hasattr(scanner, "insts")
+    assert scanner.Token is Token and scanner.show_asm is None
+
+    # Each thread gets a scanner of its own.
+    other = []
+    thread = threading.Thread(
+        target=lambda: other.append(shared_scanner(PYTHON_VERSION, IS_PYPY))
+    )
+    thread.start()
+    thread.join()
+    assert other[0] is not scanner
+
+
+def test_shared_scanner_deparse():
+    def deparse(co):
+        out = StringIO()
+        code_deparse(co, out, PYTHON_VERSION, is_pypy=IS_PYPY)
+        return out.getvalue()
+
+    co1 = compile(
+        "for x in y:\n    try:\n        f(x)\n    except E:\n        break\n",
+        "<1>",
+        "exec",
+    )
+    co2 = compile("if a:\n    b = [c for c in d]\nelse:\n    e()\n", "<2>", "exec")
+    first = deparse(co1), deparse(co2)
+    assert (deparse(co1), deparse(co2)) == first
+    assert "except E:" in first[0] and "else:" in first[1]
@@ -0,0 +1,55 @@
+from uncompyle6 import PYTHON_VERSION, IS_PYPY
+import uncompyle6.parser as parser
+from uncompyle6.parser import get_python_parser
+from uncompyle6.scanner import get_scanner
+
+
+def build_tree(co, segment_min):
+    scanner = get_scanner(PYTHON_VERSION, IS_PYPY)
+    tokens, customize = scanner.ingest(co)
+    p = get_python_parser(PYTHON_VERSION, is_pypy=IS_PYPY)
+    p.insts = scanner.insts
+    p.offset2inst_index = scanner.offset2inst_index
+    p.split_offsets = scanner.split_offsets
+    p.customize_grammar_rules(tokens, customize)
+    saved = parser.PARSE_SEGMENT_MIN
+    try:
+        parser.PARSE_SEGMENT_MIN = segment_min
+        return scanner, p, tokens, p.parse(tokens)
+    finally:
+        parser.PARSE_SEGMENT_MIN = saved
+
+
+def test_split_tokens():
+    source = "y = 0\n" + "\n".join(
+        "if x%d:\n    g(x%d)\ny = f(a, b[%d]) + y\nz = y" % (i, i, i)
+        for i in range(40)
+    )
+    co = compile(source, "<test>", "exec")
+    scanner, p, tokens, tree = build_tree(co, 50)
+
+    # Pieces start at "z = y": not inside an "if", not where the "if"
+    # jumps to, and not at an "if" itself.
+    assert scanner.split_offsets
+    for inst in scanner.insts:
+        if inst.offset in scanner.split_offsets:
+            assert inst.starts_line % 4 == 1
+
+    saved = parser.PARSE_SEGMENT_MIN
+    try:
+        parser.PARSE_SEGMENT_MIN = 50
+        segments = p.split_tokens(tokens)
+    finally:
+        parser.PARSE_SEGMENT_MIN = saved
+    assert len(segments) > 1
+    assert sum(len(segment) for segment in segments) == len(tokens)
+    assert all(len(segment) >= 50 for segment in segments)
+
+    # The parse tree is the one we get parsing the tokens in one go.
+    assert str(tree) == str(build_tree(co, len(tokens))[3])
+
+
+def test_split_tokens_short():
+    co = compile("x = 1\ny = 2\n", "<test>", "exec")
+    scanner, p, tokens, tree = build_tree(co, 1)
+    assert p.split_tokens(tokens) == [tokens]
@@ -0,0 +1,88 @@
+import os.path
+
+from xdis.load import load_module
+
+from uncompyle6.semantics.pysource import OutputBuffer, code_deparse
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+def get_srcdir():
+    filename = os.path.normcase(os.path.dirname(__file__))
+    return os.path.realpath(filename)
+
+
+src_dir = get_srcdir()
+os.chdir(src_dir)
+
+
+class CountingStream(StringIO):
+    def __init__(self):
+        StringIO.__init__(self)
+        self.writes = 0
+
+    def write(self, s):
+        self.writes += 1
+        return StringIO.write(self, s)
+
+
+def test_stream_same_output():
+    for path in (
+        "../test/bytecode_2.7/02_def.pyc",
+        "../test/bytecode_2.7/10_classdec.pyc",
+        "../test/bytecode_3.6/04_class_kwargs.pyc",
+        "../test/bytecode_3.8/02_while_and.pyc",
+    ):
+        version, _, _, co, is_pypy = load_module(path)[:5]
+        buffered = StringIO()
+        code_deparse(co, buffered, version, is_pypy=is_pypy)
+        streamed = CountingStream()
+        deparsed = code_deparse(co, streamed, version, is_pypy=is_pypy, stream=True)
+        assert streamed.getvalue() == buffered.getvalue()
+        # Each statement was written out separately and then dropped.
+        assert streamed.writes > 1
+        assert len(deparsed.ast) == 0
+
+
+def test_output_buffer():
+    out = OutputBuffer()
+    for s in ("def ", "", "f(a,\n", "  b", "):"):
+        out.write(s)
+    assert out.tell() == len("def f(a,\n  b):")
+    assert out.tail(2) == "):"
+    assert out.tail(4) == " b):"
+    assert out.tail(100) == "def f(a,\n  b):"
+    assert out.last_line() == "  b):"
+    assert out.getvalue() == "def f(a,\n  b):"
+    out.write("\n")
+    assert out.last_line() == ""
+    assert out.getvalue() == "def f(a,\n  b):\n"
+
+
+def test_nested_text_joined_once(monkeypatch):
+    # Ten functions, each nested in the one before.
+    source = ""
+    for i in range(10):
+        source += "    " * i + "def f%d(a):\n" % i
+        source += "    " * (i + 1) + "b = a + %d\n" % i
+    source += "    " * 10 + "return b\n"
+    co = compile(source, "<nested>", "exec")
+
+    joined = []
+    getvalue = OutputBuffer.getvalue
+
+    def counting_getvalue(self):
+        text = getvalue(self)
+        joined.append(len(text))
+        return text
+
+    monkeypatch.setattr(OutputBuffer, "getvalue", counting_getvalue)
+    out = StringIO()
+    deparsed = code_deparse(co, out)
+    assert "def f9(a):" in deparsed.text
+    # The text of each function is added to the one around it without
+    # being joined, so it isn't copied once per level of nesting.
+    assert sum(joined) < 2 * len(out.getvalue())
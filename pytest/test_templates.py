@@ -0,0 +1,57 @@
+from uncompyle6 import PYTHON_VERSION, IS_PYPY
+from uncompyle6.semantics.consts import compile_template
+from uncompyle6.semantics.pysource import Steps, code_deparse, skip_node
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+def test_compile_template():
+    escapes, tail = compile_template("%|if %c:\n%+%[1]{pattr}%-")
+    assert tail == ""
+    assert [e[:3] for e in escapes] == [
+        ("", None, "|"),
+        ("if ", None, "c"),
+        (":\n", None, "+"),
+        ("", 1, "{"),
+        ("", None, "-"),
+    ]
+    expr, code = escapes[3][3:]
+    assert expr == "pattr"
+    assert eval(code, {"pattr": "x"}) == "x"
+
+    # Format strings are only decoded once
+    assert compile_template("%|if %c:\n%+%[1]{pattr}%-") == (escapes, tail)
+    assert compile_template("%|if %c:\n%+%[1]{pattr}%-")[0] is escapes
+
+    escapes, tail = compile_template("%c(%P)")
+    assert [e[:3] for e in escapes] == [("", None, "c"), ("(", None, "P")]
+    assert tail == ")"
+
+
+def test_dispatch():
+    co = compile("x = 1\n", "<test>", "exec")
+    deparsed = code_deparse(co, StringIO(), PYTHON_VERSION, is_pypy=IS_PYPY)
+    dispatch = deparsed.dispatch
+    # Expressions are walked by preorder() itself
+    assert isinstance(dispatch["expr"], Steps)
+    assert dispatch["expr"].steps == deparsed.expr_steps
+    assert dispatch["assign"] == deparsed.n_assign
+    # "stmt" templates depend on the child so these go through default()
+    assert dispatch["stmt"].steps == deparsed.default_steps
+    assert dispatch["no_such_kind"] is skip_node
+
+    # Fixed templates are run directly
+    assert "n_BINARY_ADD" not in dir(deparsed)
+    assert dispatch["BINARY_ADD"] is deparsed.TABLE_DIRECT["BINARY_ADD"]
+
+
+def test_long_chain():
+    # Each term nests another bin_op, expr and template in the tree.
+    source = "x = " + " + ".join("a%d" % i for i in range(5000)) + "\n"
+    co = compile(source, "<test>", "exec")
+    out = StringIO()
+    code_deparse(co, out, PYTHON_VERSION, is_pypy=IS_PYPY)
+    assert out.getvalue().strip().endswith(source.strip())
@@ -20,5 +20,30 @@ def test_token():
     assert t.format().strip() == expect.strip()
 
 
+def test_token_offsets():
+    # An instruction with an EXTENDED_ARG shows both of its offsets
+    t = Token("JUMP_ABSOLUTE", offset=10, attr=300, pattr="300",
+              has_arg=True, has_extended_arg=True)
+    assert t.offset == "10_12"
+    assert t.text_offset
+    assert t.off2int() == 12
+    assert t.off2int(prefer_last=False) == 10
+
+    # For COME_FROMs the second number is a count, not an offset
+    t = Token("COME_FROM", 4, "4", offset=20, offset2=0, has_arg=True)
+    assert t.offset == "20_0"
+    assert t.off2int() == t.off2int(prefer_last=False) == 20
+
+    # Offsets given as strings are the same as ones given as numbers
+    t2 = Token("COME_FROM", 4, "4", offset="20_0", has_arg=True)
+    assert (t2._offset, t2._offset2) == (20, 0)
+    t2.offset = 22
+    assert t2.offset == 22 and not t2.text_offset
+
+    assert not hasattr(t, "__dict__")
+    assert t.attrs()["offset"] == "20_0"
+
+
 if __name__ == "__main__":
     test_token()
+    test_token_offsets()
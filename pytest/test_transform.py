@@ -0,0 +1,88 @@
+import sys
+
+from uncompyle6 import PYTHON_VERSION
+from uncompyle6.parsers.treenode import SyntaxTree
+from uncompyle6.scanners.tok import Token
+from uncompyle6.semantics.check_ast import checker
+from uncompyle6.semantics.helper import find_globals_and_nonlocals
+from uncompyle6.semantics.transform import TreeTransform
+
+
+def make_tree():
+    def stmt(kind, *kids):
+        return SyntaxTree("stmt", [SyntaxTree(kind, list(kids))])
+
+    return SyntaxTree(
+        "stmts",
+        [
+            stmt("continue", Token("CONTINUE", offset=0)),
+            stmt(
+                "while1stmt",
+                Token("SETUP_LOOP", offset=2),
+                SyntaxTree(
+                    "l_stmts",
+                    [
+                        stmt("break", Token("BREAK_LOOP", offset=4)),
+                        stmt(
+                            "assign",
+                            SyntaxTree("expr", [Token("LOAD_GLOBAL", pattr="g", offset=6)]),
+                            SyntaxTree("store", [Token("STORE_GLOBAL", pattr="h", offset=8)]),
+                        ),
+                    ],
+                ),
+            ),
+            stmt(
+                "aug_assign1",
+                SyntaxTree("expr", [SyntaxTree("and", [Token("LOAD_NAME", offset=10)])]),
+                Token("INPLACE_ADD", offset=12),
+            ),
+        ],
+    )
+
+
+def test_transform_checks():
+    # Checks done while transforming match the separate checker pass.
+    expect = []
+    checker(make_tree(), False, expect)
+    assert len(expect) == 2
+    assert expect[0].startswith("\n# not in loop:")
+    assert expect[1].startswith("\n# improper augmented assigment")
+
+    def co():
+        pass
+
+    errors = []
+    ast = TreeTransform(PYTHON_VERSION).transform(make_tree(), co.__code__, errors)
+    assert errors == expect
+
+    # The global names were picked up along the way.
+    assert [t.pattr for t in ast.name_tokens] == ["g", "h"]
+    assert find_globals_and_nonlocals(
+        ast, set(), set(), co.__code__, PYTHON_VERSION
+    ) == ({"h"}, set())
+
+
+def test_deep_tree():
+    depth = sys.getrecursionlimit() + 100
+    ast = leaf = Token("LOAD_NAME", pattr="x", offset=0)
+    for i in range(depth):
+        ast = SyntaxTree("expr", [ast])
+    ast = SyntaxTree("stmts", [SyntaxTree("stmt", [ast])])
+
+    assert ast.first_child() is leaf
+    assert ast.last_child() is leaf
+    lines = repr(ast).split("\n")
+    assert len(lines) == depth + 3
+    assert lines[-1].startswith("    " * (depth + 2))
+    assert lines[-1].split() == ["0", "LOAD_NAME"]
+
+    errors = []
+    checker(ast, False, errors)
+    assert errors == []
+
+    def co():
+        pass
+
+    ast = TreeTransform(PYTHON_VERSION).transform(ast, co.__code__, errors)
+    assert ast.first_child() is leaf
+    assert errors == []
@@ -0,0 +1,64 @@
+import os.path
+
+from xdis.load import load_module
+
+from uncompyle6.semantics.customize import version_tables
+from uncompyle6.semantics.pysource import code_deparse
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+def get_srcdir():
+    filename = os.path.normcase(os.path.dirname(__file__))
+    return os.path.realpath(filename)
+
+
+src_dir = get_srcdir()
+os.chdir(src_dir)
+
+
+def deparse(path):
+    version, _, _, co, is_pypy = load_module(path)[:5]
+    out = StringIO()
+    code_deparse(co, out, version, is_pypy=is_pypy)
+    return out.getvalue()
+
+
+def test_mixed_versions():
+    # Python 2.1 and 3.x have their own templates for "import a, b".
+    # These mustn't be used when deparsing 2.7 later on.
+    path = "../test/bytecode_2.7/00_import.pyc"
+    expect = deparse(path)
+    for other in (
+        "../test/bytecode_2.1/00_import.pyc",
+        "../test/bytecode_3.8/02_while_and.pyc",
+        "../test/bytecode_3.6/04_class_kwargs.pyc",
+    ):
+        deparse(other)
+        assert deparse(path) == expect
+    assert "import time as time1, os as os1, http.client" in expect
+
+
+def test_tables_read_only():
+    tables = version_tables(2.7, False)
+    assert version_tables(2.7, False) is tables
+    table_direct, table_r, table_r0, precedence = tables
+    assert "raise_stmt2" in table_direct
+    assert "call_kw" not in precedence
+    assert version_tables(3.7, False)[3]["call_kw"] == 0
+    for table in tables:
+        try:
+            table["foo"] = ("%c", 0)
+        except TypeError:
+            pass
+        else:
+            assert False, "expecting TypeError"
+    try:
+        table_direct.update({"foo": ("%c", 0)})
+    except TypeError:
+        pass
+    else:
+        assert False, "expecting TypeError"
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# emacs-mode: -*-python-*-
+
+"""
+benchmark.py -- time decompilation of the bundled bytecode corpora
+
+Each test/bytecode_* directory is decompiled in its own process. For
+each one we report the time spent in each phase of decompilation, files
+per second and peak resident memory. Phases are:
+
+  load        reading the bytecode file with xdis
+  ingest      turning code objects into tokens (scanner.ingest)
+  customize   adding grammar rules for the tokens (customize_grammar_rules)
+  parse       Earley parsing
+  transform   TreeTransform.transform
+  gen_source  source generation, not counting the phases above for
+              nested code objects
+  other       everything else, e.g. grammar checks and finding globals
+
+The results also have the counts kept by uncompyle6.profiling: tokens,
+grammar rules added, Earley items and reduce checks.
+
+Usage-Examples:
+
+  # benchmark all corpora and save the results
+  benchmark.py --output bench.json
+
+  # benchmark a couple of corpora and compare against saved results
+  benchmark.py --baseline bench.json 2.7 3.6 3.8
+
+  # same, but only complain about slowdowns of more than 25%
+  benchmark.py --baseline bench.json --threshold 25 2.7
+
+Arguments are bytecode directory names under test or just the version
+part of the name, e.g. "2.7", "pypy3.6" or "3.6_run". Without any
+arguments all test/bytecode_* directories are used.
+
+The exit status is 1 if any phase is slower, or files per second is
+lower, than the baseline by more than the threshold percentage.
+"""
+
+from __future__ import print_function
+
+import getopt, glob, json, os, sys, time
+
+from xdis.load import load_module
+
+from uncompyle6 import PYTHON3
+from uncompyle6.profiling import Profile, clock
+from uncompyle6.semantics.pysource import code_deparse
+from uncompyle6.version import __version__
+
+if PYTHON3:
+    from io import StringIO
+else:
+    from StringIO import StringIO
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def get_srcdir():
+    filename = os.path.normcase(os.path.dirname(__file__))
+    return os.path.realpath(filename)
+
+
+src_dir = get_srcdir()
+
+PHASES = ("load", "ingest", "customize", "parse", "transform", "gen_source", "other")
+
+# Slowdown, in percent, that counts as a regression
+DEFAULT_THRESHOLD = 10.0
+
+# Changes in phase times smaller than this many seconds are noise
+NOISE_SECONDS = 0.05
+
+
+# Where the finer-grained phases of uncompyle6.profiling are reported
+PHASE_OF = {
+    "find_jump_targets": "ingest",
+    "detect_control_flow": "ingest",
+    "reduce_checks": "parse",
+}
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # macOS reports bytes rather than kilobytes
+        rss //= 1024
+    return rss
+
+
+def corpus_files(corpus):
+    files = []
+    for pattern in ("*.pyc", "*.pyo"):
+        files.extend(glob.glob(os.path.join(src_dir, corpus, pattern)))
+    return sorted(files)
+
+
+def run_corpus(corpus):
+    """Decompile every file in `corpus` and return its results."""
+    profile = Profile()
+    files = corpus_files(corpus)
+    failed = 0
+    start = clock()
+    for path in files:
+        profile.enter("other")
+        try:
+            with profile.phase("load"):
+                version, _, _, co, is_pypy = load_module(path, {})[:5]
+            code_deparse(co, StringIO(), version, is_pypy=is_pypy, profile=profile)
+        except KeyboardInterrupt:
+            raise
+        except Exception:
+            failed += 1
+        finally:
+            profile.exit()
+    seconds = clock() - start
+
+    phases = dict((phase, 0.0) for phase in PHASES)
+    for name, t in profile.times.items():
+        phase = PHASE_OF.get(name, name)
+        if phase not in phases:
+            phase = "other"
+        phases[phase] += t
+    return {
+        "files": len(files),
+        "failed": failed,
+        "seconds": seconds,
+        "files_per_sec": len(files) / seconds if seconds else 0.0,
+        "peak_rss_kb": peak_rss_kb(),
+        "phases": phases,
+        "counts": profile.counts,
+    }
+
+
+def _run_corpus_child(corpus, queue):
+    queue.put(run_corpus(corpus))
+
+
+def run_corpus_in_child(corpus):
+    """Run a corpus in its own process, so that the memory high-water
+    mark of one corpus doesn't affect the next."""
+    from multiprocessing import Process, Queue
+
+    queue = Queue()
+    child = Process(target=_run_corpus_child, args=(corpus, queue))
+    child.start()
+    result = queue.get()
+    child.join()
+    return result
+
+
+def compare(results, baseline, threshold):
+    """Print how `results` differ from `baseline` and return the number
+    of regressions beyond `threshold` percent."""
+    regressions = 0
+    limit = 1 + threshold / 100.0
+    for corpus in sorted(results["corpora"]):
+        if corpus not in baseline["corpora"]:
+            continue
+        now = results["corpora"][corpus]
+        then = baseline["corpora"][corpus]
+        rows = [("files/sec", then["files_per_sec"], now["files_per_sec"], True)]
+        for phase in PHASES:
+            rows.append((phase, then["phases"][phase], now["phases"][phase], False))
+        print("%s:" % corpus)
+        for name, old, new, higher_is_better in rows:
+            if old:
+                change = "%+7.1f%%" % ((new - old) * 100.0 / old)
+            else:
+                change = "    n/a "
+            if higher_is_better:
+                worse = new * limit < old
+            else:
+                worse = new > old * limit and new - old > NOISE_SECONDS
+            mark = ""
+            if worse:
+                regressions += 1
+                mark = "  <-- regression"
+            print("  %-12s %10.3f %10.3f %s%s" % (name, old, new, change, mark))
+    return regressions
+
+
+def print_results(results):
+    print("%-22s %6s %6s %8s %9s %9s" % ("corpus", "files", "failed", "seconds",
+                                         "files/sec", "peak RSS"))
+    for corpus in sorted(results["corpora"]):
+        r = results["corpora"][corpus]
+        rss = "%dK" % r["peak_rss_kb"] if r["peak_rss_kb"] is not None else "?"
+        print("%-22s %6d %6d %8.2f %9.1f %9s" % (corpus, r["files"], r["failed"],
+                                                r["seconds"], r["files_per_sec"], rss))
+        print("    " + "  ".join("%s %.2f" % (phase, r["phases"][phase])
+                                 for phase in PHASES))
+
+
+def usage():
+    print(__doc__)
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(
+            sys.argv[1:], "ho:", ["help", "output=", "baseline=", "threshold="]
+        )
+    except getopt.GetoptError as e:
+        print("%s: %s" % (os.path.basename(sys.argv[0]), e), file=sys.stderr)
+        sys.exit(2)
+
+    output = baseline_path = None
+    threshold = DEFAULT_THRESHOLD
+    for opt, val in opts:
+        if opt in ("-h", "--help"):
+            usage()
+        elif opt in ("-o", "--output"):
+            output = val
+        elif opt == "--baseline":
+            baseline_path = val
+        elif opt == "--threshold":
+            threshold = float(val)
+
+    if args:
+        corpora = []
+        for arg in args:
+            if not arg.startswith("bytecode_"):
+                arg = "bytecode_" + arg
+            if not os.path.isdir(os.path.join(src_dir, arg)):
+                print("No bytecode directory %s" % arg, file=sys.stderr)
+                sys.exit(2)
+            corpora.append(arg)
+    else:
+        corpora = sorted(
+            os.path.basename(d)
+            for d in glob.glob(os.path.join(src_dir, "bytecode_*"))
+            if os.path.isdir(d)
+        )
+
+    results = {
+        "uncompyle6": __version__,
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "corpora": {},
+    }
+    for corpus in corpora:
+        if not corpus_files(corpus):
+            continue
+        results["corpora"][corpus] = run_corpus_in_child(corpus)
+
+    print_results(results)
+
+    if output:
+        with open(output, "w") as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+        print("Results written to %s" % output)
+
+    if baseline_path:
+        with open(baseline_path) as fp:
+            baseline = json.load(fp)
+        print("\nCompared with %s (uncompyle6 %s, Python %s):"
+              % (baseline_path, baseline.get("uncompyle6"), baseline.get("python")))
+        if compare(results, baseline, threshold):
+            sys.exit(1)
@@ -145,7 +145,7 @@ def do_tests(
             files = files[:max_files]
 
     print(time.ctime())
-    (tot_files, okay_files, failed_files, verify_failed_files) = main.main(
+    (tot_files, okay_files, failed_files, verify_failed_files, _) = main.main(
         src_dir, target_dir, files, [], do_verify=do_verify
     )
     print(time.ctime())
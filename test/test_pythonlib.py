@@ -200,7 +200,7 @@ def do_tests(src_dir, obj_patterns, target_dir, opts):
     print("Source directory: ", src_dir)
     print("Output directory: ", target_dir)
     try:
-        _, _, failed_files, failed_verify = main(
+        _, _, failed_files, failed_verify, _ = main(
             src_dir, target_dir, files, [], do_verify=opts["do_verify"]
         )
         if failed_files != 0:
@@ -47,14 +47,32 @@ if hasattr(sys, "setrecursionlimit"):
     # pyston doesn't have setrecursionlimit
     sys.setrecursionlimit(5000)
 
-import uncompyle6.semantics.pysource
-import uncompyle6.semantics.fragments
+# The functions below are exported here, but what they need is only
+# imported when they are first called: the command-line programs and
+# "import uncompyle6" shouldn't pay for deparsing machinery (fragments,
+# line maps, verification) that they may never use.
+
+
+def decompile_file(*args, **kwargs):
+    """See uncompyle6.main.decompile_file()."""
+    from uncompyle6.main import decompile_file
+
+    return decompile_file(*args, **kwargs)
 
-# Export some functions
-from uncompyle6.main import decompile_file
 
 # Convenience functions so you can say:
 # from uncompyle6 import (code_deparse, deparse_code2str)
 
-deparse_code2str = uncompyle6.semantics.pysource.deparse_code2str
-code_deparse = uncompyle6.semantics.pysource.code_deparse
+
+def deparse_code2str(*args, **kwargs):
+    """See uncompyle6.semantics.pysource.deparse_code2str()."""
+    from uncompyle6.semantics.pysource import deparse_code2str
+
+    return deparse_code2str(*args, **kwargs)
+
+
+def code_deparse(*args, **kwargs):
+    """See uncompyle6.semantics.pysource.code_deparse()."""
+    from uncompyle6.semantics.pysource import code_deparse
+
+    return code_deparse(*args, **kwargs)
@@ -12,12 +12,16 @@ program = 'uncompyle6'
 __doc__ = """
 Usage:
   %s [OPTIONS]... [ FILE | DIR]...
+  %s --serve <socket> [OPTIONS]...
+  %s --connect <socket> [OPTIONS]... [ FILE | DIR]...
   %s [--help | -h | --V | --version]
 
 Examples:
   %s      foo.pyc bar.pyc       # decompile foo.pyc, bar.pyc to stdout
   %s -o . foo.pyc bar.pyc       # decompile to ./foo.pyc_dis and ./bar.pyc_dis
   %s -o /tmp /usr/lib/python1.5 # decompile whole library
+  %s --serve /tmp/u6.sock -p 4 --warm 2.7,3.8 # start a server
+  %s --connect /tmp/u6.sock foo.pyc # decompile foo.pyc using it
 
 Options:
   -o <path>     output decompiled files to this path:
@@ -34,6 +38,29 @@ Options:
                 attempts a decompilation after compiling <python-file>
   -d            print timestamps
   -p <integer>  use <integer> number of processes
+  --timeout <seconds>
+                with -p, count a file as failed if it takes longer
+                than <seconds> to decompile
+  --worker-files <integer>
+                with -p, replace a worker process after it has
+                decompiled <integer> files
+  --profile <path>
+                append a line of JSON with the time spent in each phase
+                of decompilation and counts of tokens, grammar rules,
+                Earley items and reduce checks for each file to <path>
+  --nested-procs <integer>
+                parse the functions, classes and comprehensions inside
+                each file using <integer> processes
+  --stream      write out the source for each top-level statement as soon
+                as it has been generated, rather than a whole file at a time
+  --parse-items <integer>
+                give up parsing a function or class once the parser has
+                made <integer> Earley items for it, and write it out as
+                disassembly in comments instead
+  --parse-seconds <seconds>
+                like --parse-items, but give up after <seconds> seconds
+  --fast-path   build the parse trees of simple statements outside of any
+                control flow directly, leaving less to the Earley parser
   -r            recurse directories looking for .pyc and .pyo files
   --fragments   use fragments deparser
   --verify      compare generated source with input byte-code
@@ -43,6 +70,27 @@ Options:
                 and generated source output
   --encoding  <encoding>
                 use <encoding> in generated source according to pep-0263
+  --cache       reuse results saved from earlier runs on the same bytecode,
+                and save new ones
+  --cache-dir <path>
+                keep cached results in <path> (implies --cache)
+  --cache-size <integer>
+                keep at most <integer> megabytes of cached results
+  --serve <socket>
+                answer decompilation requests on Unix domain socket
+                <socket> until interrupted, with -p worker processes
+                (one per CPU by default). --timeout applies to each
+                request, and --worker-files replaces a worker after it
+                has answered that many requests. The options below up to
+                --cache-size are the defaults for requests
+  --warm <versions>
+                with --serve, build the grammars for these comma-separated
+                bytecode versions before taking requests
+  --connect <socket>
+                have the server listening on <socket> decompile the files
+                given, with --fragments, --verify, --verify-run,
+                --syntax-verify, --linemaps, --encoding, --parse-items,
+                --parse-seconds and --fast-path passed on to it
   --help        show this message
 
 Debugging Options:
@@ -57,12 +105,10 @@ Extensions of generated files:
   '.pyc_dis' '.pyo_dis'   successfully decompiled (and verified if --verify)
     + '_unverified'       successfully decompile but --verify failed
     + '_failed'           decompile failed (contact author for enhancement)
-""" % ((program,) * 5)
+""" % ((program,) * 9)
 
 program = 'uncompyle6'
 
-from uncompyle6 import verify
-from uncompyle6.main import main, status_msg
 from uncompyle6.version import __version__
 
 def usage():
@@ -82,18 +128,25 @@ def main_bin():
 
     do_verify = recurse_dirs = False
     numproc = 0
+    timeout = max_worker_files = None
+    parse_items = parse_seconds = None
     outfile = '-'
     out_base = None
     source_paths = []
     timestamp = False
     timestampfmt = "# %Y.%m.%d %H:%M:%S %Z"
+    serve_socket = connect_socket = None
+    warm_versions = []
 
     try:
         opts, pyc_paths = getopt.getopt(sys.argv[1:], 'hac:gtTdrVo:p:',
                                     'help asm compile= grammar linemaps recurse '
                                     'timestamp tree= tree+ '
                                     'fragments verify verify-run version '
-                                    'syntax-verify '
+                                    'syntax-verify cache cache-dir= cache-size= '
+                                    'timeout= worker-files= nested-procs= profile= stream '
+                                    'parse-items= parse-seconds= fast-path '
+                                    'serve= warm= connect= '
                                     'showgrammar encoding='.split(' '))
     except getopt.GetoptError as e:
         print('%s: %s' % (os.path.basename(sys.argv[0]), e),  file=sys.stderr)
@@ -145,14 +198,70 @@ def main_bin():
             source_paths.append(val)
         elif opt == '-p':
             numproc = int(val)
+        elif opt == '--timeout':
+            timeout = float(val)
+        elif opt == '--worker-files':
+            max_worker_files = int(val)
+        elif opt == '--nested-procs':
+            options['nested_procs'] = int(val)
+        elif opt == '--profile':
+            options['profile_file'] = val
+        elif opt == '--stream':
+            options['stream'] = True
+        elif opt == '--parse-items':
+            parse_items = int(val)
+        elif opt == '--parse-seconds':
+            parse_seconds = float(val)
+        elif opt == '--fast-path':
+            options['fast_path'] = True
         elif opt in ('--recurse', '-r'):
             recurse_dirs = True
         elif opt == '--encoding':
             options['source_encoding'] = val
+        elif opt == '--cache':
+            from uncompyle6.cache import DEFAULT_CACHE_DIR
+            options.setdefault('cache_dir', DEFAULT_CACHE_DIR)
+        elif opt == '--cache-dir':
+            options['cache_dir'] = val
+        elif opt == '--cache-size':
+            options['cache_size'] = int(val) * 1024 * 1024
+        elif opt == '--serve':
+            serve_socket = val
+        elif opt == '--warm':
+            warm_versions = [float(v) for v in val.split(',')]
+        elif opt == '--connect':
+            connect_socket = val
         else:
             print(opt, file=sys.stderr)
             usage()
 
+    if not connect_socket and (parse_items is not None or
+                               parse_seconds is not None):
+        from uncompyle6.parser import ParseBudget
+        options['parse_budget'] = ParseBudget(parse_items, parse_seconds)
+
+    if serve_socket:
+        from uncompyle6.server import ServerError, serve
+        server_options = dict((k, v) for k, v in options.items()
+                              if k in ('do_fragments', 'do_linemaps', 'do_verify',
+                                       'source_encoding', 'parse_budget',
+                                       'fast_path',
+                                       'cache_dir', 'cache_size'))
+        try:
+            serve(serve_socket, numproc, timeout, max_worker_files,
+                  warm_versions, **server_options)
+        except ServerError as e:
+            print('%s: %s' % (program, e), file=sys.stderr)
+            sys.exit(1)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if not connect_socket:
+        # The decompiler itself is only loaded once the options are known
+        # to be good, and the process pool only if it is asked for.
+        from uncompyle6.main import main, status_msg
+
     # expand directory if specified
     if recurse_dirs:
         expanded_files = []
@@ -188,71 +297,48 @@ def main_bin():
     if timestamp:
         print(time.strftime(timestampfmt))
 
-    if numproc <= 1:
+    if connect_socket:
+        from uncompyle6.server import ServerError, client_main
+        request_options = {}
+        if parse_items is not None:
+            request_options['parse_items'] = parse_items
+        if parse_seconds is not None:
+            request_options['parse_seconds'] = parse_seconds
+        for opt, key in (('do_fragments', 'fragments'),
+                         ('do_linemaps', 'linemaps'),
+                         ('do_verify', 'verify'),
+                         ('source_encoding', 'encoding'),
+                         ('fast_path', 'fast_path')):
+            if opt in options:
+                request_options[key] = options[opt]
+        try:
+            result = client_main(connect_socket, src_base, out_base, pyc_paths,
+                                 outfile, **request_options)
+        except ServerError as e:
+            print('%s: %s' % (program, e), file=sys.stderr)
+            sys.exit(1)
+        if result[2] or result[3]:
+            sys.exit(1)
+    elif numproc <= 1:
         try:
             result = main(src_base, out_base, pyc_paths, source_paths, outfile,
                           **options)
-            result = list(result) + [options.get('do_verify', None)]
+            result = (list(result[:4]) + [options.get('do_verify', None)] +
+                      list(result[4:]))
             if len(pyc_paths) > 1:
                 mess = status_msg(do_verify, *result)
                 print('# ' + mess)
                 pass
         except (KeyboardInterrupt):
             pass
-        except verify.VerifyCmpError:
-            raise
     else:
-        from multiprocessing import Process, Queue
-
+        from uncompyle6.pool import pool_main
         try:
-            from Queue import Empty
-        except ImportError:
-            from queue import Empty
-
-        fqueue = Queue(len(pyc_paths)+numproc)
-        for f in pyc_paths:
-            fqueue.put(f)
-        for i in range(numproc):
-            fqueue.put(None)
-
-        rqueue = Queue(numproc)
-
-        def process_func():
-            try:
-                (tot_files, okay_files, failed_files, verify_failed_files) = (0, 0, 0, 0)
-                while 1:
-                    f = fqueue.get()
-                    if f is None:
-                        break
-                    (t, o, f, v) = \
-                      main(src_base, out_base, [f], None, outfile, **options)
-                    tot_files += t
-                    okay_files += o
-                    failed_files += f
-                    verify_failed_files += v
-            except (Empty, KeyboardInterrupt):
-                pass
-            rqueue.put((tot_files, okay_files, failed_files, verify_failed_files))
-            rqueue.close()
-
-        try:
-            procs = [Process(target=process_func) for i in range(numproc)]
-            for p in procs:
-                p.start()
-            for p in procs:
-                p.join()
-            try:
-                (tot_files, okay_files, failed_files, verify_failed_files) = (0, 0, 0, 0)
-                while True:
-                    (t, o, f, v) = rqueue.get(False)
-                    tot_files += t
-                    okay_files += o
-                    failed_files += f
-                    verify_failed_files += v
-            except Empty:
-                pass
-            print('# decompiled %i files: %i okay, %i failed, %i verify failed' %
-                  (tot_files, okay_files, failed_files, verify_failed_files))
+            result = pool_main(src_base, out_base, pyc_paths, outfile,
+                               numproc, timeout, max_worker_files, **options)
+            result = (list(result[:4]) + [options.get('do_verify', None)] +
+                      list(result[4:]))
+            print('# ' + status_msg(options.get('do_verify', None), *result))
         except (KeyboardInterrupt, OSError):
             pass
 
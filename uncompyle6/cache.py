@@ -0,0 +1,259 @@
+#  Copyright (c) 2020 by Rocky Bernstein
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+On-disk cache of decompilation results.
+
+Entries are keyed by a hash of the marshalled code object in a bytecode
+file (that is, the file contents after the magic number, timestamp and
+size header), the magic number, the uncompyle6 version, and the
+decompiler options that change the output. An entry records the source
+text produced by the deparser, the line-number map when one was asked
+for, and whether decompilation succeeded.
+
+The cache directory is bounded in size: when it grows past its limit
+the least-recently used entries are removed.
+"""
+
+import hashlib, json, os, sys, tempfile
+
+from io import BytesIO
+
+from xdis.load import load_module_from_file_object
+from uncompyle6 import PYTHON3
+from uncompyle6.version import __version__
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+    "uncompyle6",
+)
+
+# Maximum number of bytes kept in the cache directory
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+
+
+class _HeaderReader(BytesIO):
+    """xdis closes the file object it loads from, but we want to
+    read the code object that follows the header afterwards."""
+
+    def close(self):
+        pass
+
+
+class CachedDeparse(object):
+    """What decompile() returns when the result comes from the cache
+    rather than from a SourceWalker."""
+
+    def __init__(self, text, source_linemap=None):
+        self.text = text
+        self.source_linemap = source_linemap
+
+
+# Classes made by cached_error(), by the class they stand in for
+_cached_error_classes = {}
+
+
+def cached_error(entry):
+    """
+    Return the exception to raise again for a failed cache entry: an
+    instance of the class that was raised the first time, or of a
+    subclass of it for parser errors, which build their messages from
+    tokens that aren't kept in the cache.
+    """
+    from importlib import import_module
+    from uncompyle6.parser import ParserError
+    from uncompyle6.semantics.pysource import SourceWalkerError
+
+    error_class = SourceWalkerError
+    if entry.get("error_class"):
+        module, name = entry["error_class"].rsplit(".", 1)
+        try:
+            error_class = getattr(import_module(module), name)
+        except (ImportError, AttributeError):
+            pass
+    if not issubclass(error_class, ParserError):
+        return error_class(entry["error"])
+    replayed = _cached_error_classes.get(error_class)
+    if replayed is None:
+        replayed = _cached_error_classes[error_class] = type(
+            error_class.__name__,
+            (error_class,),
+            {"__init__": Exception.__init__, "__str__": lambda self: self.args[0]},
+        )
+    return replayed(entry["error"])
+
+
+class DecompileCache(object):
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        # Total size of entries on disk; computed the first time we store something.
+        self.size = None
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            pass
+
+    def file_key(self, filename, magic_int, **options):
+        """Return the cache key for bytecode file `filename`.
+        `options` are the decompiler settings that change the output.
+        """
+        with open(filename, "rb") as fp:
+            data = fp.read()
+        header = _HeaderReader(data)
+        load_module_from_file_object(header, filename, get_code=False)
+        marshalled = data[header.tell() :]
+
+        h = hashlib.sha1()
+        settings = "%s %s %d.%d %r" % (
+            __version__,
+            magic_int,
+            sys.version_info[0],
+            sys.version_info[1],
+            sorted(options.items()),
+        )
+        h.update(settings.encode("utf-8"))
+        h.update(marshalled)
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def get(self, key):
+        """Return the cache entry dictionary for `key` or None. The
+        dictionary has keys "status" ("ok" or "failed"), "text",
+        "linemap", "error" and "error_class".
+        """
+        path = self.path(key)
+        try:
+            with open(path, "rb") as fp:
+                entry = json.loads(fp.read().decode("utf-8"))
+        except (IOError, OSError, ValueError):
+            return None
+        try:
+            # Record the access for least-recently-used eviction
+            os.utime(path, None)
+        except OSError:
+            pass
+        if not PYTHON3:
+            entry["text"] = entry["text"].encode("utf-8")
+        return entry
+
+    def put(self, key, status, text, linemap=None, error=None):
+        """Record a result for `key`. `error` is the exception a failed
+        decompilation raised."""
+        if not PYTHON3 and isinstance(text, str):
+            text = text.decode("utf-8")
+        error_class = None
+        if error is not None:
+            error_class = "%s.%s" % (
+                error.__class__.__module__,
+                error.__class__.__name__,
+            )
+            error = str(error)
+        data = json.dumps(
+            {
+                "status": status,
+                "text": text,
+                "linemap": linemap,
+                "error": error,
+                "error_class": error_class,
+            }
+        ).encode("utf-8")
+
+        path = self.path(key)
+        dir = os.path.dirname(path)
+        try:
+            os.makedirs(dir)
+        except OSError:
+            pass
+
+        # Write to a temporary file and rename it so that concurrent
+        # readers never see a partial entry.
+        fd, tmp_path = tempfile.mkstemp(dir=dir, suffix=".tmp")
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+        # An entry being replaced no longer counts towards the size.
+        try:
+            old_size = os.stat(path).st_size
+        except OSError:
+            old_size = 0
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            os.remove(tmp_path)
+            return
+
+        if self.size is None:
+            self.size = sum(size for _, size, _ in self.entries())
+        else:
+            self.size += len(data) - old_size
+        if self.size > self.max_size:
+            self.evict()
+
+    def entries(self):
+        """Yield (access time, size, path) for each cache entry."""
+        for root, _, files in os.walk(self.cache_dir):
+            for f in files:
+                if not f.endswith(".json"):
+                    continue
+                path = os.path.join(root, f)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield st.st_mtime, st.st_size, path
+
+    def evict(self):
+        """Remove least-recently used entries until the cache is down
+        to three quarters of its maximum size."""
+        entries = sorted(self.entries())
+        self.size = sum(size for _, size, _ in entries)
+        target = self.max_size * 3 // 4
+        for _, size, path in entries:
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+
+    def clear(self):
+        for _, _, path in list(self.entries()):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.size = 0
+
+
+class RecordingStream(object):
+    """Pass writes on to `out` while keeping a copy of what was written."""
+
+    def __init__(self, out):
+        self.out = out
+        self.written = []
+
+    def write(self, s):
+        self.written.append(s)
+        return self.out.write(s)
+
+    def recorded(self):
+        return "".join(self.written)
+
+    def __getattr__(self, name):
+        return getattr(self.out, name)
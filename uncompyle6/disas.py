@@ -35,7 +35,7 @@ import sys
 from collections import deque
 
 from xdis import check_object_path, iscode, load_module
-from uncompyle6.scanner import get_scanner
+from uncompyle6.scanner import shared_scanner
 
 
 def disco(version, co, out=None, is_pypy=False):
@@ -51,7 +51,7 @@ def disco(version, co, out=None, is_pypy=False):
     if co.co_filename:
         print("# Embedded file name: %s" % co.co_filename, file=real_out)
 
-    scanner = get_scanner(version, is_pypy=is_pypy)
+    scanner = shared_scanner(version, is_pypy=is_pypy)
 
     queue = deque([co])
     disco_loop(scanner.ingest, queue, real_out)
@@ -13,20 +13,21 @@
 #  You should have received a copy of the GNU General Public License
 #  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from __future__ import print_function
-import datetime, py_compile, os, subprocess, sys, tempfile
+import datetime, json, py_compile, os, sys
 
-from uncompyle6 import verify, IS_PYPY, PYTHON_VERSION
+from uncompyle6 import IS_PYPY, PYTHON_VERSION
 from xdis import iscode, sysinfo2float
 from uncompyle6.disas import check_object_path
 from uncompyle6.semantics import pysource
 from uncompyle6.parser import ParserError
 from uncompyle6.version import __version__
+from uncompyle6.profiling import Profile, NO_PROFILE, clock
 
 # from uncompyle6.linenumbers import line_number_mapping
 
+# Fragments, line maps, the cache and verification are imported
+# where they are used, so that plain decompilation doesn't load them.
 from uncompyle6.semantics.pysource import code_deparse
-from uncompyle6.semantics.fragments import code_deparse as code_deparse_fragments
-from uncompyle6.semantics.linemap import deparse_code_with_map
 
 from xdis.load import load_module
 
@@ -61,6 +62,13 @@ def decompile(
     magic_int=None,
     mapstream=None,
     do_fragments=False,
+    cache=None,
+    cache_key=None,
+    nested_procs=None,
+    profile=None,
+    stream=False,
+    parse_budget=None,
+    fast_path=False,
 ):
     """
     ingests and deparses a given code block 'co'
@@ -68,6 +76,29 @@ def decompile(
     if `bytecode_version` is None, use the current Python intepreter
     version.
 
+    If `cache` is a DecompileCache and `cache_key` is given, a previous
+    result stored under `cache_key` is used instead of deparsing, and
+    otherwise the result is stored there. In the first case the value
+    returned is a CachedDeparse rather than a SourceWalker.
+
+    If `nested_procs` is greater than 1, code objects nested in `co` are
+    parsed using that many processes. This doesn't change the output.
+
+    If `profile` is a profiling.Profile, timings and counts of what was
+    done in deparsing are added to it.
+
+    If `stream` is True, source is written to `out` a top-level
+    statement at a time as it is generated. Linemaps and fragments
+    aren't streamed.
+
+    If `parse_budget` is a parser.ParseBudget, functions and classes
+    that take more parsing than it allows are written out as
+    disassembly in comments; see code_deparse(). Fragments don't
+    have a budget.
+
+    If `fast_path` is True, simple statements are parsed without the
+    Earley parser where that is safe; see code_deparse().
+
     Caller is responsible for closing `out` and `mapstream`
     """
     if bytecode_version is None:
@@ -113,10 +144,31 @@ def decompile(
 
     debug_opts = {"asm": showasm, "ast": showast, "grammar": showgrammar}
 
+    # Debug output and fragment information can't be replayed from the cache.
+    if showasm or showast or showgrammar or do_fragments:
+        cache = None
+    if cache is not None and cache_key is not None:
+        from uncompyle6.cache import CachedDeparse, RecordingStream, cached_error
+
+        if mapstream and isinstance(mapstream, str):
+            mapstream = _get_outstream(mapstream)
+        entry = cache.get(cache_key)
+        if entry is not None:
+            real_out.write(entry["text"])
+            source_linemap = None
+            if entry["linemap"] is not None:
+                source_linemap = dict(entry["linemap"])
+                _write_linemap(mapstream, source_linemap, sys_version_lines)
+            if entry["status"] == "failed":
+                raise cached_error(entry)
+            return CachedDeparse(entry["text"], source_linemap)
+        out = RecordingStream(real_out)
+
     try:
         if mapstream:
             if isinstance(mapstream, str):
                 mapstream = _get_outstream(mapstream)
+            from uncompyle6.semantics.linemap import deparse_code_with_map
 
             deparsed = deparse_code_with_map(
                 co,
@@ -125,26 +177,68 @@ def decompile(
                 debug_opts,
                 code_objects=code_objects,
                 is_pypy=is_pypy,
+                profile=profile,
+                parse_budget=parse_budget,
+                fast_path=fast_path,
             )
-            header_count = 3 + len(sys_version_lines)
-            linemap = [
-                (line_no, deparsed.source_linemap[line_no] + header_count)
-                for line_no in sorted(deparsed.source_linemap.keys())
-            ]
-            mapstream.write("\n\n# %s\n" % linemap)
+            _write_linemap(mapstream, deparsed.source_linemap, sys_version_lines)
         else:
             if do_fragments:
-                deparse_fn = code_deparse_fragments
+                from uncompyle6.semantics.fragments import (
+                    code_deparse as code_deparse_fragments,
+                )
+
+                deparsed = code_deparse_fragments(
+                    co, out, bytecode_version, debug_opts=debug_opts, is_pypy=is_pypy
+                )
             else:
-                deparse_fn = code_deparse
-            deparsed = deparse_fn(
-                co, out, bytecode_version, debug_opts=debug_opts, is_pypy=is_pypy
-            )
+                deparsed = code_deparse(
+                    co,
+                    out,
+                    bytecode_version,
+                    debug_opts=debug_opts,
+                    is_pypy=is_pypy,
+                    nested_procs=nested_procs,
+                    profile=profile,
+                    stream=stream,
+                    parse_budget=parse_budget,
+                    fast_path=fast_path,
+                )
             pass
-        return deparsed
-    except pysource.SourceWalkerError as e:
-        # deparsing failed
-        raise pysource.SourceWalkerError(str(e))
+    except (ParserError, pysource.SourceWalkerError) as e:
+        error = e
+        if not isinstance(e, ParserError):
+            # deparsing failed
+            error = pysource.SourceWalkerError(str(e))
+        if cache is not None and cache_key is not None:
+            cache.put(cache_key, "failed", out.recorded(), error=error)
+        if error is e:
+            raise
+        raise error
+    # Results cut short by the parse budget aren't kept.
+    if cache is not None and cache_key is not None and not deparsed.budget_overruns:
+        linemap = None
+        if mapstream:
+            linemap = sorted(deparsed.source_linemap.items())
+        cache.put(cache_key, "ok", out.recorded(), linemap)
+    return deparsed
+
+
+def _write_profile(profile_file, filename, status, seconds, profile):
+    record = profile.as_dict()
+    record.update({"file": filename, "status": status, "seconds": seconds})
+    # Append, a line at a time, since -p workers share the file.
+    with open(profile_file, "a") as fp:
+        fp.write(json.dumps(record, sort_keys=True) + "\n")
+
+
+def _write_linemap(mapstream, source_linemap, sys_version_lines):
+    header_count = 3 + len(sys_version_lines)
+    linemap = [
+        (line_no, source_linemap[line_no] + header_count)
+        for line_no in sorted(source_linemap.keys())
+    ]
+    mapstream.write("\n\n# %s\n" % linemap)
 
 
 def compile_file(source_path):
@@ -172,17 +266,34 @@ def decompile_file(
     source_encoding=None,
     mapstream=None,
     do_fragments=False,
+    cache=None,
+    nested_procs=None,
+    profile=None,
+    stream=False,
+    parse_budget=None,
+    fast_path=False,
 ):
     """
     decompile Python byte-code file (.pyc). Return objects to
     all of the deparsed objects found in `filename`.
+
+    If `cache` is a DecompileCache, results are looked up there
+    and saved there. `nested_procs`, `profile`, `stream`,
+    `parse_budget` and `fast_path` are passed on to decompile().
     """
 
     filename = check_object_path(filename)
     code_objects = {}
-    (version, timestamp, magic_int, co, is_pypy, source_size, sip_hash) = load_module(
-        filename, code_objects
-    )
+    with (profile or NO_PROFILE).phase("load"):
+        (
+            version,
+            timestamp,
+            magic_int,
+            co,
+            is_pypy,
+            source_size,
+            sip_hash,
+        ) = load_module(filename, code_objects)
 
     if isinstance(co, list):
         deparsed = []
@@ -204,6 +315,14 @@ def decompile_file(
                 mapstream=mapstream,
             )
     else:
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.file_key(
+                filename,
+                magic_int,
+                linemaps=mapstream is not None,
+                fast_path=fast_path,
+            )
         deparsed = [
             decompile(
                 version,
@@ -220,6 +339,13 @@ def decompile_file(
                 magic_int=magic_int,
                 mapstream=mapstream,
                 do_fragments=do_fragments,
+                cache=cache,
+                cache_key=cache_key,
+                nested_procs=nested_procs,
+                profile=profile,
+                stream=stream,
+                parse_budget=parse_budget,
+                fast_path=fast_path,
             )
         ]
     co = None
@@ -241,22 +367,53 @@ def main(
     raise_on_error=False,
     do_linemaps=False,
     do_fragments=False,
+    cache_dir=None,
+    cache_size=None,
+    nested_procs=None,
+    profile_file=None,
+    stream=False,
+    parse_budget=None,
+    fast_path=False,
 ):
     """
     in_base	base directory for input files
     out_base	base directory for output files (ignored when
     files	list of filenames to be uncompyled (relative to in_base)
     outfile	write output to this filename (overwrites out_base)
+    cache_dir	if not None, reuse and save results in this directory
+    cache_size	maximum number of bytes kept in cache_dir
+    nested_procs	number of processes to parse nested code objects with
+    profile_file	if not None, append a JSON line with phase timings and
+    		counts for each file to this file
+    stream	write source out a statement at a time as it is generated
+    parse_budget	if not None, a parser.ParseBudget limiting the parsing
+    		done for each function or class; those over it are left
+    		as disassembly and listed in the summary
+    fast_path	parse simple statements without the Earley parser
+    		where that is safe
 
     For redirecting output to
     - <filename>		outfile=<filename> (out_base is ignored)
     - files below out_base	out_base=...
     - stdout			out_base=None, outfile=None
+
+    Returns the number of files tried, decompiled, failed, failed
+    verification, and gone over the parse budget.
     """
     tot_files = okay_files = failed_files = verify_failed_files = 0
+    over_budget_files = []
     current_outfile = outfile
     linemap_stream = None
 
+    cache = None
+    if cache_dir is not None:
+        from uncompyle6.cache import DecompileCache
+
+        if cache_size is None:
+            cache = DecompileCache(cache_dir)
+        else:
+            cache = DecompileCache(cache_dir, cache_size)
+
     for source_path in source_files:
         compiled_files.append(compile_file(source_path))
 
@@ -280,6 +437,8 @@ def main(
             if do_linemaps:
                 linemap_stream = sys.stdout
             if do_verify:
+                import subprocess, tempfile
+
                 prefix = os.path.basename(filename) + "-"
                 if prefix.endswith(".py"):
                     prefix = prefix[: -len(".py")]
@@ -311,6 +470,12 @@ def main(
 
         # print(current_outfile, file=sys.stderr)
 
+        profile = None
+        if profile_file:
+            profile = Profile()
+            start_time = clock()
+            failed_before = failed_files
+
         # Try to uncompile the input file
         try:
             deparsed = decompile_file(
@@ -322,7 +487,22 @@ def main(
                 source_encoding,
                 linemap_stream,
                 do_fragments,
+                cache,
+                nested_procs,
+                profile,
+                stream,
+                parse_budget,
+                fast_path,
             )
+            overruns = [
+                name for d in deparsed for name in getattr(d, "budget_overruns", ())
+            ]
+            if overruns:
+                sys.stderr.write(
+                    "\n# file %s\n# parse budget exceeded in: %s\n"
+                    % (infile, ", ".join(overruns))
+                )
+                over_budget_files.append(infile)
             if do_fragments:
                 for d in deparsed:
                     last_mod = None
@@ -382,6 +562,8 @@ def main(
                 outstream.close()
 
                 if do_verify:
+                    from uncompyle6 import verify
+
                     try:
                         msg = verify.compare_code_with_srcfile(
                             infile, current_outfile, do_verify
@@ -423,6 +605,14 @@ def main(
                     mess = "\n# okay decompiling"
                     # mem_usage = __memUsage()
                     print(mess, infile)
+        if profile is not None:
+            _write_profile(
+                profile_file,
+                infile,
+                "failed" if failed_files > failed_before else "ok",
+                clock() - start_time,
+                profile,
+            )
         if current_outfile:
             sys.stdout.write(
                 "%s -- %s\r"
@@ -435,6 +625,7 @@ def main(
                         failed_files,
                         verify_failed_files,
                         do_verify,
+                        len(over_budget_files),
                     ),
                 )
             )
@@ -451,7 +642,18 @@ def main(
         except:
             pass
         pass
-    return (tot_files, okay_files, failed_files, verify_failed_files)
+    if over_budget_files and tot_files > 1:
+        sys.stderr.write(
+            "\n# %i files went over the parse budget:\n#   %s\n"
+            % (len(over_budget_files), "\n#   ".join(over_budget_files))
+        )
+    return (
+        tot_files,
+        okay_files,
+        failed_files,
+        verify_failed_files,
+        len(over_budget_files),
+    )
 
 
 # ---- main ----
@@ -472,7 +674,13 @@ else:
 
 
 def status_msg(
-    do_verify, tot_files, okay_files, failed_files, verify_failed_files, weak_verify
+    do_verify,
+    tot_files,
+    okay_files,
+    failed_files,
+    verify_failed_files,
+    weak_verify,
+    over_budget_files=0,
 ):
     if weak_verify == "weak":
         verification_type = "weak "
@@ -496,4 +704,6 @@ def status_msg(
     )
     if do_verify:
         mess += ", %i %sverification failed" % (verify_failed_files, verification_type)
+    if over_budget_files:
+        mess += ", %i over parse budget" % over_budget_files
     return mess
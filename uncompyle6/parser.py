@@ -21,7 +21,9 @@ Common uncompyle6 parser routines.
 
 from __future__ import print_function
 
-import sys
+import os, sys, threading, time
+from collections import namedtuple
+from copy import copy
 
 from xdis import iscode, py_str2float
 from spark_parser import GenericASTBuilder, DEFAULT_DEBUG as PARSER_DEFAULT_DEBUG
@@ -41,10 +43,78 @@ class ParserError(Exception):
         )
 
 
+class ParseBudgetError(ParserError):
+    """Raised when parsing a code object takes more work than the
+    parser's budget allows. See ParseBudget."""
+
+    def __init__(self, token, offset, limit, debug=PARSER_DEFAULT_DEBUG):
+        ParserError.__init__(self, token, offset, debug)
+        self.limit = limit
+
+    def __str__(self):
+        return (
+            "Parse budget of %s exceeded at or near `%r' instruction at offset %s\n"
+            % (self.limit, self.token, self.offset)
+        )
+
+
+# Limits on the work the parser does for one code object: the number of
+# Earley items it makes, and the seconds it takes. None means no limit.
+ParseBudget = namedtuple("ParseBudget", "items seconds")
+ParseBudget.__new__.__defaults__ = (None, None)
+
+
 def nop_func(self, args):
     return None
 
 
+# Earley parse tables for grammars we have already prepared, for each
+# thread, keyed by the grammar's rules. Most code objects only need one
+# of a handful of customized grammars, so this saves rebuilding the same
+# tables each time. spark adds states to the tables as it parses, so
+# parsers in different threads can't share them.
+_grammar_tables = threading.local()
+GRAMMAR_TABLES_MAX = 100
+
+# Tokens made by Scanner.collapse_const_collections()
+CONST_COLLECTIONS = frozenset(("CONST_LIST", "CONST_SET", "CONST_TUPLE", "CONST_DICT"))
+
+# Long lists of statements are parsed in pieces of at least this many
+# tokens. See PythonParser.split_tokens().
+PARSE_SEGMENT_MIN = 500
+
+# The statements that PythonParser.fast_path() builds without the
+# Earley parser, and the kinds of the tokens that stand in for them.
+FAST_PATH_TOKENS = dict(
+    (nt, "FAST_" + nt.upper()) for nt in ("assign", "call_stmt")
+)
+FAST_PATH_KINDS = frozenset(FAST_PATH_TOKENS.values())
+
+# Instructions whose value is just an "expr" of the instruction
+FAST_LOAD_OPS = frozenset(
+    ("LOAD_CONST", "LOAD_DEREF", "LOAD_FAST", "LOAD_GLOBAL", "LOAD_NAME", "LOAD_STR")
+)
+FAST_STORE_OPS = frozenset(("STORE_DEREF", "STORE_FAST", "STORE_GLOBAL", "STORE_NAME"))
+
+# Instructions that replace one expr on the stack, or two for
+# FAST_BINARY_OPS, with a new one. The values are the nonterminal
+# for the result and the nonterminal, if any, that the instruction
+# itself goes in.
+FAST_UNARY_OPS = {
+    "LOAD_ATTR": ("attribute", None),
+    "LOAD_METHOD": ("attribute37", None),
+    "UNARY_CONVERT": ("unary_convert", None),
+    "UNARY_INVERT": ("unary_op", "unary_operator"),
+    "UNARY_NEGATIVE": ("unary_op", "unary_operator"),
+    "UNARY_NOT": ("unary_not", None),
+    "UNARY_POSITIVE": ("unary_op", "unary_operator"),
+}
+FAST_BINARY_OPS = {
+    "BINARY_SUBSCR": ("subscript", None),
+    "COMPARE_OP": ("compare_single", None),
+}
+
+
 class PythonParser(GenericASTBuilder):
     def __init__(self, SyntaxTree, start, debug):
         super(PythonParser, self).__init__(SyntaxTree, start, debug)
@@ -102,6 +172,20 @@ class PythonParser(GenericASTBuilder):
         # Instructions filled in from scanner
         self.insts = []
 
+        # Set to have parse() try the tokens from fast_path() first
+        self.use_fast_path = False
+        # Set while parsing the tokens from fast_path() or split_tokens()
+        self.trial_parse = False
+        # Offsets of the instructions we can split the tokens at, filled
+        # in from scanner
+        self.split_offsets = frozenset()
+
+        # A ParseBudget, if parse() should give up on code that takes
+        # too much work
+        self.budget = None
+        self.budget_items = 0
+        self.budget_start = None
+
     def ast_first_offset(self, ast):
         if hasattr(ast, "offset"):
             return ast.offset
@@ -144,6 +228,487 @@ class PythonParser(GenericASTBuilder):
         self.add_unique_rules(rules, customize)
         return
 
+    def copy(self, debug=None):
+        """Return a copy of this parser whose grammar can be customized
+        without changing this parser's grammar. If `debug` is given,
+        it replaces the debug flags of the copy.
+        """
+        p = self.__class__.__new__(self.__class__)
+        for name, value in self.__dict__.items():
+            if isinstance(value, list):
+                value = value[:]
+            elif isinstance(value, (dict, set)):
+                value = value.copy()
+            setattr(p, name, value)
+        p.rules = dict((lhs, rules[:]) for lhs, rules in self.rules.items())
+
+        # The semantic actions that GenericASTBuilder attaches to rules are
+        # closures over the parser they were added to. Rebind them to the copy.
+        p.rule2func = {}
+        for rule, func in self.rule2func.items():
+            if rule[0] != self._START:
+                rule, func = p.preprocess(rule, func)
+            p.rule2func[rule] = func
+        if debug is not None:
+            p.debug = debug
+        return p
+
+    def parse(self, tokens, debug=None):
+        """Like GenericParser.parse(), but if the grammar has changed since
+        the last parse, pick up the parse tables from the cache when some
+        parser has already prepared them for the same set of rules.
+
+        Long lists of statements are parsed in pieces, see split_tokens().
+
+        If the parser has a budget, ParseBudgetError is raised when
+        parsing `tokens` takes more than it allows.
+
+        If `use_fast_path` is set, each piece is first parsed with some of
+        its statements already built by fast_path().
+        """
+        if self.budget is not None:
+            self.budget_items = 0
+            self.budget_start = time.time()
+        debug_reduce = (debug or self.debug)["reduce"]
+        straight = None
+        if self.use_fast_path and not debug_reduce and self.profile_info is None:
+            straight = self.straight_line_offsets()
+            if straight:
+                self.add_fast_path_rules()
+        if self.ruleschanged:
+            self.prepare_grammar_tables()
+        if not debug_reduce:
+            segments = self.split_tokens(tokens)
+            if len(segments) > 1:
+                trial_parse, self.trial_parse = self.trial_parse, True
+                try:
+                    trees = []
+                    base = 0
+                    for segment in segments:
+                        trees.append(
+                            self.parse_segment(tokens, segment, base, debug, straight)
+                        )
+                        base += len(segment)
+                except ParseBudgetError:
+                    raise
+                except Exception:
+                    # Parse it all in one go.
+                    trees = None
+                finally:
+                    self.trial_parse = trial_parse
+                if trees is not None:
+                    tree = trees[0]
+                    for stmts in trees[1:]:
+                        tree.extend(stmts)
+                    return tree
+        return self.parse_segment(tokens, tokens, 0, debug, straight)
+
+    def parse_segment(self, tokens, segment, base, debug, straight=None):
+        """Parse `segment`, the piece of `tokens` starting at index `base`.
+
+        Reduction checks still get all of `tokens`, with their indices
+        moved along by `base`: many of them look past the end of the
+        rule, and would otherwise take the end of the segment for the
+        end of the code.
+
+        If `straight` is given, the segment is first parsed with the
+        statements fast_path() builds from it. Only if that fails is the
+        segment parsed as it is, so a failure costs at most the one
+        segment's work twice.
+        """
+        if straight:
+            fast_segment = self.fast_path(segment, straight)
+            if fast_segment is not segment:
+                trial_parse, self.trial_parse = self.trial_parse, True
+                try:
+                    return self.parse_segment(
+                        tokens[:base] + fast_segment + tokens[base + len(segment) :],
+                        fast_segment,
+                        base,
+                        debug,
+                    )
+                except ParseBudgetError:
+                    raise
+                except Exception:
+                    # Leave this segment to the Earley parser.
+                    pass
+                finally:
+                    self.trial_parse = trial_parse
+        if segment is tokens:
+            return GenericASTBuilder.parse(self, tokens, debug)
+
+        saved = self.__dict__.get("reduce_is_invalid")
+        reduce_is_invalid = self.reduce_is_invalid
+
+        def segment_reduce_is_invalid(rule, ast, _, first, last):
+            return reduce_is_invalid(rule, ast, tokens, first + base, last + base)
+
+        self.reduce_is_invalid = segment_reduce_is_invalid
+        try:
+            return GenericASTBuilder.parse(self, segment, debug)
+        finally:
+            if saved is None:
+                del self.reduce_is_invalid
+            else:
+                self.reduce_is_invalid = saved
+
+    def makeSet(self, tokens, sets, i):
+        GenericASTBuilder.makeSet(self, tokens, sets, i)
+        if self.budget is not None:
+            self.check_budget(sets[i], i)
+
+    def buildTree(self, nt, item, tokens, k):
+        """GenericParser.buildTree(), but with an explicit stack in place
+        of recursion, so that long chains such as "a + b + ... + z" don't
+        run out of Python stack. Children are still built right to left
+        and each rule's function is called once its children are built.
+        """
+        debug_rules = self.debug["rules"]
+        states = self.states
+        newrules = self.newrules
+        BOF = self._BOF
+        NULLABLE = self._NULLABLE
+        # Each entry is [rule, attr, index of the child being built,
+        # item, k, (key, why) for the child being built]
+        stack = []
+        while True:
+            # Start on `nt`, completed at `item`.
+            if debug_rules:
+                print("NT", nt)
+            choices = [rule for rule in states[item[0]].complete if rule[0] == nt]
+            rule = choices[0]
+            if len(choices) > 1:
+                rule = self.ambiguity(choices)
+            rhs = rule[1]
+            stack.append([rule, [None] * len(rhs), len(rhs) - 1, item, k, None])
+
+            while True:
+                frame = stack[-1]
+                rule, attr, i, item, k, _ = frame
+                rhs = rule[1]
+                while i >= 0:
+                    sym = rhs[i]
+                    if sym not in newrules:
+                        if sym != BOF:
+                            attr[i] = tokens[k - 1]
+                            item, k = self.predecessor((item, k), None)
+                    elif NULLABLE == sym[0 : len(NULLABLE)]:
+                        attr[i] = self.deriveEpsilon(sym)
+                    else:
+                        key = (item, k)
+                        why = self.causal(key)
+                        frame[2:] = [i, item, k, (key, why)]
+                        break
+                    i -= 1
+                else:
+                    value = self.rule2func[self.new2old[rule]](attr)
+                    stack.pop()
+                    if not stack:
+                        return value
+                    frame = stack[-1]
+                    i, key, why = frame[2], frame[5][0], frame[5][1]
+                    frame[1][i] = value
+                    item, k = self.predecessor(key, why)
+                    frame[2:] = [i - 1, item, k, None]
+                    continue
+                # Build the child for rhs[i] first.
+                nt, item, k = sym, why[0], why[1]
+                break
+
+    def check_budget(self, items, i):
+        """Count the Earley `items` just made for token `i` against the
+        budget, and raise ParseBudgetError if it has run out."""
+        max_items, max_seconds = self.budget
+        self.budget_items += len(items)
+        if max_items is not None and self.budget_items > max_items:
+            limit = "%d Earley items" % max_items
+        elif max_seconds is not None and time.time() - self.budget_start > max_seconds:
+            limit = "%s seconds" % max_seconds
+        else:
+            return
+        tokens = self.tokens
+        if tokens:
+            token = tokens[min(i, len(tokens) - 1)]
+            raise ParseBudgetError(token, token.offset, limit)
+        raise ParseBudgetError(None, -1, limit)
+
+    def split_tokens(self, tokens):
+        """Return a list of the pieces of `tokens` that can be parsed
+        on their own, as lists of statements, and then joined.
+
+        The scanner gives the places we can cut at in `split_offsets`,
+        see Scanner.find_split_offsets(). Parsing in pieces keeps
+        the Earley parser's work, and the depth of the tree it builds
+        for a list of statements, down for long straight-line code such
+        as module bodies. Pieces have at least PARSE_SEGMENT_MIN tokens.
+        """
+        split_offsets = self.split_offsets
+        if (
+            not split_offsets
+            or len(tokens) < 2 * PARSE_SEGMENT_MIN
+            or self.rules[self._START][0][1][1] != "stmts"
+        ):
+            return [tokens]
+        segments = []
+        first = 0
+        for i in range(PARSE_SEGMENT_MIN, len(tokens) - PARSE_SEGMENT_MIN):
+            if i - first >= PARSE_SEGMENT_MIN and tokens[i].offset in split_offsets:
+                segments.append(tokens[first:i])
+                first = i
+        segments.append(tokens[first:])
+        return segments
+
+    def add_fast_path_rules(self):
+        """Add the rules that let the tokens made by fast_path() stand in
+        for the nonterminals they replace."""
+        for nt, kind in FAST_PATH_TOKENS.items():
+            rule = (nt, (kind,))
+            if self.rules.get(nt) and rule not in self.rule2func:
+                self.addRule("%s ::= %s" % (nt, kind), nop_func)
+
+    def straight_line_offsets(self):
+        """Return the offsets of the instructions that no jump goes
+        across or to, or an empty set if we can't tell."""
+        insts = self.insts
+        offset2inst_index = self.offset2inst_index
+        # For each instruction, the change in the number of jumps that
+        # go across it, start at it or end at it.
+        crossings = [0] * (len(insts) + 1)
+        for i, inst in enumerate(insts):
+            if inst.optype in ("jabs", "jrel"):
+                j = offset2inst_index.get(inst.argval)
+                if j is None:
+                    return frozenset()
+                crossings[min(i, j)] += 1
+                crossings[max(i, j) + 1] -= 1
+        straight = set()
+        jumps = 0
+        for i, inst in enumerate(insts):
+            jumps += crossings[i]
+            if jumps == 0:
+                straight.add(inst.offset)
+        return frozenset(straight)
+
+    def fast_path(self, tokens, straight=None):
+        """Return `tokens` with the instructions of straight-line
+        assignments and call statements each replaced by a single token
+        that carries their parse tree, or `tokens` itself if there is
+        nothing to replace.
+
+        The trees are built by following the evaluation stack and are
+        put together with our grammar rules and nonterminal(), so they
+        are the ones the Earley parser would have built. We stop at
+        anything we aren't sure of: jump targets, instructions we don't
+        handle, rules that aren't in the grammar or that have a reduce
+        check.
+
+        Reduce checks of the rules around a statement look at its tokens
+        by position, so a statement is only replaced when it and the
+        tokens either side of it all have offsets in `straight`, from
+        straight_line_offsets(): then it isn't inside an "if", loop,
+        "try" or the like. If the tokens we return don't parse,
+        parse_segment() goes back to the original tokens.
+        """
+        insts = self.insts
+        if not insts:
+            return tokens
+        if straight is None:
+            straight = self.straight_line_offsets()
+        offset2inst_index = self.offset2inst_index
+        rule2func = self.rule2func
+        check_reduce = self.check_reduce
+        nonterminal = self.nonterminal
+
+        def has_rule(nt, rhs):
+            return (nt, rhs) in rule2func and nt not in check_reduce
+
+        def expr(value):
+            if has_rule("expr", (value.kind,)):
+                return nonterminal("expr", [value])
+            return None
+
+        def is_straight(i):
+            return i < 0 or i >= len(tokens) or tokens[i].offset in straight
+
+        # The index of the first token and the token or tree for each
+        # value on the evaluation stack
+        stack = []
+        # Runs of tokens to replace: first index, last index + 1, tree
+        runs = []
+
+        for i, token in enumerate(tokens):
+            if token.text_offset:
+                del stack[:]
+                continue
+            inst_index = offset2inst_index.get(token.offset)
+            if inst_index is None:
+                del stack[:]
+                continue
+            inst = insts[inst_index]
+            if token.op is not None and inst.opcode != token.op:
+                # These aren't the instructions the tokens were made from.
+                return tokens
+            if inst.is_jump_target or token.offset not in straight:
+                del stack[:]
+                continue
+
+            kind = token.kind
+            if kind in FAST_LOAD_OPS:
+                stack.append((i, token))
+                continue
+
+            node = None
+            nargs = 0
+            if kind in FAST_UNARY_OPS or kind in FAST_BINARY_OPS or (
+                kind.startswith("BINARY_") and has_rule("binary_operator", (kind,))
+            ):
+                if kind in FAST_UNARY_OPS:
+                    nt, op_nt = FAST_UNARY_OPS[kind]
+                    nargs = 1
+                else:
+                    nt, op_nt = FAST_BINARY_OPS.get(kind, ("bin_op", "binary_operator"))
+                    nargs = 2
+                if len(stack) >= nargs:
+                    args = [expr(value) for first, value in stack[-nargs:]]
+                    if op_nt is None:
+                        args.append(token)
+                    elif has_rule(op_nt, (kind,)):
+                        args.append(nonterminal(op_nt, [token]))
+                    else:
+                        args.append(None)
+                    if None not in args and has_rule(
+                        nt, tuple(arg.kind for arg in args)
+                    ):
+                        node = nonterminal(nt, args)
+                        if nt == "compare_single":
+                            node = (
+                                nonterminal("compare", [node])
+                                if has_rule("compare", (nt,))
+                                else None
+                            )
+            elif kind.startswith(("CALL_FUNCTION_", "CALL_METHOD_")):
+                # Positional arguments only
+                nargs = token.attr
+                if (
+                    isinstance(nargs, int)
+                    and nargs < 256
+                    and kind in ("CALL_FUNCTION_%d" % nargs, "CALL_METHOD_%d" % nargs)
+                    and len(stack) > nargs
+                    and not self.fast_path_exception(tokens, i, stack[-nargs - 1][1])
+                ):
+                    nargs += 1
+                    args = [expr(value) for first, value in stack[-nargs:]]
+                    rhs = ("expr",) * nargs + (kind,)
+                    pos_rhs = ("expr",) + ("pos_arg",) * (nargs - 1) + (kind,)
+                    if nargs > 1 and has_rule("pos_arg", ("expr",)):
+                        has_pos_rule = has_rule("call", pos_rhs)
+                    else:
+                        has_pos_rule = False
+                    if None in args:
+                        pass
+                    elif has_rule("call", rhs):
+                        # With both rules the grammar is ambiguous.
+                        if not has_pos_rule:
+                            node = nonterminal("call", args + [token])
+                    elif has_pos_rule:
+                        args[1:] = [nonterminal("pos_arg", [arg]) for arg in args[1:]]
+                        node = nonterminal("call", args + [token])
+            elif kind in FAST_STORE_OPS or kind == "POP_TOP":
+                if stack:
+                    first, value = stack[-1]
+                    if kind == "POP_TOP":
+                        if value.kind == "call" and has_rule(
+                            "call_stmt", ("expr", "POP_TOP")
+                        ):
+                            node = expr(value)
+                            if node is not None:
+                                node = nonterminal("call_stmt", [node, token])
+                    elif has_rule("store", (kind,)) and has_rule(
+                        "assign", ("expr", "store")
+                    ):
+                        node = expr(value)
+                        if node is not None:
+                            store = nonterminal("store", [token])
+                            node = nonterminal("assign", [node, store])
+                    if node is not None:
+                        del stack[:]
+                        if is_straight(first - 1) and is_straight(i + 1):
+                            runs.append((first, i + 1, node))
+                        continue
+
+            if node is None:
+                del stack[:]
+            else:
+                first = stack[-nargs][0]
+                del stack[-nargs:]
+                stack.append((first, node))
+
+        if not runs:
+            return tokens
+        fast_tokens = []
+        last = 0
+        for first, end, node in runs:
+            fast_tokens.extend(tokens[last:first])
+            token = copy(tokens[first])
+            token.kind = FAST_PATH_TOKENS[node.kind]
+            token.attr = node
+            token.pattr = tokens[first:end]
+            token.op = None
+            token.has_arg = True
+            fast_tokens.append(token)
+            last = end
+        fast_tokens.extend(tokens[last:])
+        return fast_tokens
+
+    def fast_path_exception(self, tokens, i, function):
+        """Return True if the call at tokens[i] of `function` is part of
+        a rule that matches its instructions directly."""
+        # assert2 ::= expr jmp_true LOAD_GLOBAL expr CALL_FUNCTION_1 RAISE_VARARGS_1
+        if i + 1 < len(tokens) and tokens[i + 1].kind.startswith("RAISE_VARARGS"):
+            return True
+        # lc_body ::= LOAD_NAME expr CALL_FUNCTION_1 POP_TOP
+        # where LOAD_NAME is the list comprehension's "_[1].append"
+        pattr = getattr(function, "pattr", None)
+        return isinstance(pattr, str) and pattr.startswith("_[")
+
+    def prepare_grammar_tables(self):
+        # The empty rule lists that remove_rules() leaves behind
+        # change the tables, so those left-hand sides are part of the key.
+        key = frozenset(self.rules).union(self.rule2func)
+        cache = getattr(_grammar_tables, "tables", None)
+        if cache is None:
+            cache = _grammar_tables.tables = {}
+        tables = cache.get(key, None)
+        if tables is None:
+            # This is what GenericParser.parse() does on a grammar change.
+            self.computeNull()
+            self.newrules = {}
+            self.new2old = {}
+            self.makeNewRules()
+            self.edges, self.cores = {}, {}
+            self.states = {0: self.makeState0()}
+            self.makeState(0, self._BOF)
+            if len(cache) >= GRAMMAR_TABLES_MAX:
+                del cache[next(iter(cache))]
+            cache[key] = (
+                self.nullable,
+                self.newrules,
+                self.new2old,
+                self.edges,
+                self.cores,
+                self.states,
+            )
+        else:
+            (
+                self.nullable,
+                self.newrules,
+                self.new2old,
+                self.edges,
+                self.cores,
+                self.states,
+            ) = tables
+        self.ruleschanged = False
+
     def cleanup(self):
         """
         Remove recursive references to allow garbage
@@ -187,6 +752,8 @@ class PythonParser(GenericASTBuilder):
         print("%s%s ::= %s (%d)" % (prefix, rule[0], " ".join(rule[1]), last_token_pos))
 
     def error(self, instructions, index):
+        if self.trial_parse:
+            raise ParserError(instructions[index], instructions[index].offset)
         # Find the last line boundary
         start, finish = -1, -1
         for start in range(index, -1, -1):
@@ -250,10 +817,66 @@ class PythonParser(GenericASTBuilder):
             del args[0]  # save memory
         elif n == 1 and nt in self.optional_nt:
             rv = args[0]
+        elif n == 1 and args[0].kind in FAST_PATH_KINDS:
+            rv = args[0].attr
+        elif n == 1 and args[0].kind in CONST_COLLECTIONS:
+            rv = self.const_collection(nt, args[0])
         else:
             rv = GenericASTBuilder.nonterminal(self, nt, args)
         return rv
 
+    def const_collection(self, nt, token):
+        """Return the parse tree for list, set, tuple or dict `nt` that we
+        would have had, had the scanner not collapsed its instructions
+        into `token`. See Scanner.collapse_const_collections()."""
+        tokens = token.pattr
+        nonterminal = self.nonterminal
+        if nt != "dict":
+            exprs = [nonterminal("expr", [t]) for t in tokens[:-1]]
+            # Group the items as the rule added by
+            # customize_grammar_rules() does.
+            kids = []
+            n = len(exprs)
+            i = 0
+            for j in range(n // 1024):
+                kids.append(
+                    nonterminal(
+                        "expr1024",
+                        [
+                            nonterminal("expr32", exprs[k : k + 32])
+                            for k in range(i, i + 1024, 32)
+                        ],
+                    )
+                )
+                i += 1024
+            for j in range((n // 32) % 32):
+                kids.append(nonterminal("expr32", exprs[i : i + 32]))
+                i += 32
+            kids.extend(exprs[i:])
+            kids.append(tokens[-1])
+        elif tokens[-1].kind.startswith("BUILD_CONST_KEY_MAP"):
+            # Values, a tuple of the keys and BUILD_CONST_KEY_MAP
+            kids = [nonterminal("expr", [t]) for t in tokens[:-2]] + tokens[-2:]
+        elif tokens[-1].kind.startswith("BUILD_MAP"):
+            # 3.5+: key, value pairs and BUILD_MAP
+            build_map = tokens[-1]
+            kvlist = [nonterminal("expr", [t]) for t in tokens[:-1]] + [build_map]
+            kids = [nonterminal("kvlist_%s" % build_map.attr, kvlist)]
+        else:
+            # BUILD_MAP and then a value, a key and a STORE_MAP for
+            # each entry
+            build_map = tokens[0]
+            kvs = [
+                [nonterminal("expr", [v]), nonterminal("expr", [k]), store_map]
+                for v, k, store_map in zip(tokens[1::3], tokens[2::3], tokens[3::3])
+            ]
+            if self.version >= 3.0:
+                kvlist = [kid for kv in kvs for kid in kv]
+                kids = [build_map, nonterminal("kvlist_%s" % build_map.attr, kvlist)]
+            else:
+                kids = [build_map] + [nonterminal("kv3", kv) for kv in kvs]
+        return nonterminal(nt, kids)
+
     def __ambiguity(self, children):
         # only for debugging! to be removed hG/2000-10-15
         print(children)
@@ -630,6 +1253,12 @@ def parse(p, tokens, customize, code):
     return ast
 
 
+# Parsers with just the base grammar, one per (version, compile_mode,
+# is_pypy). Building one means collecting and splitting every p_*
+# docstring rule, so we do that once per process and hand out copies.
+_parser_cache = {}
+
+
 def get_python_parser(
     version, debug_parser=PARSER_DEFAULT_DEBUG, compile_mode="exec", is_pypy=False
 ):
@@ -638,12 +1267,32 @@ def get_python_parser(
     'exec', 'eval', or 'single'. See
     https://docs.python.org/3.6/library/functions.html#compile for an
     explanation of the different modes.
+
+    The parser returned is a private copy of a cached base-grammar parser,
+    so grammar rules added by customize_grammar_rules() don't leak into
+    other parsers.
     """
 
     # If version is a string, turn that into the corresponding float.
     if isinstance(version, str):
         version = py_str2float(version)
 
+    # Duplicate-rule reporting happens while the grammar is collected, and
+    # grammar coverage keeps per-parser counts, so build these afresh.
+    if debug_parser.get("dups", False) or "SPARK_PARSER_COVERAGE" in os.environ:
+        return _make_python_parser(version, debug_parser, compile_mode)
+
+    key = (version, compile_mode, is_pypy)
+    p = _parser_cache.get(key)
+    if p is None:
+        p = _make_python_parser(version, PARSER_DEFAULT_DEBUG, compile_mode)
+        _parser_cache[key] = p
+    return p.copy(debug_parser)
+
+
+def _make_python_parser(version, debug_parser, compile_mode):
+    """Build a new parser object for (float) Python *version*."""
+
     # FIXME: there has to be a better way...
     # We could do this as a table lookup, but that would force us
     # in import all of the parsers all of the time. Perhaps there is
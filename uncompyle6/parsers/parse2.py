@@ -277,6 +277,7 @@ class Python2Parser(PythonParser):
             (
                 "BUILD",
                 "CALL",
+                "CONST",
                 "CONTINUE",
                 "DELETE",
                 "DUP",
@@ -339,6 +340,15 @@ class Python2Parser(PythonParser):
                 )
                 self.add_unique_rules(["expr ::= %s" % collection, rule], customize)
                 continue
+            elif opname_base == "CONST":
+                # A collection of constants that the scanner has collapsed
+                # into one token; see Scanner.collapse_const_collections().
+                collection = opname[len("CONST_") :].lower()
+                self.add_unique_rules(
+                    ["expr ::= %s" % collection, "%s ::= %s" % (collection, opname)],
+                    customize,
+                )
+                continue
             elif opname_base == "BUILD_MAP":
                 if opname == "BUILD_MAP_n":
                     # PyPy sometimes has no count. Sigh.
@@ -688,7 +698,7 @@ class Python2Parser(PythonParser):
             # an optimization where the "and" jump_false is back to a loop.
             jmp_false = ast[1]
             if jmp_false[0] == "POP_JUMP_IF_FALSE":
-                while (first < last and isinstance(tokens[last].offset, str)):
+                while (first < last and tokens[last].text_offset):
                     last -= 1
                 if jmp_false[0].attr < tokens[last].offset:
                     return True
@@ -482,7 +482,7 @@ class Python26Parser(Python2Parser):
                     if last == len(tokens):
                         last -= 1
                     if tokens[last] == 'COME_FROM' and isinstance:
-                        last_offset = int(tokens[last].offset.split('_')[0])
+                        last_offset = tokens[last].off2int(prefer_last=False)
                         return else_start >= last_offset
 
 
@@ -313,11 +313,11 @@ class Python27Parser(Python2Parser):
                     jmp_target = test[1][0].attr
                     if last == len(tokens):
                         last -= 1
-                    while (isinstance(tokens[first].offset, str) and first < last):
+                    while (tokens[first].text_offset and first < last):
                         first += 1
                     if first == last:
                         return True
-                    while (first < last and isinstance(tokens[last].offset, str)):
+                    while (first < last and tokens[last].text_offset):
                         last -= 1
                     return tokens[first].off2int() < jmp_target < tokens[last].off2int()
                     pass
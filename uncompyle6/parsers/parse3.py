@@ -668,6 +668,7 @@ class Python3Parser(PythonParser):
             (
                 "BUILD",
                 "CALL",
+                "CONST",
                 "CONTINUE",
                 "DELETE",
                 "GET",
@@ -758,6 +759,14 @@ class Python3Parser(PythonParser):
                 self.addRule(rule, nop_func)
                 rule = "expr ::= build_list_unpack"
                 self.addRule(rule, nop_func)
+            elif opname_base == "CONST":
+                # A collection of constants that the scanner has collapsed
+                # into one token; see Scanner.collapse_const_collections().
+                collection = opname[len("CONST_") :].lower()
+                self.add_unique_rules(
+                    ["expr ::= %s" % collection, "%s ::= %s" % (collection, opname)],
+                    customize,
+                )
             elif opname_base in ("BUILD_MAP", "BUILD_MAP_UNPACK"):
                 kvlist_n = "kvlist_%s" % token.attr
                 if opname == "BUILD_MAP_n":
@@ -1650,7 +1659,7 @@ class Python3Parser(PythonParser):
             ):
                 # jump_back should be right before COME_FROM_LOOP?
                 last += 1
-            while last < len(tokens) and isinstance(tokens[last].offset, str):
+            while last < len(tokens) and tokens[last].text_offset:
                 last += 1
             if last < len(tokens):
                 offset = tokens[last].offset
@@ -1678,7 +1687,7 @@ class Python3Parser(PythonParser):
             # if SETUP_LOOP target spans the else part, then this is
             # not while1else. Also do for whileTrue?
             last += 1
-            while last < n and isinstance(tokens[last].offset, str):
+            while last < n and tokens[last].text_offset:
                 last += 1
             if last == n:
                 return False
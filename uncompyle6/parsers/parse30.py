@@ -323,11 +323,11 @@ class Python30Parser(Python31Parser):
                     jmp_false = testfalse[1]
                     if last == len(tokens):
                         last -= 1
-                    while (isinstance(tokens[first].offset, str) and first < last):
+                    while (tokens[first].text_offset and first < last):
                         first += 1
                     if first == last:
                         return True
-                    while (first < last and isinstance(tokens[last].offset, str)):
+                    while (first < last and tokens[last].text_offset):
                         last -= 1
                     if rule[0] == "iflaststmtl":
                         return not (jmp_false[0].attr <= tokens[last].offset)
@@ -115,6 +115,7 @@ class Python37BaseParser(PythonParser):
                 "BEFORE",
                 "BUILD",
                 "CALL",
+                "CONST",
                 "CONTINUE",
                 "DELETE",
                 "FORMAT",
@@ -331,6 +332,15 @@ class Python37BaseParser(PythonParser):
                 rule = "expr ::= build_list_unpack"
                 self.addRule(rule, nop_func)
 
+            elif opname_base == "CONST":
+                # A collection of constants that the scanner has collapsed
+                # into one token; see Scanner.collapse_const_collections().
+                collection = opname[len("CONST_") :].lower()
+                self.add_unique_rules(
+                    ["expr ::= %s" % collection, "%s ::= %s" % (collection, opname)],
+                    customize,
+                )
+
             elif opname_base in ("BUILD_MAP", "BUILD_MAP_UNPACK"):
 
                 if opname == "BUILD_MAP_UNPACK":
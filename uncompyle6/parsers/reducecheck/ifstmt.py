@@ -16,10 +16,7 @@ def ifstmt(self, lhs, n, rule, ast, tokens, first, last):
     l = last
     if l == n:
         l -= 1
-    if isinstance(tokens[l].offset, str):
-        last_offset = int(tokens[l].offset.split("_")[0], 10)
-    else:
-        last_offset = tokens[l].offset
+    last_offset = tokens[l].off2int(prefer_last=False)
     for i in range(first, l):
         t = tokens[i]
         # instead of POP_JUMP_IF, should we use op attributes?
@@ -8,6 +8,10 @@ if PYTHON3:
 
 
 class SyntaxTree(spark_AST):
+    # Set on the root of a transformed tree to the global and nonlocal
+    # name tokens found in it. See TreeTransform.transform().
+    name_tokens = None
+
     def __init__(self, *args, **kwargs):
         super(SyntaxTree, self).__init__(*args, **kwargs)
         self.transformed_by = None
@@ -21,53 +25,60 @@ class SyntaxTree(spark_AST):
         return self.__repr1__("", None)
 
     def __repr1__(self, indent, sibNum=None):
-        rv = str(self.kind)
-        if sibNum is not None:
-            rv = "%2d. %s" % (sibNum, rv)
-        enumerate_children = False
-        if len(self) > 1:
-            rv += " (%d)" % (len(self))
-            enumerate_children = True
-        if self.transformed_by is not None:
-            if self.transformed_by is True:
-                rv += " (transformed)"
-            else:
-                rv += " (transformed by %s)" % self.transformed_by
-        rv = indent + rv
-        indent += "    "
-        i = 0
-        for node in self:
-            if hasattr(node, "__repr1__"):
-                if enumerate_children:
-                    child = node.__repr1__(indent, i)
-                else:
-                    child = node.__repr1__(indent, None)
-            else:
+        # Trees can be deep, so rather than recursing, keep a stack of
+        # (node, indent, sibNum) for the nodes still to format.
+        lines = []
+        stack = [(self, indent, sibNum)]
+        while stack:
+            node, indent, sibNum = stack.pop()
+            if not isinstance(node, SyntaxTree):
+                if hasattr(node, "__repr1__"):
+                    lines.append(node.__repr1__(indent, sibNum))
+                    continue
                 inst = node.format(line_prefix="")
                 if inst.startswith("\n"):
                     # Nuke leading \n
                     inst = inst[1:]
-                if enumerate_children:
-                    child = indent + "%2d. %s" % (i, inst)
+                if sibNum is not None:
+                    lines.append(indent + "%2d. %s" % (sibNum, inst))
+                else:
+                    lines.append(indent + inst)
+                continue
+
+            rv = str(node.kind)
+            if sibNum is not None:
+                rv = "%2d. %s" % (sibNum, rv)
+            enumerate_children = False
+            if len(node) > 1:
+                rv += " (%d)" % (len(node))
+                enumerate_children = True
+            if node.transformed_by is not None:
+                if node.transformed_by is True:
+                    rv += " (transformed)"
                 else:
-                    child = indent + inst
-                pass
-            rv += "\n" + child
-            i += 1
-        return rv
+                    rv += " (transformed by %s)" % node.transformed_by
+            lines.append(indent + rv)
+            indent += "    "
+            i = len(node)
+            for child in reversed(node):
+                i -= 1
+                stack.append((child, indent, i if enumerate_children else None))
+        return "\n".join(lines)
 
     def first_child(self):
-        if len(self) > 0:
-            child = self[0]
+        node = self
+        while len(node) > 0:
+            child = node[0]
             if not isinstance(child, SyntaxTree):
                 return child
-            return child.first_child()
-        return self
+            node = child
+        return node
 
     def last_child(self):
-        if len(self) > 0:
-            child = self[-1]
+        node = self
+        while len(node) > 0:
+            child = node[-1]
             if not isinstance(child, SyntaxTree):
                 return child
-            return child.last_child()
-        return self
+            node = child
+        return node
@@ -0,0 +1,207 @@
+#  Copyright (c) 2020 by Rocky Bernstein
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Decompile many bytecode files using a pool of worker processes.
+
+Files are handed out one at a time, largest first, to whichever worker
+is free. A file that takes longer than the per-file timeout is counted
+as failed and its worker is killed and replaced; a worker that dies is
+replaced too. Workers can also be replaced after a fixed number of files
+to bound their memory use. Totals are updated and shown as each file
+finishes.
+
+Each worker sends its results back on a pipe of its own, so that killing
+a worker can't leave a shared queue locked or half written.
+"""
+
+from __future__ import print_function
+
+import os, sys, time
+from multiprocessing import Pipe, Process, Queue
+
+try:
+    from multiprocessing.connection import wait
+except ImportError:
+    # Python before 3.3
+    def wait(connections, timeout):
+        end = time.time() + timeout
+        while True:
+            ready = [conn for conn in connections if conn.poll()]
+            if ready or time.time() >= end:
+                return ready
+            time.sleep(0.01)
+
+
+from uncompyle6.main import main, status_msg
+
+# How often, in seconds, we check for workers that are stuck or have died
+POLL_INTERVAL = 0.5
+
+
+def _worker(tasks, results, in_base, out_base, outfile, options):
+    while True:
+        filename = tasks.get()
+        if filename is None:
+            break
+        try:
+            counts = main(in_base, out_base, [filename], [], outfile, **options)
+        except KeyboardInterrupt:
+            break
+        except Exception as e:
+            sys.stderr.write("\n# file %s\n# %s\n" % (filename, e))
+            counts = (1, 0, 1, 0, 0)
+        results.send((filename, tuple(counts)))
+
+
+class _Worker(object):
+    def __init__(self, worker_id, args):
+        self.worker_id = worker_id
+        self.tasks = Queue()
+        self.results, results = Pipe(duplex=False)
+        self.process = Process(target=_worker, args=(self.tasks, results) + args)
+        self.process.daemon = True
+        self.process.start()
+        # Only the worker writes to the pipe, so that we see end-of-file
+        # when it dies.
+        results.close()
+        self.filename = None
+        self.started = None
+        self.files_done = 0
+
+    def give(self, filename):
+        self.tasks.put(filename)
+        self.filename = filename
+        self.started = time.time()
+
+    def stop(self):
+        self.tasks.put(None)
+        self.process.join()
+        self.results.close()
+
+    def kill(self):
+        self.process.terminate()
+        self.process.join()
+        self.results.close()
+
+
+def pool_main(
+    in_base,
+    out_base,
+    compiled_files,
+    outfile=None,
+    numproc=2,
+    timeout=None,
+    max_worker_files=None,
+    **options
+):
+    """Like main() but spread `compiled_files` over `numproc` worker
+    processes.
+
+    timeout	 number of seconds after which a file is counted as failed
+    max_worker_files replace a worker after it has done this many files
+
+    The remaining keyword parameters are passed on to main().
+    Returns the same totals as main().
+    """
+    do_verify = options.get("do_verify", None)
+
+    def size(filename):
+        try:
+            return os.path.getsize(os.path.join(in_base, filename))
+        except OSError:
+            return 0
+
+    # Largest files last, since we pop() from the end.
+    pending = sorted(compiled_files, key=size)
+    totals = [0, 0, 0, 0, 0]
+    args = (in_base, out_base, outfile, options)
+    workers = {}
+    next_id = [0]
+
+    def start_worker():
+        worker = _Worker(next_id[0], args)
+        workers[worker.worker_id] = worker
+        next_id[0] += 1
+        give_work(worker)
+
+    def give_work(worker):
+        if pending:
+            worker.give(pending.pop())
+        else:
+            worker.stop()
+            del workers[worker.worker_id]
+
+    def report(filename, counts):
+        for i in range(len(totals)):
+            totals[i] += counts[i]
+        sys.stdout.write(
+            "%s -- %s\n"
+            % (
+                os.path.join(in_base, filename),
+                status_msg(do_verify, *(totals[:4] + [do_verify] + totals[4:])),
+            )
+        )
+        sys.stdout.flush()
+
+    def replace(worker, why):
+        sys.stderr.write(
+            "\n# file %s\n# %s\n" % (os.path.join(in_base, worker.filename), why)
+        )
+        worker.kill()
+        del workers[worker.worker_id]
+        report(worker.filename, (1, 0, 1, 0, 0))
+        if pending:
+            start_worker()
+
+    try:
+        for i in range(min(numproc, len(pending))):
+            start_worker()
+
+        while workers:
+            by_pipe = dict((worker.results, worker) for worker in workers.values())
+            for conn in wait(list(by_pipe.keys()), POLL_INTERVAL):
+                worker = by_pipe[conn]
+                try:
+                    filename, counts = conn.recv()
+                except EOFError:
+                    # The worker died; it is replaced below.
+                    worker.process.join()
+                    continue
+                report(filename, counts)
+                worker.filename = None
+                worker.files_done += 1
+                if max_worker_files and worker.files_done >= max_worker_files:
+                    worker.stop()
+                    del workers[worker.worker_id]
+                    if pending:
+                        start_worker()
+                else:
+                    give_work(worker)
+
+            now = time.time()
+            for worker in list(workers.values()):
+                if worker.filename is None:
+                    continue
+                if timeout and now - worker.started > timeout:
+                    replace(worker, "timed out after %s seconds" % timeout)
+                elif not worker.process.is_alive():
+                    replace(
+                        worker, "worker exited with code %s" % worker.process.exitcode
+                    )
+    finally:
+        for worker in list(workers.values()):
+            worker.kill()
+
+    return tuple(totals)
@@ -0,0 +1,177 @@
+#  Copyright (c) 2020 by Rocky Bernstein
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Time and count what goes on while decompiling.
+
+A Profile is passed to decompile_file() or code_deparse(), which wrap
+each stage of decompilation in profile.phase(<name>). Phases are:
+
+  load                reading the bytecode file
+  ingest              turning a code object into tokens
+  find_jump_targets   the scanner's control-flow analysis ...
+  detect_control_flow ... and the per-instruction part of it
+  customize           adding grammar rules for the tokens
+  parse               Earley parsing
+  reduce_checks       reduce_is_invalid() checks made while parsing
+  check               checking the tree for grammar bugs
+  transform           TreeTransform.transform
+  globals             finding global and nonlocal names
+  gen_source          generating source text from the tree
+
+A phase entered while another one is running is subtracted from the
+outer one, so times add up to the time spent overall. For example the
+time to parse a nested function is counted under "parse" and not under
+"gen_source", where the function was reached.
+
+Counters are:
+
+  tokens              tokens handed to the parser
+  rules_added         grammar rules added for the tokens
+  earley_items        Earley items created while parsing
+  reduce_checks       reduce_is_invalid() calls
+
+Functions in `hooks` are called as hook(event, phase, profile), where
+event is "enter" or "exit", which can be used to feed another tracing
+tool.
+"""
+
+import time
+
+clock = getattr(time, "perf_counter", time.time)
+
+
+class Phase(object):
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.profile.enter(self.name)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profile.exit()
+
+
+class Profile(object):
+    def __init__(self, hooks=()):
+        self.times = {}
+        self.counts = {}
+        self.hooks = list(hooks)
+        self.stack = []
+        self.mark = None
+
+    def enter(self, name):
+        now = clock()
+        if self.stack:
+            outer = self.stack[-1]
+            self.times[outer] = self.times.get(outer, 0.0) + now - self.mark
+        self.stack.append(name)
+        self.mark = now
+        for hook in self.hooks:
+            hook("enter", name, self)
+
+    def exit(self):
+        now = clock()
+        name = self.stack.pop()
+        self.times[name] = self.times.get(name, 0.0) + now - self.mark
+        self.mark = now
+        for hook in self.hooks:
+            hook("exit", name, self)
+
+    def phase(self, name):
+        """Return a context manager that times a phase."""
+        return Phase(self, name)
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def wrap(self, name, fn):
+        """Return `fn` timed as phase `name`. Calls made while already in
+        that phase, such as recursive ones, are not timed separately."""
+
+        def timed(*args, **kwargs):
+            if self.stack and self.stack[-1] == name:
+                return fn(*args, **kwargs)
+            self.enter(name)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.exit()
+
+        return timed
+
+    def as_dict(self):
+        return {"times": dict(self.times), "counts": dict(self.counts)}
+
+
+class NoPhase(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+class NoProfile(object):
+    """A Profile that doesn't record anything. This is what is used
+    when no profile is asked for."""
+
+    no_phase = NoPhase()
+
+    def phase(self, name):
+        return self.no_phase
+
+    def count(self, name, n=1):
+        pass
+
+    def wrap(self, name, fn):
+        return fn
+
+
+NO_PROFILE = NoProfile()
+
+
+def instrument(profile, scanner=None, parser=None):
+    """Have `profile` time and count what goes on inside `scanner` and
+    `parser`. These should be instances used for just one
+    decompilation, since their methods are replaced."""
+    if scanner is not None:
+        scanner.ingest = profile.wrap("ingest", scanner.ingest)
+        for name in ("find_jump_targets", "detect_control_flow"):
+            if hasattr(scanner, name):
+                setattr(scanner, name, profile.wrap(name, getattr(scanner, name)))
+
+    if parser is not None:
+        add_rule = parser.addRule
+        make_set = parser.makeSet
+        reduce_is_invalid = profile.wrap("reduce_checks", parser.reduce_is_invalid)
+
+        def counted_add_rule(*args, **kwargs):
+            rule_count = len(parser.rule2func)
+            add_rule(*args, **kwargs)
+            profile.count("rules_added", len(parser.rule2func) - rule_count)
+
+        def counted_make_set(tokens, sets, i):
+            make_set(tokens, sets, i)
+            # Items are added to sets[i] only while it is being made.
+            profile.count("earley_items", len(sets[i]))
+
+        def counted_reduce_is_invalid(*args):
+            profile.count("reduce_checks")
+            return reduce_is_invalid(*args)
+
+        parser.addRule = counted_add_rule
+        parser.makeSet = counted_make_set
+        parser.reduce_is_invalid = counted_reduce_is_invalid
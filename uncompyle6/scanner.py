@@ -24,13 +24,17 @@ scanners, e.g. for Python 2.7 or 3.4.
 from __future__ import print_function
 
 from array import array
+from bisect import bisect_left, bisect_right
 from collections import namedtuple
+from copy import copy
 import sys
+import threading
 
 from uncompyle6 import PYTHON3, IS_PYPY
+from uncompyle6.scanners.blocks import BlockEnds
 from uncompyle6.scanners.tok import Token
 import xdis
-from xdis import Bytecode, canonic_python_version, code2num, instruction_size, extended_arg_val, next_offset
+from xdis import Bytecode, canonic_python_version, instruction_size, next_offset
 
 # The byte code versions we support.
 # Note: these all have to be floats
@@ -82,6 +86,209 @@ else:
     L65536 = long(65536)  # NOQA
 
 
+LineTuple = namedtuple("LineTuple", ["l_no", "next"])
+
+# Lists, sets, tuples and dicts with at least this many items, all of
+# them constants, are passed to the parser as a single token. See
+# Scanner.collapse_const_collections().
+CONST_COLLECTION_MIN = 10
+
+CONST_OPS = frozenset(("LOAD_CONST", "LOAD_STR"))
+
+# Instructions that end a simple statement, leaving the evaluation
+# stack as it was before the statement. See Scanner.find_split_offsets().
+STATEMENT_END_OPS = frozenset(
+    """
+    DELETE_ATTR DELETE_DEREF DELETE_FAST DELETE_GLOBAL DELETE_NAME
+    DELETE_SLICE+0 DELETE_SLICE+1 DELETE_SLICE+2 DELETE_SLICE+3 DELETE_SUBSCR
+    EXEC_STMT IMPORT_STAR POP_TOP PRINT_NEWLINE PRINT_NEWLINE_TO
+    STORE_ANNOTATION STORE_ATTR STORE_DEREF STORE_FAST STORE_GLOBAL STORE_NAME
+    STORE_SLICE+0 STORE_SLICE+1 STORE_SLICE+2 STORE_SLICE+3 STORE_SUBSCR
+    """.split()
+)
+
+
+class LinesIndex(object):
+    """
+    'List-map' which gives the line number of the op at an offset and
+    the offset of the first op on the following line, as a LineTuple.
+    It is indexed like a list with an entry for every byte of code,
+    but only keeps an entry for each line.
+    """
+
+    def __init__(self, linestarts, codelen):
+        # self.ends[i] is the offset just past the bytes that have
+        # self.entries[i] as their entry.
+        self.ends = []
+        self.entries = []
+        offset = 0
+        _, prev_line_no = linestarts[0]
+        for start_offset, line_no in linestarts[1:]:
+            if offset < start_offset:
+                self.ends.append(start_offset)
+                self.entries.append(LineTuple(prev_line_no, start_offset))
+                offset = start_offset
+            prev_line_no = line_no
+
+        # The remaining offsets are on the last line, and the
+        # non-existing line after it starts at the end of the code.
+        if offset < codelen:
+            self.ends.append(codelen)
+            self.entries.append(LineTuple(prev_line_no, codelen))
+            offset = codelen
+        self.length = offset
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, offset):
+        if offset < 0:
+            offset += self.length
+        if not 0 <= offset < self.length:
+            raise IndexError("lines index out of range")
+        return self.entries[bisect_right(self.ends, offset)]
+
+
+class PrevOpIndex(object):
+    """
+    'List-map' which gives the offset of the previous op, given the
+    offset of the current op as index. Like LinesIndex, this only keeps
+    an entry per instruction rather than per byte of code.
+    """
+
+    def __init__(self, op_starts, length):
+        # op_starts are the offsets of all of the ops, in order.
+        self.op_starts = op_starts
+        self.length = length
+        # Entries that have been assigned to, such as when an
+        # EXTENDED_ARG is folded into the op after it.
+        self.changed = {}
+
+    def __len__(self):
+        return self.length
+
+    def _check_index(self, offset):
+        if offset < 0:
+            offset += self.length
+        if not 0 <= offset < self.length:
+            raise IndexError("prev_op index out of range")
+        return offset
+
+    def __getitem__(self, offset):
+        offset = self._check_index(offset)
+        if self.changed and offset in self.changed:
+            return self.changed[offset]
+        if offset == 0:
+            return 0
+        return self.op_starts[bisect_right(self.op_starts, offset - 1) - 1]
+
+    def __setitem__(self, offset, prev_offset):
+        self.changed[self._check_index(offset)] = prev_offset
+
+
+class OpcodeIndex(object):
+    """
+    Index of the ops of a code object by opcode, so that the ops of
+    some kind in a range of offsets can be found without walking over
+    all of the code in between. It also records the jumps to each
+    target.
+    """
+
+    def __init__(self, ops, jump_ops, jumps):
+        # ops are (offset, opcode) pairs and jumps (offset, target)
+        # pairs for the ops in jump_ops, both in offset order. jumps
+        # is None when the targets are not known.
+        self.jump_ops = jump_ops
+        self.starts = []
+        self.offsets = {}
+        self.opcode_at = {}
+        for offset, op in ops:
+            self.starts.append(offset)
+            self.offsets.setdefault(op, []).append(offset)
+            self.opcode_at[offset] = op
+        if jumps is None:
+            self.sources = None
+        else:
+            self.sources = {}
+            for offset, target in jumps:
+                self.sources.setdefault(target, []).append(offset)
+            self.targets = sorted(self.sources)
+
+    def is_start(self, offset):
+        i = bisect_left(self.starts, offset)
+        return i < len(self.starts) and self.starts[i] == offset
+
+    def closest(self, start, end, instr, target):
+        """
+        Return the offsets from start up to but not including end of
+        the jumps in <instr> whose target is closest to <target>, and
+        the distance between them. Return None if <instr> holds ops
+        other than jumps, or the jump targets are not known.
+        """
+        ops = [op for op in self.offsets if op in instr]
+        if self.sources is None or not all(op in self.jump_ops for op in ops):
+            return None
+        targets = self.targets
+        # Work outwards from target through the targets on either side
+        # of it until some jump in the range goes to one of them.
+        right = bisect_left(targets, target)
+        left = right - 1
+        while left >= 0 or right < len(targets):
+            if right == len(targets) or (
+                left >= 0 and target - targets[left] <= targets[right] - target
+            ):
+                distance = target - targets[left]
+            else:
+                distance = targets[right] - target
+            result = []
+            for dest in (target - distance, target + distance):
+                if left >= 0 and targets[left] == dest:
+                    left -= 1
+                elif right < len(targets) and targets[right] == dest:
+                    right += 1
+                else:
+                    continue
+                sources = self.sources[dest]
+                lo, hi = bisect_left(sources, start), bisect_left(sources, end)
+                result.extend(
+                    offset
+                    for offset in sources[lo:hi]
+                    if self.opcode_at[offset] in ops
+                )
+            if result:
+                result.sort()
+                return result, distance
+        return [], None
+
+    def find(self, start, end, instr, target=None):
+        """
+        Return the offsets from start up to but not including end of
+        the ops in <instr>, in order. If <target> is given, ops which
+        are jumps but not to <target> may be left out.
+        """
+        ops = [op for op in self.offsets if op in instr]
+        if (
+            target is not None
+            and self.sources is not None
+            and all(op in self.jump_ops for op in ops)
+        ):
+            sources = self.sources.get(target, [])
+            lo, hi = bisect_left(sources, start), bisect_left(sources, end)
+            return [
+                offset
+                for offset in sources[lo:hi]
+                if self.opcode_at[offset] in ops
+            ]
+        result = []
+        for op in ops:
+            offsets = self.offsets[op]
+            lo, hi = bisect_left(offsets, start), bisect_left(offsets, end)
+            result.extend(offsets[lo:hi])
+        if len(ops) > 1:
+            result.sort()
+        return result
+
+
 class Code(object):
     """
     Class for representing code-objects.
@@ -108,8 +315,7 @@ class Scanner(object):
                 v_str = "opcode_%spypy" % (int(version * 10))
             else:
                 v_str = "opcode_%s" % (int(version * 10))
-            exec("from xdis.opcodes import %s" % v_str)
-            exec("self.opc = %s" % v_str)
+            self.opc = import_module("xdis.opcodes.%s" % v_str)
         else:
             raise TypeError("%s is not a Python version I know about" % version)
 
@@ -118,6 +324,22 @@ class Scanner(object):
         # FIXME: This weird Python2 behavior is not Python3
         self.resetTokenClass()
 
+    # What ingest() works out about a code object. See reset().
+    code_state = (
+        "code insts offset2inst_index lines linestarts prev prev_op load_asserts "
+        "split_offsets op_index inst_index block_ends next_stmt stmts structs loops "
+        "fixed_jumps except_targets ignore_if else_start not_continue "
+        "return_end_ifs setup_loop_targets setup_loops thens"
+    ).split()
+
+    def reset(self):
+        """
+        Forget about the code object last ingested, so that a scanner
+        which is kept around to be used again doesn't hold on to it.
+        """
+        for name in self.code_state:
+            self.__dict__.pop(name, None)
+
     def build_instructions(self, co):
         """
         Create a list of instructions (a structured object rather than
@@ -134,9 +356,60 @@ class Scanner(object):
         self.offset2inst_index = {}
         for i, inst in enumerate(self.insts):
             self.offset2inst_index[inst.offset] = i
+        self.split_offsets = self.find_split_offsets()
+        # Built on first use; see get_op_index(), get_inst_index() and
+        # get_block_ends().
+        self.op_index = self.inst_index = self.block_ends = None
 
         return bytecode
 
+    def find_split_offsets(self):
+        """Return the set of offsets of instructions where the code can be
+        cut into pieces that each parse as a list of statements.
+
+        These are instructions that start a line, right after an
+        instruction that ends a simple statement, so the evaluation stack
+        is empty. No jump may go to them or across them, so they aren't
+        inside a compound statement or an expression with control flow.
+        The code from one of them up to the next one has no jumps either:
+        a piece starting with an "if" can parse with the statements after
+        it taken as an "else" part.
+        """
+        insts = self.insts
+        offset2inst_index = self.offset2inst_index
+
+        # For each instruction, the change in the number of jumps that
+        # go across it or to it.
+        crossings = [0] * (len(insts) + 1)
+        for i, inst in enumerate(insts):
+            if inst.optype in ("jabs", "jrel"):
+                j = offset2inst_index.get(inst.argval)
+                if j is None:
+                    # We don't know where this goes.
+                    return frozenset()
+                first, last = min(i, j), max(i, j)
+                crossings[first + 1] += 1
+                crossings[last + 1] -= 1
+
+        split_offsets = set()
+        jumps = 0
+        candidate = None
+        for i, inst in enumerate(insts):
+            jumps += crossings[i]
+            if (
+                jumps == 0
+                and inst.starts_line is not None
+                and not inst.is_jump_target
+                and i > 0
+                and insts[i - 1].opname in STATEMENT_END_OPS
+            ):
+                if candidate is not None:
+                    split_offsets.add(candidate)
+                candidate = inst.offset
+            if inst.optype in ("jabs", "jrel"):
+                candidate = None
+        return frozenset(split_offsets)
+
     def build_lines_data(self, code_obj):
         """
         Generate various line-related helper data.
@@ -150,29 +423,7 @@ class Scanner(object):
             linestarts = [[0, 1]]
         self.linestarts = dict(linestarts)
 
-        # 'List-map' which shows line number of current op and offset of
-        # first op on following line, given offset of op as index
-        lines = []
-        LineTuple = namedtuple("LineTuple", ["l_no", "next"])
-
-        # Iterate through available linestarts, and fill
-        # the data for all code offsets encountered until
-        # last linestart offset
-        _, prev_line_no = linestarts[0]
-        offset = 0
-        for start_offset, line_no in linestarts[1:]:
-            while offset < start_offset:
-                lines.append(LineTuple(prev_line_no, start_offset))
-                offset += 1
-            prev_line_no = line_no
-
-        # Fill remaining offsets with reference to last line number
-        # and code length as start offset of following non-existing line
-        codelen = len(self.code)
-        while offset < codelen:
-            lines.append(LineTuple(prev_line_no, codelen))
-            offset += 1
-        return lines
+        return LinesIndex(linestarts, len(self.code))
 
     def build_prev_op(self):
         """
@@ -181,13 +432,14 @@ class Scanner(object):
         """
         code = self.code
         codelen = len(code)
+        op_starts = []
+        offset = 0
+        while offset < codelen:
+            op_starts.append(offset)
+            offset += instruction_size(code[offset], self.opc)
         # 2.x uses prev 3.x uses prev_op. Sigh
         # Until we get this sorted out.
-        self.prev = self.prev_op = [0]
-        for offset in self.op_range(0, codelen):
-            op = code[offset]
-            for _ in range(instruction_size(op, self.opc)):
-                self.prev_op.append(offset)
+        self.prev = self.prev_op = PrevOpIndex(op_starts, offset + 1)
 
     def is_jump_forward(self, offset):
         """
@@ -245,6 +497,88 @@ class Scanner(object):
             else:
                 print("%i\t%s\t" % (i, self.opname[op]))
 
+    def get_op_index(self):
+        """
+        Return the OpcodeIndex of the ops in self.code, building it on
+        first use.
+        """
+        if self.op_index is None:
+            jump_ops = self.opc.JREL_OPS | self.opc.JABS_OPS
+            code = self.code
+            ops = [(offset, code[offset]) for offset in self.prev_op.op_starts]
+            try:
+                jumps = [
+                    (offset, self.get_target(offset))
+                    for offset, op in ops
+                    if op in jump_ops
+                ]
+            except (AssertionError, IndexError, KeyError):
+                jumps = None
+            self.op_index = OpcodeIndex(ops, jump_ops, jumps)
+        return self.op_index
+
+    def get_inst_index(self):
+        """
+        Return the OpcodeIndex of the instructions in self.insts,
+        building it on first use.
+        """
+        if self.inst_index is None:
+            jump_ops = self.opc.JREL_OPS | self.opc.JABS_OPS
+            self.inst_index = OpcodeIndex(
+                [(inst.offset, inst.opcode) for inst in self.insts],
+                jump_ops,
+                [
+                    (inst.offset, inst.argval)
+                    for inst in self.insts
+                    if inst.opcode in jump_ops
+                ],
+            )
+        return self.inst_index
+
+    def get_block_ends(self):
+        """
+        Return the BlockEnds of the instructions in self.insts,
+        building it on first use.
+        """
+        if self.block_ends is None:
+            self.block_ends = BlockEnds(self.insts)
+        return self.block_ends
+
+    def end_finally(self, start, setup_ops):
+        """
+        Return the offset of the END_FINALLY from <start> on which closes
+        the block that starts there, counting the ops in <setup_ops> as
+        starting blocks of their own. Return None if there is none.
+        """
+        if start in self.offset2inst_index:
+            return self.get_block_ends().end_finally(
+                start, setup_ops, self.opc.END_FINALLY
+            )
+        count = 0
+        for offset in self.op_range(start, len(self.code)):
+            op = self.code[offset]
+            if op == self.opc.END_FINALLY:
+                if count == 0:
+                    return offset
+                count -= 1
+            elif op in setup_ops:
+                count += 1
+        return None
+
+    def op_offsets(self, start, end, instr, target=None):
+        """
+        Return the offsets of the ops in <instr> from start up to end,
+        in order. If <target> is given, jumps to somewhere else may
+        be left out.
+        """
+        index = self.get_op_index()
+        if index.is_start(start):
+            return index.find(start, end, instr, target)
+        # Walking from the middle of an op gives whatever op_range()
+        # makes of it.
+        code = self.code
+        return [offset for offset in self.op_range(start, end) if code[offset] in instr]
+
     def first_instr(self, start, end, instr, target=None, exact=True):
         """
         Find the first <instr> in the block from start to end.
@@ -262,21 +596,32 @@ class Scanner(object):
         if not isinstance(instr, list):
             instr = [instr]
 
+        if target is None:
+            offsets = self.op_offsets(start, end, instr)
+            return offsets[0] if offsets else None
+
+        for offset in self.op_offsets(start, end, instr, target):
+            if self.get_target(offset) == target:
+                return offset
+        if exact:
+            return None
+
+        # No jump goes to target, so look for the closest one.
         result_offset = None
         current_distance = len(code)
-        for offset in self.op_range(start, end):
-            op = code[offset]
-            if op in instr:
-                if target is None:
-                    return offset
-                dest = self.get_target(offset)
-                if dest == target:
-                    return offset
-                elif not exact:
-                    new_distance = abs(target - dest)
-                    if new_distance < current_distance:
-                        current_distance = new_distance
-                        result_offset = offset
+        index = self.get_op_index()
+        if index.is_start(start):
+            closest = index.closest(start, end, instr, target)
+            if closest is not None:
+                offsets, distance = closest
+                if offsets and distance < current_distance:
+                    result_offset = offsets[0]
+                return result_offset
+        for offset in self.op_offsets(start, end, instr):
+            new_distance = abs(target - self.get_target(offset))
+            if new_distance < current_distance:
+                current_distance = new_distance
+                result_offset = offset
         return result_offset
 
     def last_instr(self, start, end, instr, target=None, exact=True):
@@ -300,37 +645,36 @@ class Scanner(object):
         if not isinstance(instr, list):
             instr = [instr]
 
+        if target is None:
+            for offset in reversed(self.op_offsets(start, end, instr)):
+                if code[offset] != self.opc.EXTENDED_ARG:
+                    return offset
+            return None
+
+        for offset in reversed(self.op_offsets(start, end, instr, target)):
+            if code[offset] != self.opc.EXTENDED_ARG and self.get_target(offset) == target:
+                return offset
+        if exact:
+            return None
+
+        # No jump goes to target, so look for the closest one.
         result_offset = None
         current_distance = self.insts[-1].offset - self.insts[0].offset
-        extended_arg = 0
-        # FIXME: use self.insts rather than code[]
-        for offset in self.op_range(start, end):
-            op = code[offset]
-
-            if op == self.opc.EXTENDED_ARG:
-                arg = code2num(code, offset + 1) | extended_arg
-                extended_arg = extended_arg_val(self.opc, arg)
+        index = self.get_op_index()
+        if index.is_start(start):
+            closest = index.closest(start, end, instr, target)
+            if closest is not None:
+                offsets, distance = closest
+                if offsets and distance <= current_distance:
+                    result_offset = offsets[-1]
+                return result_offset
+        for offset in self.op_offsets(start, end, instr):
+            if code[offset] == self.opc.EXTENDED_ARG:
                 continue
-
-            if op in instr:
-                if target is None:
-                    result_offset = offset
-                else:
-                    dest = self.get_target(offset, extended_arg)
-                    if dest == target:
-                        current_distance = 0
-                        result_offset = offset
-                    elif not exact:
-                        new_distance = abs(target - dest)
-                        if new_distance <= current_distance:
-                            current_distance = new_distance
-                            result_offset = offset
-                            pass
-                        pass
-                    pass
-                pass
-            extended_arg = 0
-            pass
+            new_distance = abs(target - self.get_target(offset))
+            if new_distance <= current_distance:
+                current_distance = new_distance
+                result_offset = offset
         return result_offset
 
     def inst_matches(self, start, end, instr, target=None, include_beyond_target=False):
@@ -347,23 +691,32 @@ class Scanner(object):
         except:
             instr = [instr]
 
-        first = self.offset2inst_index[start]
+        # Check that start is the offset of an instruction.
+        self.offset2inst_index[start]
+
+        # The instruction at or after end is included too.
+        index = self.get_inst_index()
+        starts = index.starts
+        i = bisect_left(starts, end)
+        if i < len(starts):
+            end = starts[i] + 1
+
+        if include_beyond_target:
+            offsets = index.find(start, end, instr)
+        else:
+            offsets = index.find(start, end, instr, target)
+
+        if target is None:
+            return offsets
+
         result = []
-        for inst in self.insts[first:]:
-            if inst.opcode in instr:
-                if target is None:
-                    result.append(inst.offset)
-                else:
-                    t = self.get_target(inst.offset)
-                    if include_beyond_target and t >= target:
-                        result.append(inst.offset)
-                    elif t == target:
-                        result.append(inst.offset)
-                        pass
-                    pass
+        for offset in offsets:
+            t = self.get_target(offset)
+            if include_beyond_target and t >= target:
+                result.append(offset)
+            elif t == target:
+                result.append(offset)
                 pass
-            if inst.offset >= end:
-                break
             pass
 
         # FIXME: put in a test
@@ -393,30 +746,26 @@ class Scanner(object):
         except:
             instr = [instr]
 
-        result = []
-        extended_arg = 0
-        for offset in self.op_range(start, end):
-
-            op = code[offset]
+        if include_beyond_target:
+            offsets = self.op_offsets(start, end, instr)
+        else:
+            offsets = self.op_offsets(start, end, instr, target)
 
-            if op == self.opc.EXTENDED_ARG:
-                arg = code2num(code, offset + 1) | extended_arg
-                extended_arg = extended_arg_val(self.opc, arg)
+        result = []
+        for offset in offsets:
+            if code[offset] == self.opc.EXTENDED_ARG:
                 continue
 
-            if op in instr:
-                if target is None:
+            if target is None:
+                result.append(offset)
+            else:
+                t = self.get_target(offset)
+                if include_beyond_target and t >= target:
+                    result.append(offset)
+                elif t == target:
                     result.append(offset)
-                else:
-                    t = self.get_target(offset, extended_arg)
-                    if include_beyond_target and t >= target:
-                        result.append(offset)
-                    elif t == target:
-                        result.append(offset)
-                        pass
                     pass
                 pass
-            extended_arg = 0
             pass
 
         return result
@@ -477,6 +826,84 @@ class Scanner(object):
             new_instructions.append(inst)
         return new_instructions
 
+    def collapse_const_collections(self, tokens):
+        """Return `tokens` with the instructions that build a list, set,
+        tuple or dict out of constants replaced by one "CONST_LIST",
+        "CONST_SET", "CONST_TUPLE" or "CONST_DICT" token. Its attr is the
+        number of items and its pattr the tokens it replaces.
+
+        Generated data modules can have collections of tens of thousands
+        of constants. The grammar rule for each of those would have an
+        "expr" per item; with this, the whole collection is one token.
+        The parser puts back the usual parse tree for it, see
+        PythonParser.const_collection().
+        """
+        if self.is_pypy:
+            return tokens
+        version = self.version
+        new_tokens = []
+        i, n = 0, len(tokens)
+        while i < n:
+            token = tokens[i]
+            i += 1
+            kind = token.kind
+            if not kind.startswith("BUILD_") or not isinstance(token.attr, int):
+                new_tokens.append(token)
+                continue
+            items = token.attr
+            opname_base = kind[: kind.rfind("_")]
+            if opname_base in ("BUILD_LIST", "BUILD_SET", "BUILD_TUPLE"):
+                collection = opname_base[len("BUILD_") :]
+                count = items
+            elif opname_base == "BUILD_CONST_KEY_MAP":
+                # The values and then a tuple of the keys
+                collection = "DICT"
+                count = items + 1
+            elif opname_base == "BUILD_MAP" and version >= 3.5:
+                # Key, value pairs
+                collection = "DICT"
+                count = 2 * items
+            elif opname_base == "BUILD_MAP" and items >= CONST_COLLECTION_MIN:
+                # Before 3.5, BUILD_MAP comes first. Each entry is a value,
+                # a key and a STORE_MAP.
+                end = i + 3 * items
+                if end <= n and all(
+                    tokens[j].kind in CONST_OPS
+                    and tokens[j + 1].kind in CONST_OPS
+                    and tokens[j + 2].kind == "STORE_MAP"
+                    for j in range(i, end, 3)
+                ):
+                    run = tokens[i - 1 : end]
+                    new_tokens.append(self.const_collection_token("DICT", items, run))
+                    i = end
+                else:
+                    new_tokens.append(token)
+                continue
+            else:
+                new_tokens.append(token)
+                continue
+
+            if (
+                items >= CONST_COLLECTION_MIN
+                and count <= len(new_tokens)
+                and all(t.kind in CONST_OPS for t in new_tokens[-count:])
+            ):
+                run = new_tokens[-count:] + [token]
+                del new_tokens[-count:]
+                new_tokens.append(self.const_collection_token(collection, items, run))
+            else:
+                new_tokens.append(token)
+        return new_tokens
+
+    def const_collection_token(self, collection, items, run):
+        token = copy(run[0])
+        token.kind = "CONST_" + collection
+        token.attr = items
+        token.pattr = run
+        token.op = None
+        token.has_arg = True
+        return token
+
     def remove_mid_line_ifs(self, ifs):
         """
         Go through passed offsets, filtering ifs
@@ -518,8 +945,16 @@ def parse_fn_counts(argc):
     return ((argc & 0xFF), (argc >> 8) & 0xFF, (argc >> 16) & 0x7FFF)
 
 
-def get_scanner(version, is_pypy=False, show_asm=None):
+def import_module(name):
+    __import__(name)
+    return sys.modules[name]
+
 
+def scanner_version(version):
+    """
+    Return the float for Python version <version>, which can also be
+    a string, that we have a scanner for.
+    """
     # If version is a string, turn that into the corresponding float.
     if isinstance(version, str):
         if version not in canonic_python_version:
@@ -532,41 +967,52 @@ def get_scanner(version, is_pypy=False, show_asm=None):
             )
         version = CANONIC2VERSION[canonic_version]
 
-    # Pick up appropriate scanner
-    if version in PYTHON_VERSIONS:
-        v_str = "%s" % (int(version * 10))
-        try:
-            import importlib
+    if version not in PYTHON_VERSIONS:
+        raise RuntimeError("Unsupported Python version %s" % version)
+    return version
 
-            if is_pypy:
-                scan = importlib.import_module("uncompyle6.scanners.pypy%s" % v_str)
-            else:
-                scan = importlib.import_module("uncompyle6.scanners.scanner%s" % v_str)
-            if False:
-                print(scan)  # Avoid unused scan
-        except ImportError:
-            if is_pypy:
-                exec(
-                    "import uncompyle6.scanners.pypy%s as scan" % v_str,
-                    locals(),
-                    globals(),
-                )
-            else:
-                exec(
-                    "import uncompyle6.scanners.scanner%s as scan" % v_str,
-                    locals(),
-                    globals(),
-                )
-        if is_pypy:
-            scanner = eval(
-                "scan.ScannerPyPy%s(show_asm=show_asm)" % v_str, locals(), globals()
-            )
-        else:
-            scanner = eval(
-                "scan.Scanner%s(show_asm=show_asm)" % v_str, locals(), globals()
-            )
+
+def get_scanner(version, is_pypy=False, show_asm=None):
+    """Return a new scanner for Python <version>."""
+    version = scanner_version(version)
+
+    # Pick up appropriate scanner
+    v_str = "%s" % (int(version * 10))
+    if is_pypy:
+        scan = import_module("uncompyle6.scanners.pypy%s" % v_str)
+        return getattr(scan, "ScannerPyPy%s" % v_str)(show_asm=show_asm)
     else:
-        raise RuntimeError("Unsupported Python version %s" % version)
+        scan = import_module("uncompyle6.scanners.scanner%s" % v_str)
+        return getattr(scan, "Scanner%s" % v_str)(show_asm=show_asm)
+
+
+# The scanners handed out by shared_scanner(), for each thread, by
+# version and PyPy-ness.
+_shared = threading.local()
+
+
+def shared_scanner(version, is_pypy=False, show_asm=None):
+    """
+    Like get_scanner(), but the scanner for each version is only made
+    once, in a given thread, and then handed out again each time. It
+    is reset, and has its Token class and show_asm put back, before
+    being handed out.
+
+    Don't use this when the scanner is going to be changed, say by
+    profiling.instrument(), or when the scanner given out last time
+    may still be in use.
+    """
+    version = scanner_version(version)
+    scanners = getattr(_shared, "scanners", None)
+    if scanners is None:
+        scanners = _shared.scanners = {}
+    key = (version, bool(is_pypy))
+    scanner = scanners.get(key)
+    if scanner is None:
+        scanner = scanners[key] = get_scanner(version, is_pypy)
+    scanner.reset()
+    scanner.resetTokenClass()
+    scanner.show_asm = show_asm
     return scanner
 
 
@@ -0,0 +1,119 @@
+#  Copyright (c) 2020 by Rocky Bernstein
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Lookups on the block structure of a code object that the scanners would
+otherwise do by scanning back and forth over the code.
+
+BlockEnds matches SETUP_* instructions up with their END_FINALLY.
+StructList is the list of structures that detect_control_flow() finds,
+which also finds the innermost structure around an offset.
+"""
+
+from bisect import bisect_left
+
+
+class BlockEnds(object):
+    """
+    Where the blocks started in the instructions <insts> of a code
+    object end.
+    """
+
+    def __init__(self, insts):
+        self.insts = insts
+        self.offsets = [inst.offset for inst in insts]
+        self._end_finally_index = {}
+
+    def end_finally(self, start, setup_ops, end_finally_op):
+        """
+        Return the offset of the END_FINALLY that closes the block
+        starting at <start>: the first one from <start> on with as many
+        ops from <setup_ops> as END_FINALLYs between them. Return None
+        if there is no such END_FINALLY.
+        """
+        key = (frozenset(setup_ops), end_finally_op)
+        index = self._end_finally_index.get(key)
+        if index is None:
+            # Prefix counts used to match SETUP_* instructions with
+            # their END_FINALLY, made once for each set of setup ops.
+            # depth[i] is the number of setups less END_FINALLYs before
+            # instruction i; by_depth gives the instructions of the
+            # END_FINALLYs at each depth.
+            depth = []
+            by_depth = {}
+            count = 0
+            for i, inst in enumerate(self.insts):
+                depth.append(count)
+                if inst.opcode == end_finally_op:
+                    by_depth.setdefault(count, []).append(i)
+                    count -= 1
+                elif inst.opcode in setup_ops:
+                    count += 1
+            index = self._end_finally_index[key] = (depth, by_depth)
+        depth, by_depth = index
+        i = bisect_left(self.offsets, start)
+        if i == len(self.offsets):
+            return None
+        candidates = by_depth.get(depth[i], [])
+        j = bisect_left(candidates, i)
+        if j == len(candidates):
+            return None
+        return self.offsets[candidates[j]]
+
+
+class StructList(list):
+    """
+    The list of structures found by detect_control_flow(), each a dict
+    with "type", "start" and "end" keys. Structures are only added, and
+    innermost() is called with offsets that don't go down, so only the
+    structures around the current offset need to be looked at.
+    """
+
+    def __init__(self, structs):
+        list.__init__(self, structs)
+        self.seen = 0
+        self.offset = None
+        # Positions in the list of the structures which may hold the
+        # current offset or a later one.
+        self.open = []
+
+    def innermost(self, offset):
+        """
+        Return the structure which the scanners take to be the parent of
+        the instruction at <offset>: going through the list in order, the
+        last one to hold <offset> and to be inside the ones before it.
+        """
+        if self.offset is not None and offset < self.offset:
+            self.seen = 0
+            self.open = []
+        self.offset = offset
+        while self.seen < len(self):
+            self.open.append(self.seen)
+            self.seen += 1
+        self.open = [i for i in self.open if offset < self[i]["end"]]
+
+        parent = self[0]
+        start = parent["start"]
+        end = parent["end"]
+        for i in self.open:
+            struct = self[i]
+            current_start = struct["start"]
+            current_end = struct["end"]
+            if (current_start <= offset < current_end) and (
+                current_start >= start and current_end <= end
+            ):
+                start = current_start
+                end = current_end
+                parent = struct
+        return parent
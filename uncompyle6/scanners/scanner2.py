@@ -46,6 +46,7 @@ if PYTHON3:
     from sys import intern
 
 from uncompyle6.scanner import Scanner, Token
+from uncompyle6.scanners.blocks import StructList
 
 
 class Scanner2(Scanner):
@@ -298,7 +299,8 @@ class Scanner2(Scanner):
                             come_from_name,
                             jump_offset,
                             repr(jump_offset),
-                            offset="%s_%d" % (offset, jump_idx),
+                            offset=offset,
+                            offset2=jump_idx,
                             has_arg=True,
                         )
                     )
@@ -458,6 +460,8 @@ class Scanner2(Scanner):
                 pass
             pass
 
+        tokens = self.collapse_const_collections(tokens)
+
         if show_asm in ("both", "after"):
             for t in tokens:
                 print(t.format(line_prefix=""))
@@ -581,21 +585,14 @@ class Scanner2(Scanner):
                 self.not_continue.add(jmp)
                 return jmp
 
-        count_END_FINALLY = 0
-        count_SETUP_ = 0
-        for i in self.op_range(start, len(self.code)):
-            op = self.code[i]
-            if op == self.opc.END_FINALLY:
-                if count_END_FINALLY == count_SETUP_:
-                    if self.version == 2.7:
-                        assert self.code[self.prev[i]] in self.jump_forward | frozenset(
-                            [self.opc.RETURN_VALUE]
-                        )
-                    self.not_continue.add(self.prev[i])
-                    return self.prev[i]
-                count_END_FINALLY += 1
-            elif op in self.setup_ops:
-                count_SETUP_ += 1
+        i = self.end_finally(start, self.setup_ops)
+        if i is not None:
+            if self.version == 2.7:
+                assert self.code[self.prev[i]] in self.jump_forward | frozenset(
+                    [self.opc.RETURN_VALUE]
+                )
+            self.not_continue.add(self.prev[i])
+            return self.prev[i]
 
     def detect_control_flow(self, offset, op, extended_arg):
         """
@@ -605,22 +602,11 @@ class Scanner2(Scanner):
 
         code = self.code
 
-        # Detect parent structure
-        parent = self.structs[0]
+        # Detect parent structure: the inner-most one for our offset
+        parent = self.structs.innermost(offset)
         start = parent["start"]
         end = parent["end"]
 
-        # Pick inner-most parent for our offset
-        for struct in self.structs:
-            current_start = struct["start"]
-            current_end = struct["end"]
-            if (current_start <= offset < current_end) and (
-                current_start >= start and current_end <= end
-            ):
-                start = current_start
-                end = current_end
-                parent = struct
-
         if op == self.opc.SETUP_LOOP:
             # We categorize loop types: 'for', 'while', 'while 1' with
             # possibly suffixes '-loop' and '-else'
@@ -792,20 +778,9 @@ class Scanner2(Scanner):
             # Now isolate the except and else blocks
             end_else = start_else = self.get_target(self.prev[end_offset])
 
-            end_finally_offset = end_offset
-            setup_except_nest = 0
-            while end_finally_offset < len(self.code):
-                if self.code[end_finally_offset] == self.opc.END_FINALLY:
-                    if setup_except_nest == 0:
-                        break
-                    else:
-                        setup_except_nest -= 1
-                elif self.code[end_finally_offset] == self.opc.SETUP_EXCEPT:
-                    setup_except_nest += 1
-                end_finally_offset += instruction_size(
-                    code[end_finally_offset], self.opc
-                )
-                pass
+            end_finally_offset = self.end_finally(end_offset, [self.opc.SETUP_EXCEPT])
+            if end_finally_offset is None:
+                end_finally_offset = len(self.code)
 
             # Add the except blocks
             i = end_offset
@@ -1252,7 +1227,7 @@ class Scanner2(Scanner):
         """
         code = self.code
         n = len(code)
-        self.structs = [{"type": "root", "start": 0, "end": n - 1}]
+        self.structs = StructList([{"type": "root", "start": 0, "end": n - 1}])
         # All loop entry points
         self.loops = []
 
@@ -1313,7 +1288,7 @@ class Scanner2(Scanner):
                             source = self.setup_loops[label]
                         else:
                             source = offset
-                        targets[label] = targets.get(label, []) + [source]
+                        targets.setdefault(label, []).append(source)
                     elif not (
                         code[label] == self.opc.POP_TOP
                         and code[self.prev[label]] == self.opc.RETURN_VALUE
@@ -1346,7 +1321,7 @@ class Scanner2(Scanner):
                                     or self.code[source] != self.opc.SETUP_LOOP
                                     or self.code[label] != self.opc.JUMP_FORWARD
                                 ):
-                                    targets[label] = targets.get(label, []) + [source]
+                                    targets.setdefault(label, []).append(source)
                                 pass
                             pass
                         pass
@@ -1357,7 +1332,7 @@ class Scanner2(Scanner):
                 and self.version == 2.7
             ):
                 label = self.fixed_jumps[offset]
-                targets[label] = targets.get(label, []) + [offset]
+                targets.setdefault(label, []).append(offset)
                 pass
 
             extended_arg = 0
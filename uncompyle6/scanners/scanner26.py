@@ -139,14 +139,14 @@ class Scanner26(scan.Scanner2):
                     if jump_offset != last_jump_offset:
                         tokens.append(Token(
                             'COME_FROM', jump_offset, repr(jump_offset),
-                            offset="%s_%d" % (offset, jump_idx),
+                            offset=offset, offset2=jump_idx,
                             has_arg = True))
                         jump_idx += 1
                         last_jump_offset = jump_offset
             elif offset in self.thens:
                 tokens.append(Token(
                     'THEN', None, self.thens[offset],
-                    offset="%s_0" % offset,
+                    offset=offset, offset2=0,
                     has_arg = True))
 
             has_arg = (op >= self.opc.HAVE_ARGUMENT)
@@ -277,6 +277,8 @@ class Scanner26(scan.Scanner2):
                 pass
             pass
 
+        tokens = self.collapse_const_collections(tokens)
+
         if show_asm in ('both', 'after'):
             for t in tokens:
                 print(t.format(line_prefix=""))
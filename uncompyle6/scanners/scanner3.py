@@ -45,6 +45,7 @@ import xdis
 import xdis.opcodes.opcode_33 as op3
 
 from uncompyle6.scanner import Scanner
+from uncompyle6.scanners.blocks import StructList
 
 import sys
 from uncompyle6 import PYTHON3
@@ -331,7 +332,8 @@ class Scanner3(Scanner):
                             come_from_name,
                             jump_offset,
                             repr(jump_offset),
-                            offset="%s_%s" % (inst.offset, jump_idx),
+                            offset=inst.offset,
+                            offset2=jump_idx,
                             has_arg=True,
                             opc=self.opc,
                         )
@@ -537,6 +539,8 @@ class Scanner3(Scanner):
             )
             pass
 
+        tokens = self.collapse_const_collections(tokens)
+
         if show_asm in ("both", "after"):
             for t in tokens:
                 print(t.format(line_prefix=""))
@@ -555,7 +559,7 @@ class Scanner3(Scanner):
         """
         code = self.code
         n = len(code)
-        self.structs = [{"type": "root", "start": 0, "end": n - 1}]
+        self.structs = StructList([{"type": "root", "start": 0, "end": n - 1}])
 
         # All loop entry points
         self.loops = []
@@ -600,10 +604,10 @@ class Scanner3(Scanner):
                                 label = oparg
 
                 if label is not None and label != -1:
-                    targets[label] = targets.get(label, []) + [offset]
+                    targets.setdefault(label, []).append(offset)
             elif op == self.opc.END_FINALLY and offset in self.fixed_jumps:
                 label = self.fixed_jumps[offset]
-                targets[label] = targets.get(label, []) + [offset]
+                targets.setdefault(label, []).append(offset)
                 pass
 
             pass  # for loop
@@ -716,22 +720,11 @@ class Scanner3(Scanner):
         inst = self.insts[inst_index]
         op = inst.opcode
 
-        # Detect parent structure
-        parent = self.structs[0]
+        # Detect parent structure: the inner-most one for our offset
+        parent = self.structs.innermost(offset)
         start = parent["start"]
         end = parent["end"]
 
-        # Pick inner-most parent for our offset
-        for struct in self.structs:
-            current_start = struct["start"]
-            current_end = struct["end"]
-            if (current_start <= offset < current_end) and (
-                current_start >= start and current_end <= end
-            ):
-                start = current_start
-                end = current_end
-                parent = struct
-
         if self.version < 3.8 and op == self.opc.SETUP_LOOP:
             # We categorize loop types: 'for', 'while', 'while 1' with
             # possibly suffixes '-loop' and '-else'
@@ -22,7 +22,6 @@ This sets up opcodes Python's 3.8 and calls a generalized
 scanner routine for Python 3.7 and up.
 """
 
-from uncompyle6.scanners.tok import off2int
 from uncompyle6.scanners.scanner37 import Scanner37
 from uncompyle6.scanners.scanner37base import Scanner37Base
 
@@ -54,7 +53,7 @@ class Scanner38(Scanner37):
         jump_back_targets = {}
         for token in tokens:
             if token.kind == "JUMP_BACK":
-                jump_back_targets[token.attr] = token.offset
+                jump_back_targets[token.attr] = token.off2int(prefer_last=False)
                 pass
             pass
 
@@ -73,7 +72,7 @@ class Scanner38(Scanner37):
                 next_end = loop_ends[-1] if len(loop_ends) else tokens[len(tokens)-1].off2int() + 10
 
             if offset in jump_back_targets:
-                next_end = off2int(jump_back_targets[offset], prefer_last=False)
+                next_end = jump_back_targets[offset]
                 if self.debug:
                     print("%sadding loop offset %s ending at %s" %
                           ('  ' * len(loop_ends), offset, next_end))
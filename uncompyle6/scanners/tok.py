@@ -44,14 +44,37 @@ def off2int(offset, prefer_last=True):
             return offset_1
 
 
-class Token:
+class Token(object):
     """
     Class representing a byte-code instruction.
 
     A byte-code token is equivalent to Python 3's dis.instruction or
     the contents of one line as output by dis.dis().
+
+    Offsets are kept as integers. Tokens for instructions with an
+    EXTENDED_ARG and made-up tokens like COME_FROM have a second
+    offset number and show their offset as text, e.g. "10_12"; the
+    text is made only when the `offset` attribute is read.
     """
 
+    # Token streams can be large, so don't give each token a __dict__.
+    __slots__ = (
+        "kind",
+        "has_arg",
+        "attr",
+        "pattr",
+        "_offset",
+        "_offset2",
+        "text_offset",
+        "linestart",
+        "op",
+        "opc",
+        # Set by the fragments deparser
+        "parent",
+        "start",
+        "finish",
+    )
+
     # FIXME: match Python 3.4's terms:
     #    linestart = starts_line
     #    attr = argval
@@ -67,13 +90,18 @@ class Token:
         has_arg=None,
         opc=None,
         has_extended_arg=False,
+        offset2=None,
     ):
         self.kind = intern(opname)
         self.has_arg = has_arg
         self.attr = attr
         self.pattr = pattr
         if has_extended_arg:
-            self.offset = "%d_%d" % (offset, offset + 2)
+            offset2 = offset + 2
+        if offset2 is not None:
+            self._offset = offset
+            self._offset2 = offset2
+            self.text_offset = True
         else:
             self.offset = offset
 
@@ -93,6 +121,48 @@ class Token:
         else:
             self.op = op
 
+    @property
+    def offset(self):
+        """The offset as an int, or as a string like "10_12" when
+        `text_offset` is set."""
+        if not self.text_offset:
+            return self._offset
+        if self._offset2 is None:
+            return str(self._offset)
+        return "%d_%d" % (self._offset, self._offset2)
+
+    @offset.setter
+    def offset(self, offset):
+        if isinstance(offset, str):
+            offsets = offset.split("_")
+            self._offset = int(offsets[0])
+            self._offset2 = int(offsets[1]) if len(offsets) == 2 else None
+            self.text_offset = True
+        else:
+            self._offset = offset
+            self._offset2 = None
+            self.text_offset = False
+
+    def attrs(self):
+        """Return a dictionary of the attributes that are set, like the
+        __dict__ that tokens don't have."""
+        d = {"offset": self.offset}
+        for name in self.__slots__:
+            if name[0] != "_" and hasattr(self, name):
+                d[name] = getattr(self, name)
+        return d
+
+    def __getstate__(self):
+        return dict(
+            (name, getattr(self, name))
+            for name in self.__slots__
+            if hasattr(self, name)
+        )
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
     def __eq__(self, o):
         """ '==' on kind and "pattr" attributes.
             It is okay if offsets and linestarts are different"""
@@ -194,7 +264,12 @@ class Token:
         raise IndexError
 
     def off2int(self, prefer_last=True):
-        return off2int(self.offset, prefer_last)
+        """Like off2int() on our offset, but without making and parsing
+        its string form."""
+        offset_2 = self._offset2
+        if offset_2 is not None and self._offset + 2 == offset_2 and prefer_last:
+            return offset_2
+        return self._offset
 
 
 NoneToken = Token("LOAD_CONST", offset=-1, attr=None, pattr=None)
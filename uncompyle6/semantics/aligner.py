@@ -94,7 +94,7 @@ class AligningWalker(SourceWalker, object):
             self.prune()
 
 from xdis import iscode
-from uncompyle6.scanner import get_scanner
+from uncompyle6.scanner import shared_scanner
 from uncompyle6.show import (
     maybe_show_asm,
 )
@@ -122,7 +122,7 @@ def code_deparse_align(co, out=sys.stderr, version=None, is_pypy=None,
 
 
     # store final output stream for case of error
-    scanner = get_scanner(version, is_pypy=is_pypy)
+    scanner = shared_scanner(version, is_pypy=is_pypy)
 
     tokens, customize = scanner.ingest(co, code_objects=code_objects)
     show_asm = debug_opts.get('asm', None)
@@ -12,25 +12,35 @@ before reduction and don't reduce when there is a problem.
 def checker(ast, in_loop, errors):
     if ast is None:
         return
-    in_loop = (
-        in_loop
-        or ast.kind.startswith("for")
-        or ast.kind.startswith("while")
-        or ast.kind.startswith("async_for")
-    )
-    if ast.kind in ("aug_assign1", "aug_assign2") and ast[0][0] == "and":
-        text = str(ast)
-        error_text = (
-            "\n# improper augmented assigment (e.g. +=, *=, ...):\n#\t"
-            + "\n# ".join(text.split("\n"))
-            + "\n"
-        )
-        errors.append(error_text)
+    # Walk the tree using an explicit stack of (node, in_loop of its
+    # parent) so that deep trees don't hit the recursion limit. The root
+    # isn't checked for being outside of a loop.
+    stack = [(ast, None)]
+    while stack:
+        ast, parent_in_loop = stack.pop()
+        if parent_in_loop is not None:
+            if not parent_in_loop and ast.kind in ("continue", "break"):
+                text = str(ast)
+                error_text = "\n# not in loop:\n#\t" + "\n# ".join(text.split("\n"))
+                errors.append(error_text)
+            if not hasattr(ast, "__repr1__"):
+                continue
+        else:
+            parent_in_loop = in_loop
 
-    for node in ast:
-        if not in_loop and node.kind in ("continue", "break"):
-            text = str(node)
-            error_text = "\n# not in loop:\n#\t" + "\n# ".join(text.split("\n"))
+        in_loop = (
+            parent_in_loop
+            or ast.kind.startswith("for")
+            or ast.kind.startswith("while")
+            or ast.kind.startswith("async_for")
+        )
+        if ast.kind in ("aug_assign1", "aug_assign2") and ast[0][0] == "and":
+            text = str(ast)
+            error_text = (
+                "\n# improper augmented assigment (e.g. +=, *=, ...):\n#\t"
+                + "\n# ".join(text.split("\n"))
+                + "\n"
+            )
             errors.append(error_text)
-        if hasattr(node, "__repr1__"):
-            checker(node, in_loop, errors)
+
+        stack.extend((node, in_loop) for node in reversed(ast))
@@ -454,3 +454,43 @@ escape = re.compile(
         """,
     re.VERBOSE,
 )
+
+# Format strings that have been through compile_template()
+compiled_templates = {}
+
+
+def compile_template(fmt):
+    """Decode the escapes in template format string `fmt` using the
+    `escape` regular expression and return a tuple of (escapes, tail),
+    where tail is the text after the last escape. Each escape is a tuple
+    (prefix, child, type, expr, code): `child` is the n of %[n] or None
+    and, for %{...}, `expr` is the text in braces and `code` is that
+    compiled for eval(). Results are cached, so each format string is
+    scanned only once.
+    """
+    compiled = compiled_templates.get(fmt, None)
+    if compiled is not None:
+        return compiled
+    escapes = []
+    i = 0
+    m = escape.search(fmt)
+    while m:
+        i = m.end()
+        child = m.group("child")
+        if child is not None:
+            child = int(child)
+        typ = m.group("type") or "{"
+        expr = code = None
+        if typ == "{":
+            expr = m.group("expr")
+            if expr[:1] != "%":
+                try:
+                    code = compile(expr, "<template>", "eval")
+                except SyntaxError:
+                    # Leave it to eval() to report when the escape is used.
+                    pass
+        escapes.append((m.group("prefix"), child, typ, expr, code))
+        m = escape.search(fmt, i)
+    compiled = (tuple(escapes), fmt[i:])
+    compiled_templates[fmt] = compiled
+    return compiled
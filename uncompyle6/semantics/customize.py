@@ -16,13 +16,56 @@
 """Isolate Python version-specific semantic actions here.
 """
 
-from uncompyle6.semantics.consts import PRECEDENCE, TABLE_R, TABLE_DIRECT
+from uncompyle6.semantics.consts import PRECEDENCE, TABLE_R, TABLE_R0, TABLE_DIRECT
 
 from uncompyle6.parsers.treenode import SyntaxTree
 from uncompyle6.scanners.tok import Token
 
 
-def customize_for_version(self, is_pypy, version):
+class FrozenTable(dict):
+    """A template or precedence table that is shared, and so mustn't
+    be changed."""
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("template tables for a version are read-only")
+
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+
+# (TABLE_DIRECT, TABLE_R, TABLE_R0, PRECEDENCE) by (version, is_pypy)
+_version_tables = {}
+
+
+def version_tables(version, is_pypy):
+    """Return the TABLE_DIRECT, TABLE_R, TABLE_R0 and PRECEDENCE tables
+    for deparsing `version` bytecode. These are built the first time
+    they are asked for and then shared by all walkers for that version,
+    so a walker that needs to add entries must copy them.
+    """
+    key = (version, is_pypy)
+    tables = _version_tables.get(key, None)
+    if tables is None:
+        table_direct = dict(TABLE_DIRECT)
+        table_r = dict(TABLE_R)
+        precedence = dict(PRECEDENCE)
+        customize_tables_for_version(
+            table_direct, table_r, precedence, is_pypy, version
+        )
+        tables = (
+            FrozenTable(table_direct),
+            FrozenTable(table_r),
+            FrozenTable(TABLE_R0),
+            FrozenTable(precedence),
+        )
+        # Another thread may have got here first; use what it built.
+        tables = _version_tables.setdefault(key, tables)
+    return tables
+
+
+def customize_tables_for_version(TABLE_DIRECT, TABLE_R, PRECEDENCE, is_pypy, version):
+    """Add and change entries in the template and precedence tables
+    for `version`. See version_tables()."""
     if is_pypy:
         ########################
         # PyPy changes
@@ -65,9 +108,9 @@ def customize_for_version(self, is_pypy, version):
             TABLE_DIRECT.update(
                 {"del_deref_stmt": ("%|del %c\n", 0), "DELETE_DEREF": ("%{pattr}", 0)}
             )
-        from uncompyle6.semantics.customize3 import customize_for_version3
+        from uncompyle6.semantics.customize3 import customize_tables_for_version3
 
-        customize_for_version3(self, version)
+        customize_tables_for_version3(TABLE_DIRECT, TABLE_R, PRECEDENCE, version)
     else:  # < 3.0
         TABLE_DIRECT.update(
             {"except_cond3": ("%|except %c, %c:\n", (1, "expr"), (-2, "store"))}
@@ -80,6 +123,74 @@ def customize_for_version(self, is_pypy, version):
         else:
             TABLE_DIRECT.update({"comp_for": (" for %c in %c%c", 2, 0, 3)})
 
+        if version >= 2.5:
+            from uncompyle6.semantics.customize25 import customize_tables_for_version25
+
+            customize_tables_for_version25(TABLE_DIRECT, version)
+
+            if version >= 2.6:
+                from uncompyle6.semantics.customize26_27 import (
+                    customize_tables_for_version26_27,
+                )
+
+                customize_tables_for_version26_27(TABLE_DIRECT, version)
+                pass
+        else:  # < 2.5
+            TABLE_DIRECT.update(
+                {
+                    "importmultiple": ("%|import %c%c\n", 2, 3),
+                    "import_cont": (", %c", 2),
+                    "tryfinallystmt": (
+                        "%|try:\n%+%c%-%|finally:\n%+%c%-",
+                        (1, "suite_stmts_opt"),
+                        (5, "suite_stmts_opt"),
+                    ),
+                }
+            )
+            if version <= 2.3:
+                TABLE_DIRECT.update({"if1_stmt": ("%|if 1\n%+%c%-", 5)})
+                if version <= 2.1:
+                    TABLE_DIRECT.update(
+                        {
+                            "importmultiple": ("%c", 2),
+                            # FIXME: not quite right. We have indiividual imports
+                            # when there is in fact one: "import a, b, ..."
+                            "imports_cont": ("%C%,", (1, 100, "\n")),
+                        }
+                    )
+                    pass
+                pass
+            pass  # < 2.5
+
+        # < 3.0 continues
+
+        TABLE_R.update(
+            {
+                "STORE_SLICE+0": ("%c[:]", 0),
+                "STORE_SLICE+1": ("%c[%p:]", 0, (1, -1)),
+                "STORE_SLICE+2": ("%c[:%p]", 0, (1, -1)),
+                "STORE_SLICE+3": ("%c[%p:%p]", 0, (1, -1), (2, -1)),
+                "DELETE_SLICE+0": ("%|del %c[:]\n", 0),
+                "DELETE_SLICE+1": ("%|del %c[%c:]\n", 0, 1),
+                "DELETE_SLICE+2": ("%|del %c[:%c]\n", 0, 1),
+                "DELETE_SLICE+3": ("%|del %c[%c:%c]\n", 0, 1, 2),
+            }
+        )
+        TABLE_DIRECT.update({"raise_stmt2": ("%|raise %c, %c\n", 0, 1)})
+        pass  # < 3.0
+
+    return
+
+
+def customize_for_version(self, is_pypy, version):
+    """Add the version-specific semantic actions to walker `self`.
+    The version-specific templates are in self.TABLE_DIRECT and the
+    other tables from version_tables()."""
+    if version >= 3.0:
+        from uncompyle6.semantics.customize3 import customize_for_version3
+
+        customize_for_version3(self, version)
+    else:  # < 3.0
         if version >= 2.5:
             from uncompyle6.semantics.customize25 import customize_for_version25
 
@@ -126,17 +237,6 @@ def customize_for_version(self, is_pypy, version):
                     )
                 ],
             )
-            TABLE_DIRECT.update(
-                {
-                    "importmultiple": ("%|import %c%c\n", 2, 3),
-                    "import_cont": (", %c", 2),
-                    "tryfinallystmt": (
-                        "%|try:\n%+%c%-%|finally:\n%+%c%-",
-                        (1, "suite_stmts_opt"),
-                        (5, "suite_stmts_opt"),
-                    ),
-                }
-            )
             if version == 2.4:
                 def n_iftrue_stmt24(node):
                     self.template_engine(("%c", 0), node)
@@ -144,37 +244,10 @@ def customize_for_version(self, is_pypy, version):
                     self.prune()
 
                 self.n_iftrue_stmt24 = n_iftrue_stmt24
-            else:  # version <= 2.3:
-                TABLE_DIRECT.update({"if1_stmt": ("%|if 1\n%+%c%-", 5)})
-                if version <= 2.1:
-                    TABLE_DIRECT.update(
-                        {
-                            "importmultiple": ("%c", 2),
-                            # FIXME: not quite right. We have indiividual imports
-                            # when there is in fact one: "import a, b, ..."
-                            "imports_cont": ("%C%,", (1, 100, "\n")),
-                        }
-                    )
-                    pass
-                pass
             pass  # < 2.5
 
         # < 3.0 continues
 
-        TABLE_R.update(
-            {
-                "STORE_SLICE+0": ("%c[:]", 0),
-                "STORE_SLICE+1": ("%c[%p:]", 0, (1, -1)),
-                "STORE_SLICE+2": ("%c[:%p]", 0, (1, -1)),
-                "STORE_SLICE+3": ("%c[%p:%p]", 0, (1, -1), (2, -1)),
-                "DELETE_SLICE+0": ("%|del %c[:]\n", 0),
-                "DELETE_SLICE+1": ("%|del %c[%c:]\n", 0, 1),
-                "DELETE_SLICE+2": ("%|del %c[:%c]\n", 0, 1),
-                "DELETE_SLICE+3": ("%|del %c[%c:%c]\n", 0, 1, 2),
-            }
-        )
-        TABLE_DIRECT.update({"raise_stmt2": ("%|raise %c, %c\n", 0, 1)})
-
         # exec as a built-in statement is only in Python 2.x
         def n_exec_stmt(node):
             """
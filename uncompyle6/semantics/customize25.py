@@ -15,12 +15,10 @@
 """Isolate Python 2.5+ version-specific semantic actions here.
 """
 
-from uncompyle6.semantics.consts import TABLE_DIRECT
-
 #######################
 # Python 2.5+ Changes #
 #######################
-def customize_for_version25(self, version):
+def customize_tables_for_version25(TABLE_DIRECT, version):
 
     ########################
     # Import style for 2.5+
@@ -35,6 +33,9 @@ def customize_for_version25(self, version):
         'withasstmt':   ( '%|with %c as (%c):\n%+%c%-', 0, 2, 3),
     })
 
+
+def customize_for_version25(self, version):
+
     # In 2.5+ "except" handlers and the "finally" can appear in one
     # "try" statement. So the below has the effect of combining the
     # "tryfinally" with statement with the "try_except" statement.
@@ -15,9 +15,7 @@
 """Isolate Python 2.6 and 2.7 version-specific semantic actions here.
 """
 
-from uncompyle6.semantics.consts import TABLE_DIRECT
-
-def customize_for_version26_27(self, version):
+def customize_tables_for_version26_27(TABLE_DIRECT, version):
 
     ########################################
     # Python 2.6+
@@ -40,6 +38,9 @@ def customize_for_version26_27(self, version):
             'testtrue_then': ( 'not %p', (0, 22) ),
         })
 
+
+def customize_for_version26_27(self, version):
+
     # FIXME: this should be a transformation
     def n_call(node):
         mapping = self._get_mapping(node)
@@ -16,8 +16,6 @@
 """Isolate Python 3 version-specific semantic actions here.
 """
 
-from uncompyle6.semantics.consts import TABLE_DIRECT
-
 from xdis import co_flags_is_async, iscode
 from uncompyle6.scanner import Code
 from uncompyle6.semantics.helper import (
@@ -26,13 +24,22 @@ from uncompyle6.semantics.helper import (
 )
 
 from uncompyle6.semantics.make_function3 import make_function3_annotate
-from uncompyle6.semantics.customize35 import customize_for_version35
-from uncompyle6.semantics.customize36 import customize_for_version36
-from uncompyle6.semantics.customize37 import customize_for_version37
-from uncompyle6.semantics.customize38 import customize_for_version38
+from uncompyle6.semantics.customize35 import (
+    customize_for_version35,
+    customize_tables_for_version35,
+)
+from uncompyle6.semantics.customize36 import (
+    customize_for_version36,
+    customize_tables_for_version36,
+)
+from uncompyle6.semantics.customize37 import (
+    customize_for_version37,
+    customize_tables_for_version37,
+)
+from uncompyle6.semantics.customize38 import customize_tables_for_version38
 
 
-def customize_for_version3(self, version):
+def customize_tables_for_version3(TABLE_DIRECT, TABLE_R, PRECEDENCE, version):
     TABLE_DIRECT.update(
         {
             "comp_for": (" for %c in %c", (2, "store"), (0, "expr")),
@@ -58,6 +65,66 @@ def customize_for_version3(self, version):
         }
     )
 
+    if version == 3.0:
+        # In Python 3.0 there is code to move from _[dd] into
+        # the iteration variable. These rules we can ignore
+        # since we pick up the iteration variable some other way and
+        # we definitely don't include in the source  _[dd].
+        TABLE_DIRECT.update({
+            "ifstmt30":	( "%|if %c:\n%+%c%-",
+                          (0, "testfalse_then"),
+                          (1, "_ifstmts_jump30") ),
+            "ifnotstmt30": ( "%|if not %c:\n%+%c%-",
+                             (0, "testtrue_then"),
+                             (1, "_ifstmts_jump30") ),
+            "try_except30": ( "%|try:\n%+%c%-%c\n\n",
+                              (1, "suite_stmts_opt"),
+                              (4, "except_handler") ),
+
+            })
+
+    TABLE_DIRECT.update(
+        {
+            "tryelsestmtl3": (
+                "%|try:\n%+%c%-%c%|else:\n%+%c%-",
+                (1, "suite_stmts_opt"),
+                3, # "except_handler_else" or "except_handler"
+                (5, "else_suitel"),
+            ),
+            "LOAD_CLASSDEREF": ("%{pattr}",),
+        }
+    )
+    if version >= 3.4:
+        #######################
+        # Python 3.4+ Changes #
+        #######################
+        TABLE_DIRECT.update(
+            {
+                "LOAD_CLASSDEREF": ("%{pattr}",),
+                "yield_from": ("yield from %c", (0, "expr")),
+            }
+        )
+        if version >= 3.5:
+            customize_tables_for_version35(TABLE_DIRECT, PRECEDENCE, version)
+            if version >= 3.6:
+                customize_tables_for_version36(
+                    TABLE_DIRECT, TABLE_R, PRECEDENCE, version
+                )
+                if version >= 3.7:
+                    customize_tables_for_version37(TABLE_DIRECT, PRECEDENCE, version)
+                    if version >= 3.8:
+                        customize_tables_for_version38(
+                            TABLE_DIRECT, PRECEDENCE, version
+                        )
+                        pass  # version >= 3.8
+                    pass  # 3.7
+                pass  # 3.6
+            pass  # 3.5
+        pass  # 3.4
+    return
+
+
+def customize_for_version3(self, version):
     assert version >= 3.0
 
     # In 2.5+ and 3.0+ "except" handlers and the "finally" can appear in one
@@ -310,23 +377,6 @@ def customize_for_version3(self, version):
     self.n_classdef3 = n_classdef3
 
     if version == 3.0:
-        # In Python 3.0 there is code to move from _[dd] into
-        # the iteration variable. These rules we can ignore
-        # since we pick up the iteration variable some other way and
-        # we definitely don't include in the source  _[dd].
-        TABLE_DIRECT.update({
-            "ifstmt30":	( "%|if %c:\n%+%c%-",
-                          (0, "testfalse_then"),
-                          (1, "_ifstmts_jump30") ),
-            "ifnotstmt30": ( "%|if not %c:\n%+%c%-",
-                             (0, "testtrue_then"),
-                             (1, "_ifstmts_jump30") ),
-            "try_except30": ( "%|try:\n%+%c%-%c\n\n",
-                              (1, "suite_stmts_opt"),
-                              (4, "except_handler") ),
-
-            })
-
         def n_comp_iter(node):
             if node[0] == "expr":
                 n = node[0][0]
@@ -440,7 +490,7 @@ def customize_for_version3(self, version):
         # function_def_annotate we the name has been filled in.
         # But when derived from funcdefdeco it hasn't Would like a better
         # way to distinquish.
-        if self.f.getvalue()[-4:] == "def ":
+        if self.f.tail(4) == "def ":
             self.write(code.attr.co_name)
 
         # FIXME: handle and pass full annotate args
@@ -457,38 +507,13 @@ def customize_for_version3(self, version):
 
     self.n_mkfunc_annotate = n_mkfunc_annotate
 
-    TABLE_DIRECT.update(
-        {
-            "tryelsestmtl3": (
-                "%|try:\n%+%c%-%c%|else:\n%+%c%-",
-                (1, "suite_stmts_opt"),
-                3, # "except_handler_else" or "except_handler"
-                (5, "else_suitel"),
-            ),
-            "LOAD_CLASSDEREF": ("%{pattr}",),
-        }
-    )
-    if version >= 3.4:
-        #######################
-        # Python 3.4+ Changes #
-        #######################
-        TABLE_DIRECT.update(
-            {
-                "LOAD_CLASSDEREF": ("%{pattr}",),
-                "yield_from": ("yield from %c", (0, "expr")),
-            }
-        )
-        if version >= 3.5:
-            customize_for_version35(self, version)
-            if version >= 3.6:
-                customize_for_version36(self, version)
-                if version >= 3.7:
-                    customize_for_version37(self, version)
-                    if version >= 3.8:
-                        customize_for_version38(self, version)
-                        pass  # version >= 3.8
-                    pass  # 3.7
-                pass  # 3.6
-            pass  # 3.5
-        pass  # 3.4
+    if version >= 3.5:
+        customize_for_version35(self, version)
+        if version >= 3.6:
+            customize_for_version36(self, version)
+            if version >= 3.7:
+                customize_for_version37(self, version)
+                pass  # 3.7
+            pass  # 3.6
+        pass  # 3.5
     return
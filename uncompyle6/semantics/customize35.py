@@ -16,18 +16,14 @@
 """
 
 from xdis import co_flags_is_async, iscode
-from uncompyle6.semantics.consts import (
-    INDENT_PER_LEVEL,
-    PRECEDENCE,
-    TABLE_DIRECT,
-)
+from uncompyle6.semantics.consts import INDENT_PER_LEVEL
 
 from uncompyle6.semantics.helper import flatten_list, gen_function_parens_adjust
 
 #######################
 # Python 3.5+ Changes #
 #######################
-def customize_for_version35(self, version):
+def customize_tables_for_version35(TABLE_DIRECT, PRECEDENCE, version):
     TABLE_DIRECT.update(
         {
             # nested await expressions like:
@@ -56,6 +52,8 @@ def customize_for_version35(self, version):
         }
     )
 
+
+def customize_for_version35(self, version):
     def async_call(node):
         self.f.write("async ")
         node.kind == "call"
@@ -81,7 +79,7 @@ def customize_for_version35(self, version):
         # then the first * has already been printed.
         # Until I have a better way to check for CALL_FUNCTION_VAR,
         # will assume that if the text ends in *.
-        last_was_star = self.f.getvalue().endswith("*")
+        last_was_star = self.f.tail(1) == "*"
 
         if lastnodetype.startswith("BUILD_LIST"):
             self.write("[")
@@ -253,7 +251,7 @@ def customize_for_version35(self, version):
         # then the first * has already been printed.
         # Until I have a better way to check for CALL_FUNCTION_VAR,
         # will assume that if the text ends in *.
-        last_was_star = self.f.getvalue().endswith("*")
+        last_was_star = self.f.tail(1) == "*"
 
         if lastnodetype.startswith("BUILD_LIST"):
             self.write("[")
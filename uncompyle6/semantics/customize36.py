@@ -19,12 +19,7 @@ from xdis import iscode
 from spark_parser.ast import GenericASTTraversalPruningException
 from uncompyle6.scanners.tok import Token
 from uncompyle6.semantics.helper import flatten_list, escape_string, strip_quotes
-from uncompyle6.semantics.consts import (
-    INDENT_PER_LEVEL,
-    PRECEDENCE,
-    TABLE_DIRECT,
-    TABLE_R,
-)
+from uncompyle6.semantics.consts import INDENT_PER_LEVEL
 
 
 def escape_format(s):
@@ -36,7 +31,7 @@ def escape_format(s):
 #######################
 
 
-def customize_for_version36(self, version):
+def customize_tables_for_version36(TABLE_DIRECT, TABLE_R, PRECEDENCE, version):
     PRECEDENCE["call_kw"] = 0
     PRECEDENCE["call_kw36"] = 1
     PRECEDENCE["call_ex"] = 1
@@ -84,6 +79,8 @@ def customize_for_version36(self, version):
         }
     )
 
+
+def customize_for_version36(self, version):
     def build_unpack_tuple_with_call(node):
         n = node[0]
         if n == "expr":
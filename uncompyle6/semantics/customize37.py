@@ -16,13 +16,9 @@
 """
 
 import re
-from uncompyle6.semantics.consts import (
-    PRECEDENCE,
-    TABLE_DIRECT,
-    maxint,
-)
+from uncompyle6.semantics.consts import maxint
 
-def customize_for_version37(self, version):
+def customize_tables_for_version37(TABLE_DIRECT, PRECEDENCE, version):
     ########################
     # Python 3.7+ changes
     #######################
@@ -167,6 +163,8 @@ def customize_for_version37(self, version):
         }
     )
 
+
+def customize_for_version37(self, version):
     def gen_function_parens_adjust(mapping_key, node):
         """If we can avoid the outer parenthesis
         of a generator function, set the node key to
@@ -278,7 +276,7 @@ def customize_for_version37(self, version):
             self.template_engine(
                 ("%c(%p)",
                  (0, "expr"),
-                 (1, PRECEDENCE["yield"]-1)),
+                 (1, self.PRECEDENCE["yield"]-1)),
                 node)
             self.prec = p
             self.prune()
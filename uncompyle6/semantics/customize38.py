@@ -19,9 +19,7 @@
 # Python 3.8+ changes
 #######################
 
-from uncompyle6.semantics.consts import PRECEDENCE, TABLE_DIRECT
-
-def customize_for_version38(self, version):
+def customize_tables_for_version38(TABLE_DIRECT, PRECEDENCE, version):
 
     # FIXME: pytest doesn't add proper keys in testing. Reinstate after we have fixed pytest.
     # for lhs in 'for forelsestmt forelselaststmt '
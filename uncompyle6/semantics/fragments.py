@@ -70,7 +70,7 @@ import re
 from xdis import iscode, sysinfo2float
 from uncompyle6.semantics import pysource
 from uncompyle6 import parser
-from uncompyle6.scanner import Token, Code, get_scanner
+from uncompyle6.scanner import Token, Code, shared_scanner
 import uncompyle6.parser as python_parser
 from uncompyle6.semantics.check_ast import checker
 from uncompyle6 import IS_PYPY
@@ -79,15 +79,12 @@ from uncompyle6.show import maybe_show_asm, maybe_show_tree
 
 from uncompyle6.parsers.treenode import SyntaxTree
 
-from uncompyle6.semantics.pysource import ParserError, StringIO
+from uncompyle6.semantics.pysource import OutputBuffer, ParserError, StringIO
 
 from uncompyle6.semantics.consts import (
     INDENT_PER_LEVEL,
     NONE,
-    PRECEDENCE,
-    TABLE_DIRECT,
-    escape,
-    MAP,
+    compile_template,
     PASS,
 )
 
@@ -150,8 +147,6 @@ TABLE_DIRECT_FRAGMENT = {
 
 class FragmentsWalker(pysource.SourceWalker, object):
 
-    MAP_DIRECT_FRAGMENT = ()
-
     stacked_params = ("f", "indent", "is_lambda", "_globals")
 
     def __init__(
@@ -167,7 +162,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
         pysource.SourceWalker.__init__(
             self,
             version=version,
-            out=StringIO(),
+            out=OutputBuffer(),
             scanner=scanner,
             showast=showast,
             debug_parser=debug_parser,
@@ -188,9 +183,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
         self.last_finish = -1
         self.is_pypy = is_pypy
 
-        # FIXME: is there a better way?
-        global MAP_DIRECT_FRAGMENT
-        MAP_DIRECT_FRAGMENT = (dict(TABLE_DIRECT, **TABLE_DIRECT_FRAGMENT),)
+        self.MAP_DIRECT = (dict(self.TABLE_DIRECT, **TABLE_DIRECT_FRAGMENT),)
         return
 
     f = property(
@@ -237,22 +230,44 @@ class FragmentsWalker(pysource.SourceWalker, object):
         self.last_finish = finish
 
     def preorder(self, node=None):
-        start = len(self.f.getvalue())
-        super(pysource.SourceWalker, self).preorder(node)
-        self.set_pos_info(node, start, len(self.f.getvalue()))
+        """Like SourceWalker.preorder() but also records the span of
+        text written for each node."""
+        if node is None:
+            node = self.ast
+        dispatch = self.dispatch
+        # Each entry is a node, where its text starts and an iterator
+        # over the children left to do.
+        stack = []
+        while True:
+            start = self.f.tell()
+            try:
+                dispatch[node.kind](node)
+            except GenericASTTraversalPruningException:
+                self.set_pos_info(node, start, self.f.tell())
+            else:
+                stack.append((node, start, iter(node)))
 
-        return
+            node = None
+            while stack:
+                parent, start, kids = stack[-1]
+                node = next(kids, None)
+                if node is not None:
+                    break
+                stack.pop()
+                self.set_pos_info(parent, start, self.f.tell())
+            if node is None:
+                return
 
     def table_r_node(self, node):
         """General pattern where the last node should should
         get the text span attributes of the entire tree"""
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         try:
             self.default(node)
         except GenericASTTraversalPruningException:
             if not hasattr(node[-1], "parent"):
                 node[-1].parent = node
-            final = len(self.f.getvalue())
+            final = self.f.tell()
             self.set_pos_info(node, start, final)
             self.set_pos_info(node[-1], start, final)
             raise GenericASTTraversalPruningException
@@ -262,7 +277,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
     n_classdefco1 = n_classdefco2 = except_cond1 = except_cond2 = table_r_node
 
     def n_pass(self, node):
-        start = len(self.f.getvalue()) + len(self.indent)
+        start = self.f.tell() + len(self.indent)
         self.set_pos_info(node, start, start + len("pass"))
         self.default(node)
 
@@ -273,7 +288,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
         # to:
         #  'try_except':  ( '%|try%b:\n%+%c%-%c\n\n', 0, 1, 3 ),
 
-        start = len(self.f.getvalue()) + len(self.indent)
+        start = self.f.tell() + len(self.indent)
         self.set_pos_info(node[0], start, start + len("try:"))
         self.default(node)
 
@@ -281,78 +296,78 @@ class FragmentsWalker(pysource.SourceWalker, object):
 
     def n_raise_stmt0(self, node):
         assert node[0] == "RAISE_VARARGS_0"
-        start = len(self.f.getvalue()) + len(self.indent)
+        start = self.f.tell() + len(self.indent)
         try:
             self.default(node)
         except GenericASTTraversalPruningException:
-            self.set_pos_info(node[0], start, len(self.f.getvalue()))
+            self.set_pos_info(node[0], start, self.f.tell())
             self.prune()
 
     def n_raise_stmt1(self, node):
         assert node[1] == "RAISE_VARARGS_1"
-        start = len(self.f.getvalue()) + len(self.indent)
+        start = self.f.tell() + len(self.indent)
         try:
             self.default(node)
         except GenericASTTraversalPruningException:
-            self.set_pos_info(node[1], start, len(self.f.getvalue()))
+            self.set_pos_info(node[1], start, self.f.tell())
             self.prune()
 
     def n_raise_stmt2(self, node):
         assert node[2] == "RAISE_VARARGS_2"
-        start = len(self.f.getvalue()) + len(self.indent)
+        start = self.f.tell() + len(self.indent)
         try:
             self.default(node)
         except GenericASTTraversalPruningException:
-            self.set_pos_info(node[2], start, len(self.f.getvalue()))
+            self.set_pos_info(node[2], start, self.f.tell())
             self.prune()
 
     # FIXME: Isolate: only in Python 2.x.
     def n_raise_stmt3(self, node):
         assert node[3] == "RAISE_VARARGS_3"
-        start = len(self.f.getvalue()) + len(self.indent)
+        start = self.f.tell() + len(self.indent)
         try:
             self.default(node)
         except GenericASTTraversalPruningException:
-            self.set_pos_info(node[3], start, len(self.f.getvalue()))
+            self.set_pos_info(node[3], start, self.f.tell())
             self.prune()
 
     def n_return(self, node):
-        start = len(self.f.getvalue()) + len(self.indent)
+        start = self.f.tell() + len(self.indent)
         if self.params["is_lambda"]:
             self.preorder(node[0])
             if hasattr(node[-1], "offset"):
-                self.set_pos_info(node[-1], start, len(self.f.getvalue()))
+                self.set_pos_info(node[-1], start, self.f.tell())
             self.prune()
         else:
-            start = len(self.f.getvalue()) + len(self.indent)
+            start = self.f.tell() + len(self.indent)
             self.write(self.indent, "return")
             if self.return_none or node != SyntaxTree(
                 "return", [SyntaxTree("ret_expr", [NONE]), Token("RETURN_VALUE")]
             ):
                 self.write(" ")
-                self.last_finish = len(self.f.getvalue())
+                self.last_finish = self.f.tell()
                 self.preorder(node[0])
                 if hasattr(node[-1], "offset"):
-                    self.set_pos_info(node[-1], start, len(self.f.getvalue()))
+                    self.set_pos_info(node[-1], start, self.f.tell())
                     pass
                 pass
             else:
                 for n in node:
-                    self.set_pos_info_recurse(n, start, len(self.f.getvalue()))
+                    self.set_pos_info_recurse(n, start, self.f.tell())
                     pass
                 pass
-            self.set_pos_info(node, start, len(self.f.getvalue()))
+            self.set_pos_info(node, start, self.f.tell())
             self.println()
             self.prune()  # stop recursing
 
     def n_return_if_stmt(self, node):
 
-        start = len(self.f.getvalue()) + len(self.indent)
+        start = self.f.tell() + len(self.indent)
         if self.params["is_lambda"]:
             node[0].parent = node
             self.preorder(node[0])
         else:
-            start = len(self.f.getvalue()) + len(self.indent)
+            start = self.f.tell() + len(self.indent)
             self.write(self.indent, "return")
             if self.return_none or node != SyntaxTree(
                 "return", [SyntaxTree("ret_expr", [NONE]), Token("RETURN_END_IF")]
@@ -360,109 +375,109 @@ class FragmentsWalker(pysource.SourceWalker, object):
                 self.write(" ")
                 self.preorder(node[0])
                 if hasattr(node[-1], "offset"):
-                    self.set_pos_info(node[-1], start, len(self.f.getvalue()))
+                    self.set_pos_info(node[-1], start, self.f.tell())
             self.println()
-        self.set_pos_info(node, start, len(self.f.getvalue()))
+        self.set_pos_info(node, start, self.f.tell())
         self.prune()  # stop recursing
 
     def n_yield(self, node):
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         try:
             super(FragmentsWalker, self).n_yield(node)
         except GenericASTTraversalPruningException:
             pass
         if node != SyntaxTree("yield", [NONE, Token("YIELD_VALUE")]):
             node[0].parent = node
-        self.set_pos_info(node[-1], start, len(self.f.getvalue()))
-        self.set_pos_info(node, start, len(self.f.getvalue()))
+        self.set_pos_info(node[-1], start, self.f.tell())
+        self.set_pos_info(node, start, self.f.tell())
         self.prune()  # stop recursing
 
     # In Python 3.3+ only
     def n_yield_from(self, node):
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         try:
             super(FragmentsWalker, self).n_yield(node)
         except GenericASTTraversalPruningException:
             pass
         self.preorder(node[0])
-        self.set_pos_info(node, start, len(self.f.getvalue()))
+        self.set_pos_info(node, start, self.f.tell())
         self.prune()  # stop recursing
 
     def n_buildslice3(self, node):
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         try:
             super(FragmentsWalker, self).n_buildslice3(node)
         except GenericASTTraversalPruningException:
             pass
-        self.set_pos_info(node, start, len(self.f.getvalue()))
+        self.set_pos_info(node, start, self.f.tell())
         self.prune()  # stop recursing
 
     def n_buildslice2(self, node):
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         try:
             super(FragmentsWalker, self).n_buildslice2(node)
         except GenericASTTraversalPruningException:
             pass
-        self.set_pos_info(node, start, len(self.f.getvalue()))
+        self.set_pos_info(node, start, self.f.tell())
         self.prune()  # stop recursing
 
     def n_expr(self, node):
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         p = self.prec
         if node[0].kind.startswith("bin_op"):
             n = node[0][-1][0]
         else:
             n = node[0]
-        self.prec = PRECEDENCE.get(n.kind, -2)
+        self.prec = self.PRECEDENCE.get(n.kind, -2)
         if n == "LOAD_CONST" and repr(n.pattr)[0] == "-":
             n.parent = node
-            self.set_pos_info(n, start, len(self.f.getvalue()))
+            self.set_pos_info(n, start, self.f.tell())
             self.prec = 6
         if p < self.prec:
             self.write("(")
             node[0].parent = node
-            self.last_finish = len(self.f.getvalue())
+            self.last_finish = self.f.tell()
             self.preorder(node[0])
-            finish = len(self.f.getvalue())
+            finish = self.f.tell()
             if hasattr(node[0], "offset"):
-                self.set_pos_info(node[0], start, len(self.f.getvalue()))
+                self.set_pos_info(node[0], start, self.f.tell())
             self.write(")")
             self.last_finish = finish + 1
         else:
             node[0].parent = node
-            start = len(self.f.getvalue())
+            start = self.f.tell()
             self.preorder(node[0])
             if hasattr(node[0], "offset"):
-                self.set_pos_info(node[0], start, len(self.f.getvalue()))
+                self.set_pos_info(node[0], start, self.f.tell())
         self.prec = p
-        self.set_pos_info(node, start, len(self.f.getvalue()))
+        self.set_pos_info(node, start, self.f.tell())
         self.prune()
 
     def n_ret_expr(self, node):
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         super(FragmentsWalker, self).n_ret_expr(node)
-        self.set_pos_info(node, start, len(self.f.getvalue()))
+        self.set_pos_info(node, start, self.f.tell())
 
     def n_bin_op(self, node):
         """bin_op (formerly "binary_expr") is the Python AST BinOp"""
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         for n in node:
             n.parent = node
-        self.last_finish = len(self.f.getvalue())
+        self.last_finish = self.f.tell()
         try:
             super(FragmentsWalker, self).n_bin_op(node)
         except GenericASTTraversalPruningException:
             pass
-        self.set_pos_info(node, start, len(self.f.getvalue()))
+        self.set_pos_info(node, start, self.f.tell())
         self.prune()
 
     def n_LOAD_CONST(self, node):
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         try:
             super(FragmentsWalker, self).n_LOAD_CONST(node)
         except GenericASTTraversalPruningException:
             pass
-        self.set_pos_info(node, start, len(self.f.getvalue()))
+        self.set_pos_info(node, start, self.f.tell())
         self.prune()
 
     n_LOAD_STR = n_LOAD_CONST
@@ -472,13 +487,13 @@ class FragmentsWalker(pysource.SourceWalker, object):
         exec_stmt ::= expr exprlist DUP_TOP EXEC_STMT
         exec_stmt ::= expr exprlist EXEC_STMT
         """
-        start = len(self.f.getvalue()) + len(self.indent)
+        start = self.f.tell() + len(self.indent)
         try:
             super(FragmentsWalker, self).n_exec_stmt(node)
         except GenericASTTraversalPruningException:
             pass
-        self.set_pos_info(node, start, len(self.f.getvalue()))
-        self.set_pos_info(node[-1], start, len(self.f.getvalue()))
+        self.set_pos_info(node, start, self.f.tell())
+        self.set_pos_info(node[-1], start, self.f.tell())
         self.prune()  # stop recursing
 
     def n_ifelsestmtr(self, node):
@@ -500,7 +515,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
             self.default(node)
             return
 
-        start = len(self.f.getvalue()) + len(self.indent)
+        start = self.f.tell() + len(self.indent)
         self.write(self.indent, "if ")
         self.preorder(node[0])
         self.println(":")
@@ -538,7 +553,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
             self.indent_more()
         node[2][1].parent = node
         self.preorder(node[2][1])
-        self.set_pos_info(node, start, len(self.f.getvalue()))
+        self.set_pos_info(node, start, self.f.tell())
         self.indent_less()
         self.prune()
 
@@ -551,7 +566,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
                 self.default(node)
                 return
 
-        start = len(self.f.getvalue() + self.indent)
+        start = self.f.tell() + len(self.indent)
         self.write(self.indent, "elif ")
         node[0].parent = node
         self.preorder(node[0])
@@ -570,11 +585,11 @@ class FragmentsWalker(pysource.SourceWalker, object):
         node[2][1].parent = node
         self.preorder(node[2][1])
         self.indent_less()
-        self.set_pos_info(node, start, len(self.f.getvalue()))
+        self.set_pos_info(node, start, self.f.tell())
         self.prune()
 
     def n_alias(self, node):
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         iname = node[0].pattr
 
         store_import_node = node[-1][-1]
@@ -582,21 +597,21 @@ class FragmentsWalker(pysource.SourceWalker, object):
 
         sname = store_import_node.pattr
         self.write(iname)
-        finish = len(self.f.getvalue())
+        finish = self.f.tell()
         if iname == sname or iname.startswith(sname + "."):
             self.set_pos_info_recurse(node, start, finish)
         else:
             self.write(" as ")
-            sname_start = len(self.f.getvalue())
+            sname_start = self.f.tell()
             self.write(sname)
-            finish = len(self.f.getvalue())
+            finish = self.f.tell()
             for n in node[-1]:
                 self.set_pos_info_recurse(n, sname_start, finish)
             self.set_pos_info(node, start, finish)
         self.prune()  # stop recursing
 
     def n_mkfunc(self, node):
-        start = len(self.f.getvalue())
+        start = self.f.tell()
 
         if self.version >= 3.3 or node[-2] == "kwargs":
             # LOAD_CONST code object ..
@@ -611,13 +626,13 @@ class FragmentsWalker(pysource.SourceWalker, object):
             code_node = node[-2]
         func_name = code_node.attr.co_name
         self.write(func_name)
-        self.set_pos_info(code_node, start, len(self.f.getvalue()))
+        self.set_pos_info(code_node, start, self.f.tell())
 
         self.indent_more()
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         self.make_function(node, is_lambda=False, code_node=code_node)
 
-        self.set_pos_info(node, start, len(self.f.getvalue()))
+        self.set_pos_info(node, start, self.f.tell())
 
         if len(self.param_stack) > 1:
             self.write("\n\n")
@@ -643,7 +658,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
                 n = n[2]
         assert n == "lc_body"
         if node[0].kind.startswith("BUILD_LIST"):
-            start = len(self.f.getvalue())
+            start = self.f.tell()
             self.set_pos_info(node[0], start, start + 1)
         self.write("[ ")
         self.preorder(n[0])  # lc_body
@@ -700,18 +715,18 @@ class FragmentsWalker(pysource.SourceWalker, object):
 
         self.preorder(n[0])
         self.write(" for ")
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         store = ast[iter_index - 1]
         self.preorder(store)
-        self.set_pos_info(ast[iter_index - 1], start, len(self.f.getvalue()))
+        self.set_pos_info(ast[iter_index - 1], start, self.f.tell())
         self.write(" in ")
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         node[-3].parent = node
         self.preorder(node[-3])
-        self.set_pos_info(node[-3], start, len(self.f.getvalue()))
-        start = len(self.f.getvalue())
+        self.set_pos_info(node[-3], start, self.f.tell())
+        start = self.f.tell()
         self.preorder(ast[iter_index])
-        self.set_pos_info(ast[iter_index], start, len(self.f.getvalue()))
+        self.set_pos_info(ast[iter_index], start, self.f.tell())
         self.prec = p
 
     def comprehension_walk3(self, node, iter_index, code_index=-5):
@@ -799,23 +814,23 @@ class FragmentsWalker(pysource.SourceWalker, object):
         # for the dummy argument.
 
         self.preorder(n[0])
-        gen_start = len(self.f.getvalue()) + 1
+        gen_start = self.f.tell() + 1
         self.write(" for ")
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         if comp_store:
             self.preorder(comp_store)
         else:
             self.preorder(store)
 
-        self.set_pos_info(store, start, len(self.f.getvalue()))
+        self.set_pos_info(store, start, self.f.tell())
 
         # FIXME this is all merely approximate
         # from trepan.api import debug; debug()
         self.write(" in ")
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         node[-3].parent = node
         self.preorder(node[-3])
-        fin = len(self.f.getvalue())
+        fin = self.f.tell()
         self.set_pos_info(node[-3], start, fin, old_name)
 
         if ast == "list_comp":
@@ -838,7 +853,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
         self.prec = p
         self.name = old_name
         if node[-1].kind.startswith("CALL_FUNCTION"):
-            self.set_pos_info(node[-1], gen_start, len(self.f.getvalue()))
+            self.set_pos_info(node[-1], gen_start, self.f.tell())
 
     def listcomprehension_walk2(self, node):
         """List comprehensions the way they are done in Python 2 (and
@@ -886,35 +901,35 @@ class FragmentsWalker(pysource.SourceWalker, object):
 
         self.preorder(n[0])
         self.write(" for ")
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         self.preorder(store)
-        self.set_pos_info(store, start, len(self.f.getvalue()))
+        self.set_pos_info(store, start, self.f.tell())
         self.write(" in ")
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         node[-3].parent = node
         self.preorder(collection)
-        self.set_pos_info(collection, start, len(self.f.getvalue()))
+        self.set_pos_info(collection, start, self.f.tell())
         if list_if:
-            start = len(self.f.getvalue())
+            start = self.f.tell()
             self.preorder(list_if)
-            self.set_pos_info(list_if, start, len(self.f.getvalue()))
+            self.set_pos_info(list_if, start, self.f.tell())
 
         self.prec = p
 
     def n_generator_exp(self, node):
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         self.write("(")
         code_index = -6 if self.version > 3.2 else -5
         self.comprehension_walk(node, iter_index=3, code_index=code_index)
         self.write(")")
-        self.set_pos_info(node, start, len(self.f.getvalue()))
+        self.set_pos_info(node, start, self.f.tell())
         self.prune()
 
     def n_set_comp(self, node):
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         self.write("{")
         if node[0] in ["LOAD_SETCOMP", "LOAD_DICTCOMP"]:
-            start = len(self.f.getvalue())
+            start = self.f.tell()
             self.set_pos_info(node[0], start - 1, start)
             self.comprehension_walk3(node, 1, 0)
         elif node[0].kind == "load_closure":
@@ -922,27 +937,27 @@ class FragmentsWalker(pysource.SourceWalker, object):
         else:
             self.comprehension_walk(node, iter_index=4)
         self.write("}")
-        self.set_pos_info(node, start, len(self.f.getvalue()))
+        self.set_pos_info(node, start, self.f.tell())
         self.prune()
 
     # FIXME: Not sure if below is general. Also, add dict_comp_func.
     # 'set_comp_func': ("%|lambda %c: {%c for %c in %c%c}\n", 1, 3, 3, 1, 4)
     def n_set_comp_func(self, node):
-        setcomp_start = len(self.f.getvalue())
+        setcomp_start = self.f.tell()
         self.write(self.indent, "lambda ")
         param_node = node[1]
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         self.preorder(param_node)
-        self.set_pos_info(node[0], start, len(self.f.getvalue()))
+        self.set_pos_info(node[0], start, self.f.tell())
         self.write(": {")
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         assert node[0].kind.startswith("BUILD_SET")
         self.set_pos_info(node[0], start - 1, start)
         store = node[3]
         assert store == "store"
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         self.preorder(store)
-        fin = len(self.f.getvalue())
+        fin = self.f.tell()
         self.set_pos_info(store, start, fin)
         for_iter_node = node[2]
         assert for_iter_node.kind == "FOR_ITER"
@@ -951,11 +966,11 @@ class FragmentsWalker(pysource.SourceWalker, object):
         self.preorder(store)
         self.write(" in ")
         self.preorder(param_node)
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         self.preorder(node[4])
-        self.set_pos_info(node[4], start, len(self.f.getvalue()))
+        self.set_pos_info(node[4], start, self.f.tell())
         self.write("}")
-        fin = len(self.f.getvalue())
+        fin = self.f.tell()
         self.set_pos_info(node, setcomp_start, fin)
         if node[-2] == "RETURN_VALUE":
             self.set_pos_info(node[-2], setcomp_start, fin)
@@ -968,7 +983,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
             self.listcomprehension_walk2(node)
         else:
             if node[0] == "LOAD_LISTCOMP":
-                start = len(self.f.getvalue())
+                start = self.f.tell()
                 self.set_pos_info(node[0], start - 1, start)
             self.comprehension_walk_newer(node, 1, 0)
         self.write("]")
@@ -1023,17 +1038,17 @@ class FragmentsWalker(pysource.SourceWalker, object):
 
         self.preorder(n[0])
         self.write(" for ")
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         self.preorder(store)
-        self.set_pos_info(store, start, len(self.f.getvalue()))
+        self.set_pos_info(store, start, self.f.tell())
         self.write(" in ")
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         self.preorder(collection)
-        self.set_pos_info(collection, start, len(self.f.getvalue()))
+        self.set_pos_info(collection, start, self.f.tell())
         if list_if:
-            start = len(self.f.getvalue())
+            start = self.f.tell()
             self.preorder(list_if)
-            self.set_pos_info(list_if, start, len(self.f.getvalue()))
+            self.set_pos_info(list_if, start, self.f.tell())
         self.prec = p
 
     def n_classdef(self, node):
@@ -1049,7 +1064,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
                 buildclass = node[0]
 
             if buildclass[0] == "LOAD_BUILD_CLASS":
-                start = len(self.f.getvalue())
+                start = self.f.tell()
                 self.set_pos_info(buildclass[0], start, start + len("class") + 2)
 
             assert "mkfunc" == buildclass[1]
@@ -1101,7 +1116,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
             self.write("\n\n")
 
         self.currentclass = str(currentclass)
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         self.write(self.indent, "class ", self.currentclass)
 
         if self.version > 3.0:
@@ -1116,7 +1131,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
         self.indent_less()
 
         self.currentclass = cclass
-        self.set_pos_info(node, start, len(self.f.getvalue()))
+        self.set_pos_info(node, start, self.f.tell())
         if len(self.param_stack) > 1:
             self.write("\n\n")
         else:
@@ -1162,6 +1177,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
                 p_insts = self.p.insts
                 self.p.insts = self.scanner.insts
                 self.p.offset2inst_index = self.scanner.offset2inst_index
+                self.p.split_offsets = self.scanner.split_offsets
                 ast = python_parser.parse(self.p, tokens, customize)
                 self.p.insts = p_insts
             except (python_parser.ParserError, AssertionError) as e:
@@ -1200,6 +1216,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
             p_insts = self.p.insts
             self.p.insts = self.scanner.insts
             self.p.offset2inst_index = self.scanner.offset2inst_index
+            self.p.split_offsets = self.scanner.split_offsets
             ast = parser.parse(self.p, tokens, customize, code)
             self.p.insts = p_insts
         except (parser.ParserError, AssertionError) as e:
@@ -1275,10 +1292,10 @@ class FragmentsWalker(pysource.SourceWalker, object):
 
     def node_append(self, before_str, node_text, node):
         self.write(before_str)
-        self.last_finish = len(self.f.getvalue())
+        self.last_finish = self.f.tell()
         self.fixup_offsets(self.last_finish, node)
         self.write(node_text)
-        self.last_finish = len(self.f.getvalue())
+        self.last_finish = self.f.tell()
 
     # FIXME: duplicated from pysource, since we don't find self.params
     def traverse(self, node, indent=None, is_lambda=False):
@@ -1291,7 +1308,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
         self.pending_newlines = 0
         self.params = {
             "_globals": {},
-            "f": StringIO(),
+            "f": OutputBuffer(),
             "indent": indent,
             "is_lambda": is_lambda,
         }
@@ -1435,7 +1452,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
         if not (node == "build_list"):
             return
 
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         self.write("(")
         line_separator = ", "
         sep = ""
@@ -1446,13 +1463,13 @@ class FragmentsWalker(pysource.SourceWalker, object):
             sep = line_separator
 
         self.write(")")
-        self.set_pos_info(node, start, len(self.f.getvalue()))
+        self.set_pos_info(node, start, self.f.tell())
 
     def print_super_classes3(self, node):
 
         # FIXME: wrap superclasses onto a node
         # as a custom rule
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         n = len(node) - 1
 
         if node.kind != "expr":
@@ -1530,7 +1547,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
             pass
 
         self.write(")")
-        self.set_pos_info(node, start, len(self.f.getvalue()))
+        self.set_pos_info(node, start, self.f.tell())
 
     def n_dict(self, node):
         """
@@ -1543,7 +1560,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
         self.indent_more(INDENT_PER_LEVEL)
         line_seperator = ",\n" + self.indent
         sep = INDENT_PER_LEVEL[:-1]
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         if node[0] != "dict_entry":
             self.write("{")
         self.set_pos_info(node[0], start, start + 1)
@@ -1583,7 +1600,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
                 while i < len(l):
                     l[i].parent = kv_node
                     l[i + 1].parent = kv_node
-                    key_start = len(self.f.getvalue()) + len(sep)
+                    key_start = self.f.tell() + len(sep)
                     name = self.traverse(l[i + 1], indent="")
                     key_finish = key_start + len(name)
                     val_start = key_finish + 2
@@ -1690,7 +1707,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
 
                 pass
         self.write("}")
-        finish = len(self.f.getvalue())
+        finish = self.f.tell()
         self.set_pos_info(node, start, finish)
         self.indent_less(INDENT_PER_LEVEL)
         self.prec = p
@@ -1704,7 +1721,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
         self.prec = 100
         n = node.pop()
         lastnode = n.kind
-        start = len(self.f.getvalue())
+        start = self.f.tell()
         if lastnode.startswith("BUILD_LIST"):
             self.write("[")
             endchar = "]"
@@ -1753,7 +1770,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
         if len(node) == 1 and lastnode.startswith("BUILD_TUPLE"):
             self.write(",")
         self.write(endchar)
-        finish = len(self.f.getvalue())
+        finish = self.f.tell()
         n.parent = node.parent
         self.set_pos_info(n, start, finish)
         self.set_pos_info(node, start, finish)
@@ -1775,34 +1792,30 @@ class FragmentsWalker(pysource.SourceWalker, object):
         # print(entry[0])
         # print('======')
 
-        startnode_start = len(self.f.getvalue())
+        startnode_start = self.f.tell()
         start = startnode_start
 
-        fmt = entry[0]
+        escapes, tail = compile_template(entry[0])
         arg = 1
-        i = 0
         lastC = -1
         recurse_node = False
 
-        m = escape.search(fmt)
-        while m:
-            i = m.end()
-            self.write(m.group("prefix"))
+        for prefix, child, typ, expr, code in escapes:
+            self.write(prefix)
 
-            typ = m.group("type") or "{"
             node = startnode
             try:
-                if m.group("child"):
-                    node = node[int(m.group("child"))]
+                if child is not None:
+                    node = node[child]
                     node.parent = startnode
             except:
-                print(node.__dict__)
+                print(node.attrs() if isinstance(node, Token) else node.__dict__)
                 raise
 
             if typ == "%":
-                start = len(self.f.getvalue())
+                start = self.f.tell()
                 self.write("%")
-                self.set_pos_info(node, start, len(self.f.getvalue()))
+                self.set_pos_info(node, start, self.f.tell())
 
             elif typ == "+":
                 self.indent_more()
@@ -1817,11 +1830,11 @@ class FragmentsWalker(pysource.SourceWalker, object):
                 if lastC == 1:
                     self.write(",")
             elif typ == "b":
-                finish = len(self.f.getvalue())
+                finish = self.f.tell()
                 self.set_pos_info(node[entry[arg]], start, finish)
                 arg += 1
             elif typ == "c":
-                start = len(self.f.getvalue())
+                start = self.f.tell()
 
                 index = entry[arg]
                 if isinstance(index, tuple):
@@ -1839,7 +1852,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
                 )
                 self.preorder(node[index])
 
-                finish = len(self.f.getvalue())
+                finish = self.f.tell()
                 self.set_pos_info(node, start, finish)
                 arg += 1
             elif typ == "p":
@@ -1857,22 +1870,22 @@ class FragmentsWalker(pysource.SourceWalker, object):
                     (index, self.prec) = entry[arg]
 
                 node[index].parent = node
-                start = len(self.f.getvalue())
+                start = self.f.tell()
                 self.preorder(node[index])
-                self.set_pos_info(node, start, len(self.f.getvalue()))
+                self.set_pos_info(node, start, self.f.tell())
                 self.prec = p
                 arg += 1
             elif typ == "C":
                 low, high, sep = entry[arg]
                 lastC = remaining = len(node[low:high])
-                start = len(self.f.getvalue())
+                start = self.f.tell()
                 for subnode in node[low:high]:
                     self.preorder(subnode)
                     remaining -= 1
                     if remaining > 0:
                         self.write(sep)
 
-                self.set_pos_info(node, start, len(self.f.getvalue()))
+                self.set_pos_info(node, start, self.f.tell())
                 arg += 1
             elif typ == "D":
                 low, high, sep = entry[arg]
@@ -1909,8 +1922,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
                 arg += 1
 
             elif typ == "{":
-                d = node.__dict__
-                expr = m.group("expr")
+                d = node.attrs() if isinstance(node, Token) else node.__dict__
 
                 # Line mapping stuff
                 if (
@@ -1921,17 +1933,16 @@ class FragmentsWalker(pysource.SourceWalker, object):
                     self.source_linemap[self.current_line_number] = node.linestart
                 # Additional fragment-position stuff
                 try:
-                    start = len(self.f.getvalue())
-                    self.write(eval(expr, d, d))
-                    self.set_pos_info(node, start, len(self.f.getvalue()))
+                    start = self.f.tell()
+                    self.write(eval(code or expr, d, d))
+                    self.set_pos_info(node, start, self.f.tell())
                 except:
                     print(node)
                     raise
-            m = escape.search(fmt, i)
             pass
 
-        self.write(fmt[i:])
-        fin = len(self.f.getvalue())
+        self.write(tail)
+        fin = self.f.tell()
         if recurse_node:
             self.set_pos_info_recurse(startnode, startnode_start, fin)
         else:
@@ -1946,8 +1957,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
             self.set_pos_info(last_node, startnode_start, self.last_finish)
         return
 
-    @classmethod
-    def _get_mapping(cls, node):
+    def _get_mapping(self, node):
         if (
             hasattr(node, "data")
             and len(node) > 0
@@ -1955,7 +1965,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
             and not hasattr(node[-1], "parent")
         ):
             node[-1].parent = node
-        return MAP.get(node, MAP_DIRECT_FRAGMENT)
+        return self.MAP.get(node, self.MAP_DIRECT)
 
     pass
 
@@ -2024,7 +2034,7 @@ def code_deparse(
         version = sysinfo2float()
 
     # store final output stream for case of error
-    scanner = get_scanner(version, is_pypy=is_pypy)
+    scanner = shared_scanner(version, is_pypy=is_pypy)
 
     show_asm = debug_opts.get("asm", None)
     tokens, customize = scanner.ingest(co, code_objects=code_objects, show_asm=show_asm)
@@ -2186,11 +2196,8 @@ def deparsed_find(tup, deparsed, code):
     if (name, last_i) in deparsed.offsets.keys():
         nodeInfo = deparsed.offsets[name, last_i]
     else:
-        from uncompyle6.scanner import get_scanner
-
-        scanner = get_scanner(deparsed.version)
         co = code.co_code
-        if op_at_code_loc(co, last_i, scanner.opc) == "DUP_TOP":
+        if op_at_code_loc(co, last_i, deparsed.scanner.opc) == "DUP_TOP":
             offset = deparsed.scanner.next_offset(co[last_i], last_i)
             if (name, offset) in deparsed.offsets:
                 nodeInfo = deparsed.offsets[name, offset]
@@ -17,6 +17,9 @@ read_global_ops       = frozenset(('STORE_GLOBAL', 'DELETE_GLOBAL'))
 # NOTE: we also need to check that the variable name is a free variable, not a cell variable.
 nonglobal_ops         = frozenset(('STORE_DEREF',  'DELETE_DEREF'))
 
+# Tokens that TreeTransform.transform() collects in the tree's "name_tokens"
+name_ops = read_write_global_ops | nonglobal_ops
+
 def escape_string(s, quotes=('"', "'", '"""', "'''")):
     quote = None
     for q in quotes:
@@ -38,6 +41,11 @@ def escape_string(s, quotes=('"', "'", '"""', "'''")):
 # above global ops
 def find_all_globals(node, globs):
     """Search Syntax Tree node to find variable names that are global."""
+    if node.name_tokens is not None:
+        for n in node.name_tokens:
+            if n.kind in read_write_global_ops:
+                globs.add(n.pattr)
+        return globs
     for n in node:
         if isinstance(n, SyntaxTree):
             globs = find_all_globals(n, globs)
@@ -72,6 +80,18 @@ def find_code_node(node, start):
 def find_globals_and_nonlocals(node, globs, nonlocals, code, version):
     """search a node of parse tree to find variable names that need a
     either 'global' or 'nonlocal' statements added."""
+    if node.name_tokens is not None:
+        # A transformed tree has already noted the tokens we want.
+        for n in node.name_tokens:
+            if n.kind in read_global_ops:
+                globs.add(n.pattr)
+            elif (version >= 3.0
+                  and n.kind in nonglobal_ops
+                  and n.pattr in code.co_freevars
+                  and n.pattr != code.co_name
+                  and code.co_name != '<lambda>'):
+                nonlocals.add(n.pattr)
+        return globs, nonlocals
     for n in node:
         if isinstance(n, SyntaxTree):
             globs, nonlocals = find_globals_and_nonlocals(n, globs, nonlocals,
@@ -138,6 +158,20 @@ def gen_function_parens_adjust(mapping_key, node):
         pass
     return
 
+class DispatchTable(dict):
+    """What a tree walker calls for each kind of node, filled in the
+    first time a kind is seen by calling find_handler(kind). After that,
+    dispatching on a node is a single dictionary lookup."""
+
+    def __init__(self, find_handler):
+        dict.__init__(self)
+        self.find_handler = find_handler
+
+    def __missing__(self, kind):
+        handler = self[kind] = self.find_handler(kind)
+        return handler
+
+
 def print_docstring(self, indent, docstring):
     quote = '"""'
     if docstring.find(quote) >= 0:
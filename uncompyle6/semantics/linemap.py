@@ -26,11 +26,7 @@ class LineMapWalker(SourceWalker):
         """Augment write routine to keep track of current line"""
         for l in data:
             ## print("XXX write: '%s'" % l)
-            for i in str(l):
-                if i == '\n':
-                    self.current_line_number += 1
-                    pass
-                pass
+            self.current_line_number += str(l).count('\n')
             pass
         return super(LineMapWalker, self).write(*data)
 
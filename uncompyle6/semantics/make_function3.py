@@ -150,7 +150,7 @@ def make_function3_annotate(
     else:
         self.write("(")
 
-    last_line = self.f.getvalue().split("\n")[-1]
+    last_line = self.f.last_line()
     l = len(last_line)
     indent = " " * l
     line_number = self.line_number
@@ -0,0 +1,369 @@
+#  Copyright (c) 2020 by Rocky Bernstein
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Parse the nested code objects of a module in other processes.
+
+SourceWalker deparses functions, classes and comprehensions one at a
+time as it reaches them while generating source, so a module with
+thousands of functions is parsed on a single core. Here we collect all
+of the nested code objects up front, split them into contiguous runs,
+and have a pool of forked processes parse each run while the walker
+gets going. When the walker reaches a code object it takes the tree
+that was parsed for it instead of parsing it again.
+
+The grammar a code object is parsed with depends on the rules added for
+every code object parsed before it. So before the pool is forked, we
+scan every code object once, customize a parser for each in turn, and
+keep a copy of that parser as it is at the start of each run. Workers
+inherit the tokens and their run's parser, and only parse. A tree from
+a worker is only used if the grammar, the class name used in scanning
+and the massaged token stream all match what the walker has at that
+point; otherwise the walker parses the tokens itself. Either way the
+output is the same as when everything is done serially.
+"""
+
+import sys
+from io import BytesIO
+from types import ModuleType
+
+import multiprocessing
+
+try:
+    from multiprocessing import get_context
+except ImportError:
+    get_context = None
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+try:
+    import copyreg
+except ImportError:
+    import copy_reg as copyreg
+
+from xdis import iscode, COMPILER_FLAG_BIT
+from uncompyle6 import PYTHON3
+import uncompyle6.parser as python_parser
+from uncompyle6.scanner import Code, get_scanner
+
+COMPREHENSION_NAMES = frozenset(("<listcomp>", "<setcomp>", "<dictcomp>", "<genexpr>"))
+
+# Set in each worker process when the pool starts
+_job = None
+
+# The code objects of the NestedParses whose results are being unpickled
+_loading_codes = None
+
+
+def is_class_body(co):
+    return (
+        not (co.co_flags & COMPILER_FLAG_BIT["OPTIMIZED"])
+        and "__module__" in co.co_names
+    )
+
+
+def collect_code_objects(co):
+    """Return a list of (code, classname, is_lambda, noneInNames,
+    isTopLevel) for `co` and every code object nested inside it, in the
+    order SourceWalker usually reaches them. The other values are the
+    ones the walker will most likely scan and parse each code object
+    with.
+    """
+    codes = [(co, None, False, False, co.co_name == "<module>")]
+
+    def collect(parent, classname):
+        for c in parent.co_consts:
+            if not iscode(c):
+                continue
+            if is_class_body(c):
+                c_classname = c.co_name
+                codes.append((c, c_classname, False, False, False))
+            elif c.co_name in COMPREHENSION_NAMES:
+                c_classname = classname
+                codes.append((c, c_classname, False, False, False))
+            else:
+                c_classname = classname
+                codes.append(
+                    (c, c_classname, c.co_name == "<lambda>", "None" in c.co_names, False)
+                )
+            collect(c, c_classname)
+
+    collect(co, None)
+    return codes
+
+
+def code_key(code):
+    """A key identifying a code object that is the same for the code
+    object and for a scanner.Code made from it."""
+    # Python 1.x code objects have no co_firstlineno.
+    return (
+        id(code.co_code),
+        id(code.co_consts),
+        code.co_name,
+        getattr(code, "co_firstlineno", None),
+    )
+
+
+def grammar_state(p):
+    """The parts of parser `p` that can change how tokens are parsed."""
+    return (
+        frozenset(p.rules).union(p.rule2func),
+        frozenset(p.check_reduce.items()),
+        getattr(p, "is_pypy", None),
+    )
+
+
+def split_runs(codes, numproc):
+    """Split indices 1.. of `codes` into at most `numproc` contiguous runs
+    of about the same amount of bytecode."""
+    sizes = [len(c[0].co_code) for c in codes]
+    total = sum(sizes[1:])
+    runs = []
+    start = 1
+    done = 0
+    for i in range(1, len(codes)):
+        done += sizes[i]
+        if done * numproc >= total * (len(runs) + 1) or i == len(codes) - 1:
+            runs.append((start, i + 1))
+            start = i + 1
+    return runs
+
+
+def _start_worker(job):
+    global _job
+    _job = job
+
+
+# Code objects and opcode modules don't pickle. The parent process has
+# the same code objects, at the same indices, and the same modules.
+
+
+def _load_module(name):
+    __import__(name)
+    return sys.modules[name]
+
+
+def _load_code(i):
+    return _loading_codes[i][0]
+
+
+def _reduce_module(module):
+    return _load_module, (module.__name__,)
+
+
+def _reduce_code(co):
+    return _load_code, (_job["code_index"][id(co)],)
+
+
+def _persistent_id(obj):
+    # Python 2's cPickle has no per-pickler dispatch table.
+    if isinstance(obj, ModuleType):
+        return ("module", obj.__name__)
+    if iscode(obj):
+        return ("code", _job["code_index"][id(obj)])
+    return None
+
+
+def _persistent_load(pid):
+    what, value = pid
+    if what == "module":
+        return _load_module(value)
+    return _load_code(value)
+
+
+def dump_results(results):
+    out = BytesIO()
+    pickler = pickle.Pickler(out, pickle.HIGHEST_PROTOCOL)
+    if PYTHON3:
+        table = copyreg.dispatch_table.copy()
+        table[ModuleType] = _reduce_module
+        for code_type in set(type(c[0]) for c in _job["codes"]):
+            table[code_type] = _reduce_code
+        pickler.dispatch_table = table
+    else:
+        pickler.persistent_id = _persistent_id
+    pickler.dump(results)
+    return out.getvalue()
+
+
+def load_results(data, codes):
+    global _loading_codes
+    _loading_codes = codes
+    try:
+        unpickler = pickle.Unpickler(BytesIO(data))
+        unpickler.persistent_load = _persistent_load
+        return unpickler.load()
+    finally:
+        _loading_codes = None
+
+
+def scan_codes(walker, codes, starts):
+    """Scan and massage the tokens of each of `codes`, customizing a copy
+    of `walker`'s parser for each in turn. Return a list with, for each
+    code object, None if it isn't to be parsed or else (code, tokens,
+    customize, scanner state), and a dictionary of copies of the parser
+    as it is just before each of the indices in `starts`."""
+    # The walker has its scanner set up for the module; don't disturb it.
+    scanner = get_scanner(walker.version, walker.is_pypy)
+    p = walker.p.copy()
+    scanned = []
+    parsers = {}
+    for i, (co, classname, is_lambda, none_in_names, is_top) in enumerate(codes):
+        if i in starts:
+            parsers[i] = p.copy()
+        try:
+            code = Code(co, scanner, classname)
+            tokens, customize = code._tokens, code._customize
+            if not walker.prepare_tokens(tokens, is_lambda, none_in_names, is_top):
+                scanned.append(None)
+                continue
+            state = (
+                scanner.insts,
+                scanner.offset2inst_index,
+                scanner.split_offsets,
+                None if is_lambda else scanner.opc,
+            )
+            p.insts, p.offset2inst_index, p.split_offsets = state[:3]
+            # Customizing renames some tokens and adds to `customize`.
+            # The worker customizes again, so leave them as they were.
+            kinds = [t.kind for t in tokens]
+            p.customize_grammar_rules(tokens, dict(customize))
+            for t, kind in zip(tokens, kinds):
+                t.kind = kind
+        except Exception:
+            # The walker will run into this too and handle it.
+            scanned.append(None)
+            continue
+        scanned.append((code, tokens, customize, state))
+    return scanned, parsers
+
+
+def _parse_run(start, stop):
+    """Parse code objects start..stop-1 with the parser kept for the
+    start of the run. Return the pickled list of (index, token kinds,
+    grammar state, tree)."""
+    job = _job
+    p = job["parsers"][start]
+    results = []
+    for i in range(start, stop):
+        entry = job["scanned"][i]
+        if entry is None:
+            continue
+        code, tokens, customize, (insts, offset2inst_index, split_offsets, opc) = entry
+        p.insts = insts
+        p.offset2inst_index = offset2inst_index
+        p.split_offsets = split_offsets
+        if opc is not None:
+            p.opc = opc
+        try:
+            ast = python_parser.parse(p, tokens, customize, code)
+        except Exception:
+            # The walker will run into this too and handle it.
+            continue
+        results.append((i, tuple(t.kind for t in tokens), grammar_state(p), ast))
+
+    return dump_results(results)
+
+
+def _fork_context():
+    """Return what to make a Pool of forked processes with, or None if
+    we can't."""
+    # Workers get the code objects by inheriting them, so we need fork.
+    # Daemonic processes, like the -p workers in uncompyle6.pool, can't
+    # have children; we parse serially there.
+    if multiprocessing.current_process().daemon:
+        return None
+    if get_context is None:
+        if sys.platform == "win32":
+            return None
+        return multiprocessing
+    try:
+        return get_context("fork")
+    except ValueError:
+        return None
+
+
+class NestedParses(object):
+    def __init__(self, walker, co, numproc):
+        codes = collect_code_objects(co)
+        self.codes = codes
+        self.index = {}
+        for i in range(1, len(codes)):
+            self.index.setdefault(code_key(codes[i][0]), i)
+        self.results = {}
+        self.runs = []
+        self.pool = None
+        if len(codes) < 2:
+            return
+
+        context = _fork_context()
+        if context is None:
+            return
+        runs = split_runs(codes, numproc)
+        scanned, parsers = scan_codes(walker, codes, [start for start, _ in runs])
+        job = {
+            "scanned": scanned,
+            "parsers": parsers,
+            "codes": codes,
+            "code_index": dict((id(c[0]), i) for i, c in enumerate(codes)),
+        }
+        self.pool = context.Pool(numproc, _start_worker, (job,))
+        for start, stop in runs:
+            self.runs.append(
+                (start, stop, self.pool.apply_async(_parse_run, (start, stop)))
+            )
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def result(self, i):
+        """Return the worker's entry for code object `i`, waiting for it
+        if need be, or None if there isn't one."""
+        for run in self.runs:
+            start, stop, async_result = run
+            if start <= i < stop:
+                self.runs.remove(run)
+                try:
+                    for entry in load_results(async_result.get(), self.codes):
+                        self.results[entry[0]] = entry
+                except Exception:
+                    pass
+                break
+        return self.results.pop(i, None)
+
+    def parse(self, walker, tokens, customize, code):
+        """Do what uncompyle6.parser.parse() does for `walker`, using the
+        tree from a worker when it is valid. Return None if no worker
+        was given this code object."""
+        i = self.index.pop(code_key(code), None)
+        if i is None:
+            return None
+        entry = self.result(i)
+        p = walker.p
+        p.customize_grammar_rules(tokens, customize)
+        if entry is not None:
+            _, kinds, state, ast = entry
+            if (
+                self.codes[i][1] == walker.currentclass
+                and kinds == tuple(t.kind for t in tokens)
+                and state == grammar_state(p)
+            ):
+                return ast
+        return p.parse(tokens)
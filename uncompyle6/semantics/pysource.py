@@ -138,17 +138,22 @@ PYTHON3 = sys.version_info >= (3, 0)
 from xdis import iscode, COMPILER_FLAG_BIT, sysinfo2float
 
 from uncompyle6.parser import get_python_parser
+from uncompyle6.profiling import NO_PROFILE, instrument
 from uncompyle6.parsers.treenode import SyntaxTree
-from spark_parser import GenericASTTraversal, DEFAULT_DEBUG as PARSER_DEFAULT_DEBUG
-from uncompyle6.scanner import Code, get_scanner
+from spark_parser import (
+    GenericASTTraversal,
+    GenericASTTraversalPruningException,
+    DEFAULT_DEBUG as PARSER_DEFAULT_DEBUG,
+)
+from uncompyle6.scanner import Code, get_scanner, shared_scanner
 import uncompyle6.parser as python_parser
 from uncompyle6.semantics.make_function2 import make_function2
 from uncompyle6.semantics.make_function3 import make_function3
 from uncompyle6.semantics.make_function36 import make_function36
 from uncompyle6.semantics.parser_error import ParserError
-from uncompyle6.semantics.check_ast import checker
-from uncompyle6.semantics.customize import customize_for_version
+from uncompyle6.semantics.customize import customize_for_version, version_tables
 from uncompyle6.semantics.helper import (
+    DispatchTable,
     print_docstring,
     find_code_node,
     find_globals_and_nonlocals,
@@ -167,12 +172,10 @@ from uncompyle6.semantics.consts import (
     NAME_MODULE,
     TAB,
     INDENT_PER_LEVEL,
-    TABLE_R,
-    MAP_DIRECT,
+    MAP_R,
     MAP,
-    PRECEDENCE,
     ASSIGN_TUPLE_PARAM,
-    escape,
+    compile_template,
     minint,
 )
 
@@ -195,8 +198,122 @@ class SourceWalkerError(Exception):
         return self.errmsg
 
 
+class OutputBuffer(object):
+    """
+    What traverse() collects source text in. The strings written are
+    kept in a list and only joined by getvalue(). A buffer returned by
+    traverse_buffer() can be given to SourceWalker.write(), which adds
+    its strings to the parent's list, so the text of nested code isn't
+    copied at each level. Semantic actions that need to see what was
+    written last should use tail() or last_line(), which only look at
+    the last few strings.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        # Number of characters written
+        self.length = 0
+
+    def write(self, s):
+        if s:
+            self.chunks.append(s)
+            self.length += len(s)
+
+    def write_chunks(self, chunks):
+        self.chunks.extend(chunks)
+        self.length += sum(len(chunk) for chunk in chunks)
+
+    def tell(self):
+        return self.length
+
+    def getvalue(self):
+        chunks = self.chunks
+        if len(chunks) == 1:
+            return chunks[0]
+        text = "".join(chunks)
+        self.chunks = [text] if text else []
+        return text
+
+    def tail(self, n):
+        """Return the last `n` characters written."""
+        parts = []
+        size = 0
+        for chunk in reversed(self.chunks):
+            parts.append(chunk)
+            size += len(chunk)
+            if size >= n:
+                break
+        parts.reverse()
+        return "".join(parts)[-n:]
+
+    def last_line(self):
+        """Return what has been written since the last newline."""
+        parts = []
+        for chunk in reversed(self.chunks):
+            i = chunk.rfind("\n")
+            if i >= 0:
+                parts.append(chunk[i + 1 :])
+                break
+            parts.append(chunk)
+        parts.reverse()
+        return "".join(parts)
+
+    def __str__(self):
+        return self.getvalue()
+
+
+class StreamingOutput(OutputBuffer):
+    """
+    What top-level statements are written to when source is streamed:
+    text is collected here and passed on to `out` by flush(). Some
+    semantic actions look at the end of what has been written, so the
+    last few characters are kept after a flush.
+    """
+
+    keep = 4
+
+    def __init__(self, out):
+        OutputBuffer.__init__(self)
+        self.out = out
+        # How much of what is buffered has already been written to out
+        self.flushed = 0
+
+    def flush(self):
+        text = self.getvalue()
+        if len(text) > self.flushed:
+            self.out.write(text[self.flushed :])
+        tail = text[-self.keep :]
+        self.chunks = [tail] if tail else []
+        self.length = self.flushed = len(tail)
+
+
+def skip_node(node):
+    """The handler for nodes that have no method and no template"""
+    return
+
+
+class Steps(object):
+    """
+    A handler which preorder() runs as part of its own loop rather than
+    by calling it. `steps` is called with the node and returns an
+    iterator over the nodes to walk, in order, doing the writes in
+    between as it goes; or None if the node's children should all be
+    walked. Nodes walked this way don't use up a Python stack frame for
+    each level of nesting.
+    """
+
+    __slots__ = ("steps",)
+
+    def __init__(self, steps):
+        self.steps = steps
+
+
 class SourceWalker(GenericASTTraversal, object):
     stacked_params = ("f", "indent", "is_lambda", "_globals")
+    _text = None
+
+    # Handlers which have a version for preorder() to run as Steps.
+    STEPS = {"expr": "expr_steps", "bin_op": "bin_op_steps"}
 
     def __init__(
         self,
@@ -262,6 +379,14 @@ class SourceWalker(GenericASTTraversal, object):
         self.linestarts = linestarts
         self.line_number = 1
         self.ast_errors = []
+        # A NestedParses object when nested code objects are parsed in
+        # other processes; see code_deparse().
+        self.nested_parses = None
+        # A profiling.Profile when timing and counting what we do
+        self.profile = NO_PROFILE
+        # Names of the code objects left as disassembly because parsing
+        # them went over the parser's budget; see parse_budget_stub().
+        self.budget_overruns = []
         # FIXME: have p.insts update in a better way
         # modularity is broken here
         self.insts = scanner.insts
@@ -290,7 +415,27 @@ class SourceWalker(GenericASTTraversal, object):
         self.name = None
         self.version = version
         self.is_pypy = is_pypy
+
+        # The template and precedence tables for this version are
+        # shared with other walkers and can't be changed. TABLE_R is
+        # copied since customize() adds entries for the call
+        # instructions it sees.
+        (
+            self.TABLE_DIRECT,
+            table_r,
+            self.TABLE_R0,
+            self.PRECEDENCE,
+        ) = version_tables(version, is_pypy)
+        self.TABLE_R = dict(table_r)
+        self.MAP_DIRECT = (self.TABLE_DIRECT,)
+        map_r = (self.TABLE_R, -1)
+        map_r0 = (self.TABLE_R0, -1, 0)
+        self.MAP = dict(
+            (key, map_r if mapping is MAP_R else map_r0)
+            for key, mapping in MAP.items()
+        )
         customize_for_version(self, is_pypy, version)
+        self.dispatch = DispatchTable(self.find_handler)
 
         return
 
@@ -401,8 +546,92 @@ class SourceWalker(GenericASTTraversal, object):
             self.line_number = node.linestart
 
     def preorder(self, node=None):
-        super(SourceWalker, self).preorder(node)
-        self.set_pos_info(node)
+        """Like GenericASTTraversal.preorder() but the handler for a node
+        is looked up in self.dispatch.
+
+        The children of a node whose handler doesn't prune are walked
+        here using an explicit stack, as are the nodes that templates and
+        Steps handlers ask for, so only handlers that call preorder()
+        themselves add to the recursion depth.
+        """
+        if node is None:
+            node = self.ast
+        dispatch = self.dispatch
+        # Each entry is a node and an iterator over the children left to do.
+        stack = []
+        while True:
+            try:
+                handler = dispatch[node.kind]
+                if handler.__class__ is tuple:
+                    kids = self.template_steps(handler, node)
+                elif handler.__class__ is Steps:
+                    kids = handler.steps(node)
+                    if kids is None:
+                        kids = iter(node)
+                else:
+                    handler(node)
+                    kids = iter(node)
+            except GenericASTTraversalPruningException:
+                self.set_pos_info(node)
+            else:
+                stack.append((node, kids))
+
+            node = None
+            while stack:
+                parent, kids = stack[-1]
+                node = next(kids, None)
+                if node is not None:
+                    break
+                stack.pop()
+                self.set_pos_info(parent)
+            if node is None:
+                return
+
+    def find_handler(self, kind):
+        """Return the function preorder() calls for `kind` nodes. This is
+        the n_<kind> method if there is one. Failing that, when
+        default() would just run a fixed TABLE_DIRECT template, we go
+        straight to that: preorder() runs a template tuple given here
+        through template_engine() itself.
+
+        Nodes that can nest deeply, such as expressions and those handled
+        by templates, get a Steps handler instead, so that preorder()
+        walks them in its loop; that is unless a subclass has its own
+        handler or preorder()."""
+        cls = self.__class__
+        own_preorder = (
+            cls.preorder == SourceWalker.preorder
+            and cls.template_engine == SourceWalker.template_engine
+        )
+        name = "n_" + kind
+        handler = getattr(self, name, None)
+        if handler is not None:
+            if (
+                own_preorder
+                and kind in self.STEPS
+                and getattr(handler, "__func__", None) is SourceWalker.__dict__[name]
+            ):
+                return Steps(getattr(self, self.STEPS[kind]))
+            return handler
+        if (
+            kind in self.MAP
+            or cls.default != SourceWalker.default
+            or cls._get_mapping != SourceWalker._get_mapping
+        ):
+            if own_preorder and cls.default == SourceWalker.default:
+                return Steps(self.default_steps)
+            return self.default
+        entry = self.TABLE_DIRECT.get(kind, None)
+        if entry is None:
+            return skip_node
+        if isinstance(entry, tuple) and own_preorder:
+            return entry
+
+        def template_node(node):
+            self.template_engine(entry, node)
+            self.prune()
+
+        return template_node
 
     def indent_more(self, indent=TAB):
         self.indent += indent
@@ -410,7 +639,25 @@ class SourceWalker(GenericASTTraversal, object):
     def indent_less(self, indent=TAB):
         self.indent = self.indent[: -len(indent)]
 
+    @property
+    def text(self):
+        """The source from the last gen_source(). It is only joined up
+        into a string when asked for."""
+        text = self._text
+        if isinstance(text, OutputBuffer):
+            text = self._text = text.getvalue()
+        return text
+
+    @text.setter
+    def text(self, text):
+        self._text = text
+
     def traverse(self, node, indent=None, is_lambda=False):
+        return self.traverse_buffer(node, indent, is_lambda).getvalue()
+
+    def traverse_buffer(self, node, indent=None, is_lambda=False):
+        """Like traverse() but return the OutputBuffer with the text,
+        for write() to add to the text around it without joining."""
         self.param_stack.append(self.params)
         if indent is None:
             indent = self.indent
@@ -419,54 +666,115 @@ class SourceWalker(GenericASTTraversal, object):
         self.params = {
             "_globals": {},
             "_nonlocals": {},  # Python 3 has nonlocal
-            "f": StringIO(),
+            "f": OutputBuffer(),
             "indent": indent,
             "is_lambda": is_lambda,
         }
         self.preorder(node)
         self.f.write("\n" * self.pending_newlines)
-        result = self.f.getvalue()
+        result = self.f
         self.params = self.param_stack.pop()
         self.pending_newlines = p
         return result
 
+    def stream_source(self, ast):
+        """Write the source for the top-level "stmts" `ast` like
+        self.println(self.traverse(ast)) does, but pass on the text for
+        each statement as soon as it has been generated. Statements are
+        removed from `ast` as they are done, so that their trees can be
+        freed.
+        """
+        self.param_stack.append(self.params)
+        out = StreamingOutput(self.f)
+        self.params = {
+            "_globals": {},
+            "_nonlocals": {},  # Python 3 has nonlocal
+            "f": out,
+            "indent": self.indent,
+            "is_lambda": False,
+        }
+        # Newlines pending before the statements merge with those at
+        # the start of the first one, as they do when println() is
+        # given the traversed text; the ones after the last statement
+        # stay pending.
+        stmts = list(ast)
+        if ast is not PASS:  # that one is shared
+            del ast[:]
+        stmts.reverse()
+        while stmts:
+            self.preorder(stmts.pop())
+            out.flush()
+        self.params = self.param_stack.pop()
+        self.pending_newlines = max(self.pending_newlines, 1)
+
     def write(self, *data):
         if (len(data) == 0) or (len(data) == 1 and data[0] == ""):
             return
+        if len(data) == 1 and isinstance(data[0], OutputBuffer):
+            self.write_buffer(data[0])
+            return
         if not PYTHON3:
             out = "".join((unicode(j) for j in data))
+        elif len(data) == 1 and isinstance(data[0], str):
+            out = data[0]
         else:
             out = "".join((str(j) for j in data))
-        n = 0
-        for i in out:
-            if i == "\n":
-                n += 1
-                if n == len(out):
-                    self.pending_newlines = max(self.pending_newlines, n)
-                    return
-            elif n:
-                self.pending_newlines = max(self.pending_newlines, n)
-                out = out[n:]
-                break
-            else:
-                break
+
+        # Leading and trailing newlines are held back in
+        # pending_newlines, so that blank lines can be merged.
+        text = out.lstrip("\n")
+        if len(text) < len(out):
+            self.pending_newlines = max(self.pending_newlines, len(out) - len(text))
+            if not text:
+                return
+            out = text
 
         if self.pending_newlines > 0:
             self.f.write("\n" * self.pending_newlines)
             self.pending_newlines = 0
 
-        for i in out[::-1]:
-            if i == "\n":
-                self.pending_newlines += 1
-            else:
-                break
-
-        if self.pending_newlines:
-            out = out[: -self.pending_newlines]
+        text = out.rstrip("\n")
+        self.pending_newlines = len(out) - len(text)
+        out = text
         if isinstance(out, str) and not (PYTHON3 or self.FUTURE_UNICODE_LITERALS):
             out = unicode(out, "utf-8")
         self.f.write(out)
 
+    def write_buffer(self, buf):
+        """Write the text in OutputBuffer `buf` as write() would, but
+        pass on its strings rather than joining them."""
+        chunks = buf.chunks
+        first, last = 0, len(chunks)
+        leading = trailing = 0
+        # Strings that are all newlines go into pending_newlines.
+        while first < last and not chunks[first].strip("\n"):
+            leading += len(chunks[first])
+            first += 1
+        if first == last:
+            self.pending_newlines = max(self.pending_newlines, leading)
+            return
+        while not chunks[last - 1].strip("\n"):
+            trailing += len(chunks[last - 1])
+            last -= 1
+        parts = chunks[first:last]
+        text = parts[0].lstrip("\n")
+        leading += len(parts[0]) - len(text)
+        parts[0] = text
+        text = parts[-1].rstrip("\n")
+        trailing += len(parts[-1]) - len(text)
+        parts[-1] = text
+
+        if leading:
+            self.pending_newlines = max(self.pending_newlines, leading)
+        if self.pending_newlines > 0:
+            self.f.write("\n" * self.pending_newlines)
+        self.pending_newlines = trailing
+        if hasattr(self.f, "write_chunks"):
+            self.f.write_chunks(parts)
+        else:
+            for part in parts:
+                self.f.write(part)
+
     def println(self, *data):
         if data and not (len(data) == 1 and data[0] == ""):
             self.write(*data)
@@ -503,6 +811,17 @@ class SourceWalker(GenericASTTraversal, object):
             self.preorder(node[0])
             self.prune()
 
+    def n_parse_budget_stub(self, node):
+        if self.params["is_lambda"]:
+            # A lambda's body is an expression, so there is no room
+            # for the disassembly.
+            self.write("None")
+            self.prune()
+        for line in node.comment:
+            self.println(self.indent, "# ", line)
+        self.println(self.indent, "pass")
+        self.prune()
+
     def n_return(self, node):
         if self.params["is_lambda"]:
             self.preorder(node[0])
@@ -568,6 +887,11 @@ class SourceWalker(GenericASTTraversal, object):
         self.prune()  # stop recursing
 
     def n_expr(self, node):
+        for kid in self.expr_steps(node):
+            self.preorder(kid)
+        self.prune()
+
+    def expr_steps(self, node):
         first_child = node[0]
         if first_child == "_mklambda" and self.in_format_string:
             p = -2
@@ -583,7 +907,7 @@ class SourceWalker(GenericASTTraversal, object):
         #     hasattr(self, 'current_line_number')):
         #     self.source_linemap[self.current_line_number] = n.linestart
 
-        self.prec = PRECEDENCE.get(n.kind, -2)
+        self.prec = self.PRECEDENCE.get(n.kind, -2)
         if n == "LOAD_CONST" and repr(n.pattr)[0] == "-":
             self.prec = 6
 
@@ -591,17 +915,16 @@ class SourceWalker(GenericASTTraversal, object):
 
         if p < self.prec:
             self.write("(")
-            self.preorder(node[0])
+            yield node[0]
             self.write(")")
         else:
-            self.preorder(node[0])
+            yield node[0]
         self.prec = p
-        self.prune()
 
     def n_ret_expr(self, node):
         if len(node) == 1 and node[0] == "expr":
             # If expr is yield we want parens.
-            self.prec = PRECEDENCE["yield"] - 1
+            self.prec = self.PRECEDENCE["yield"] - 1
             self.n_expr(node[0])
         else:
             self.n_expr(node)
@@ -610,15 +933,19 @@ class SourceWalker(GenericASTTraversal, object):
 
     def n_bin_op(self, node):
         """bin_op (formerly "binary_expr") is the Python AST BinOp"""
-        self.preorder(node[0])
+        for kid in self.bin_op_steps(node):
+            self.preorder(kid)
+        self.prune()
+
+    def bin_op_steps(self, node):
+        yield node[0]
         self.write(" ")
-        self.preorder(node[-1])
+        yield node[-1]
         self.write(" ")
         # Try to avoid a trailing parentheses by lowering the priority a little
         self.prec -= 1
-        self.preorder(node[1])
+        yield node[1]
         self.prec += 1
-        self.prune()
 
     def n_str(self, node):
         self.write(node[0].pattr)
@@ -626,7 +953,7 @@ class SourceWalker(GenericASTTraversal, object):
 
     def pp_tuple(self, tup):
         """Pretty print a tuple"""
-        last_line = self.f.getvalue().split("\n")[-1]
+        last_line = self.f.last_line()
         l = len(last_line) + 1
         indent = " " * l
         self.write("(")
@@ -1018,7 +1345,7 @@ class SourceWalker(GenericASTTraversal, object):
         # FIXME: use source line numbers for directing line breaks
 
         line_number = self.line_number
-        last_line = self.f.getvalue().split("\n")[-1]
+        last_line = self.f.last_line()
         l = len(last_line)
         indent = " " * (l - 1)
 
@@ -1838,7 +2165,7 @@ class SourceWalker(GenericASTTraversal, object):
         prettyprint a list or tuple
         """
         p = self.prec
-        self.prec = PRECEDENCE["yield"] - 1
+        self.prec = self.PRECEDENCE["yield"] - 1
         lastnode = node.pop()
         lastnodetype = lastnode.kind
 
@@ -1846,7 +2173,7 @@ class SourceWalker(GenericASTTraversal, object):
         # then the first * has already been printed.
         # Until I have a better way to check for CALL_FUNCTION_VAR,
         # will assume that if the text ends in *.
-        last_was_star = self.f.getvalue().endswith("*")
+        last_was_star = self.f.tail(1) == "*"
 
         if lastnodetype.endswith("UNPACK"):
             # FIXME: need to handle range of BUILD_LIST_UNPACK
@@ -2017,24 +2344,26 @@ class SourceWalker(GenericASTTraversal, object):
         beginning of this module for the how we interpret format
         specifications such as %c, %C, and so on.
         """
+        for node in self.template_steps(entry, startnode):
+            self.preorder(node)
+
+    def template_steps(self, entry, startnode):
+        """template_engine() as Steps: yield the nodes to walk as the
+        template gets to them."""
 
         # print("-----")
         # print(startnode)
         # print(entry[0])
         # print('======')
-        fmt = entry[0]
+        escapes, tail = compile_template(entry[0])
         arg = 1
-        i = 0
 
-        m = escape.search(fmt)
-        while m:
-            i = m.end()
-            self.write(m.group("prefix"))
+        for prefix, child, typ, expr, code in escapes:
+            self.write(prefix)
 
-            typ = m.group("type") or "{"
             node = startnode
-            if m.group("child"):
-                node = node[int(m.group("child"))]
+            if child is not None:
+                node = node[child]
 
             if typ == "%":
                 self.write("%")
@@ -2084,7 +2413,7 @@ class SourceWalker(GenericASTTraversal, object):
                         %s is invalid; has only %d entries
                         """ % (node,kind, enty, arg, index, len(node))
                     )
-                self.preorder(node[index])
+                yield node[index]
 
                 arg += 1
             elif typ == "p":
@@ -2101,14 +2430,14 @@ class SourceWalker(GenericASTTraversal, object):
                     assert len(tup) == 2
                     (index, self.prec) = entry[arg]
 
-                self.preorder(node[index])
+                yield node[index]
                 self.prec = p
                 arg += 1
             elif typ == "C":
                 low, high, sep = entry[arg]
                 remaining = len(node[low:high])
                 for subnode in node[low:high]:
-                    self.preorder(subnode)
+                    yield subnode
                     remaining -= 1
                     if remaining > 0:
                         self.write(sep)
@@ -2121,7 +2450,7 @@ class SourceWalker(GenericASTTraversal, object):
                 for subnode in node[low:high]:
                     remaining -= 1
                     if len(subnode) > 0:
-                        self.preorder(subnode)
+                        yield subnode
                         if remaining > 0:
                             self.write(sep)
                             pass
@@ -2138,15 +2467,13 @@ class SourceWalker(GenericASTTraversal, object):
                 remaining = len(node[low:high])
                 # remaining = len(node[low:high])
                 for subnode in node[low:high]:
-                    self.preorder(subnode)
+                    yield subnode
                     remaining -= 1
                     if remaining > 0:
                         self.write(sep)
                 self.prec = p
                 arg += 1
             elif typ == "{":
-                expr = m.group("expr")
-
                 # Line mapping stuff
                 if (
                     hasattr(node, "linestart")
@@ -2157,18 +2484,31 @@ class SourceWalker(GenericASTTraversal, object):
 
                 if expr[0] == "%":
                     index = entry[arg]
-                    self.template_engine((expr, index), node)
+                    for kid in self.template_steps((expr, index), node):
+                        yield kid
                     arg += 1
                 else:
-                    d = node.__dict__
+                    d = node.attrs() if isinstance(node, Token) else node.__dict__
                     try:
-                        self.write(eval(expr, d, d))
+                        self.write(eval(code or expr, d, d))
                     except:
                         raise
-            m = escape.search(fmt, i)
-        self.write(fmt[i:])
+        self.write(tail)
 
     def default(self, node):
+        entry = self.default_template(node)
+        if entry is not None:
+            self.template_engine(entry, node)
+            self.prune()
+
+    def default_steps(self, node):
+        entry = self.default_template(node)
+        if entry is not None:
+            return self.template_steps(entry, node)
+        return None
+
+    def default_template(self, node):
+        """The template default() runs for `node`, or None."""
         mapping = self._get_mapping(node)
         table = mapping[0]
         key = node
@@ -2177,9 +2517,7 @@ class SourceWalker(GenericASTTraversal, object):
             key = key[i]
             pass
 
-        if key.kind in table:
-            self.template_engine(table[key.kind], node)
-            self.prune()
+        return table.get(key.kind, None)
 
     def customize(self, customize):
         """
@@ -2187,17 +2525,17 @@ class SourceWalker(GenericASTTraversal, object):
         of arguments -- we add a new entry for each in TABLE_R.
         """
         for k, v in list(customize.items()):
-            if k in TABLE_R:
+            if k in self.TABLE_R:
                 continue
             op = k[: k.rfind("_")]
 
             if k.startswith("CALL_METHOD"):
                 # This happens in PyPy and Python 3.7+
-                TABLE_R[k] = ("%c(%P)", 0, (1, -1, ", ", 100))
+                self.TABLE_R[k] = ("%c(%P)", 0, (1, -1, ", ", 100))
             elif self.version >= 3.6 and k.startswith("CALL_FUNCTION_KW"):
-                TABLE_R[k] = ("%c(%P)", 0, (1, -1, ", ", 100))
+                self.TABLE_R[k] = ("%c(%P)", 0, (1, -1, ", ", 100))
             elif op == "CALL_FUNCTION":
-                TABLE_R[k] = ("%c(%P)", (0, "expr"), (1, -1, ", ", PRECEDENCE["yield"]-1))
+                self.TABLE_R[k] = ("%c(%P)", (0, "expr"), (1, -1, ", ", self.PRECEDENCE["yield"]-1))
             elif op in (
                 "CALL_FUNCTION_VAR",
                 "CALL_FUNCTION_VAR_KW",
@@ -2253,7 +2591,7 @@ class SourceWalker(GenericASTTraversal, object):
                 else:
                     assert False, "Unhandled CALL_FUNCTION %s" % op
 
-                TABLE_R[k] = entry
+                self.TABLE_R[k] = entry
                 pass
             # handled by n_dict:
             # if op == 'BUILD_SLICE':	TABLE_R[k] = ('%C'    ,    (0,-1,':'))
@@ -2443,8 +2781,15 @@ class SourceWalker(GenericASTTraversal, object):
 
         self.classes.pop(-1)
 
-    def gen_source(self, ast, name, customize, is_lambda=False, returnNone=False):
-        """convert SyntaxTree to Python source code"""
+    def gen_source(
+        self, ast, name, customize, is_lambda=False, returnNone=False, stream=False
+    ):
+        """convert SyntaxTree to Python source code
+
+        If `stream` is True, the source for each statement of "stmts"
+        tree `ast` is written out as soon as it is generated; see
+        stream_source().
+        """
 
         rn = self.return_none
         self.return_none = returnNone
@@ -2456,10 +2801,13 @@ class SourceWalker(GenericASTTraversal, object):
         else:
             self.customize(customize)
             if is_lambda:
-                self.write(self.traverse(ast, is_lambda=is_lambda))
+                self.write(self.traverse_buffer(ast, is_lambda=is_lambda))
+            elif stream:
+                self.stream_source(ast)
             else:
-                self.text = self.traverse(ast, is_lambda=is_lambda)
-                self.println(self.text)
+                text = self.traverse_buffer(ast, is_lambda=is_lambda)
+                self.text = text
+                self.println(text)
         self.name = old_name
         self.return_none = rn
 
@@ -2471,49 +2819,33 @@ class SourceWalker(GenericASTTraversal, object):
 
         # assert isinstance(tokens[0], Token)
 
+        if not self.prepare_tokens(tokens, is_lambda, noneInNames, isTopLevel):
+            return PASS
+        self.profile.count("tokens", len(tokens))
+
         if is_lambda:
-            for t in tokens:
-                if t.kind == "RETURN_END_IF":
-                    t.kind = "RETURN_END_IF_LAMBDA"
-                elif t.kind == "RETURN_VALUE":
-                    t.kind = "RETURN_VALUE_LAMBDA"
-            tokens.append(Token("LAMBDA_MARKER"))
             try:
                 # FIXME: have p.insts update in a better way
                 # modularity is broken here
                 p_insts = self.p.insts
                 self.p.insts = self.scanner.insts
                 self.p.offset2inst_index = self.scanner.offset2inst_index
-                ast = python_parser.parse(self.p, tokens, customize, code)
+                self.p.split_offsets = self.scanner.split_offsets
+                ast = self.parse_tokens(tokens, customize, code)
                 self.customize(customize)
                 self.p.insts = p_insts
 
+            except python_parser.ParseBudgetError as e:
+                self.p.insts = p_insts
+                return self.parse_budget_stub(e, tokens, code)
             except (python_parser.ParserError, AssertionError) as e:
                 raise ParserError(e, tokens, self.p.debug['reduce'])
-            transform_ast = self.treeTransform.transform(ast, code)
+            with self.profile.phase("transform"):
+                transform_ast = self.treeTransform.transform(ast, code)
             self.maybe_show_tree(ast)
             del ast  # Save memory
             return transform_ast
 
-        # The bytecode for the end of the main routine has a
-        # "return None". However you can't issue a "return" statement in
-        # main. So as the old cigarette slogan goes: I'd rather switch (the token stream)
-        # than fight (with the grammar to not emit "return None").
-        if self.hide_internal:
-            if len(tokens) >= 2 and not noneInNames:
-                if tokens[-1].kind in ("RETURN_VALUE", "RETURN_VALUE_LAMBDA"):
-                    # Python 3.4's classes can add a "return None" which is
-                    # invalid syntax.
-                    if tokens[-2].kind == "LOAD_CONST":
-                        if isTopLevel or tokens[-2].pattr is None:
-                            del tokens[-2:]
-                        else:
-                            tokens.append(Token("RETURN_LAST"))
-                    else:
-                        tokens.append(Token("RETURN_LAST"))
-            if len(tokens) == 0:
-                return PASS
-
         # Build a parse tree from a tokenized and massaged disassembly.
         try:
             # FIXME: have p.insts update in a better way
@@ -2521,25 +2853,92 @@ class SourceWalker(GenericASTTraversal, object):
             p_insts = self.p.insts
             self.p.insts = self.scanner.insts
             self.p.offset2inst_index = self.scanner.offset2inst_index
+            self.p.split_offsets = self.scanner.split_offsets
             self.p.opc = self.scanner.opc
-            ast = python_parser.parse(self.p, tokens, customize, code)
+            ast = self.parse_tokens(tokens, customize, code)
+            self.p.insts = p_insts
+        except python_parser.ParseBudgetError as e:
             self.p.insts = p_insts
+            return self.parse_budget_stub(e, tokens, code)
         except (python_parser.ParserError, AssertionError) as e:
             raise ParserError(e, tokens, self.p.debug['reduce'])
 
-        checker(ast, False, self.ast_errors)
-
         self.customize(customize)
-        transform_ast = self.treeTransform.transform(ast, code)
+        with self.profile.phase("transform"):
+            # The transform pass also does the parse tree checks.
+            transform_ast = self.treeTransform.transform(ast, code, self.ast_errors)
 
         self.maybe_show_tree(ast)
 
         del ast  # Save memory
         return transform_ast
 
-    @classmethod
-    def _get_mapping(cls, node):
-        return MAP.get(node, MAP_DIRECT)
+    def parse_budget_stub(self, error, tokens, code):
+        """Return a "stmts" tree to stand in for the body of `code`,
+        whose parse went over the parser's budget. It comes out as the
+        disassembly of `tokens` in comments, followed by "pass", or as
+        "None" for the body of a lambda."""
+        self.budget_overruns.append(code.co_name)
+        comment = [str(error).strip()]
+        for t in tokens:
+            comment.extend(line.rstrip() for line in t.format().strip("\n").split("\n"))
+        stub = SyntaxTree("parse_budget_stub", [])
+        stub.comment = comment
+        return SyntaxTree(
+            "stmts", [SyntaxTree("sstmt", [SyntaxTree("stmt", [stub])])]
+        )
+
+    def prepare_tokens(
+        self, tokens, is_lambda=False, noneInNames=False, isTopLevel=False
+    ):
+        """Massage `tokens` in place before they are parsed. Return False
+        if there is nothing left to parse."""
+        if is_lambda:
+            for t in tokens:
+                if t.kind == "RETURN_END_IF":
+                    t.kind = "RETURN_END_IF_LAMBDA"
+                elif t.kind == "RETURN_VALUE":
+                    t.kind = "RETURN_VALUE_LAMBDA"
+            tokens.append(Token("LAMBDA_MARKER"))
+            return True
+
+        # The bytecode for the end of the main routine has a
+        # "return None". However you can't issue a "return" statement in
+        # main. So as the old cigarette slogan goes: I'd rather switch (the token stream)
+        # than fight (with the grammar to not emit "return None").
+        if self.hide_internal:
+            if len(tokens) >= 2 and not noneInNames:
+                if tokens[-1].kind in ("RETURN_VALUE", "RETURN_VALUE_LAMBDA"):
+                    # Python 3.4's classes can add a "return None" which is
+                    # invalid syntax.
+                    if tokens[-2].kind == "LOAD_CONST":
+                        if isTopLevel or tokens[-2].pattr is None:
+                            del tokens[-2:]
+                        else:
+                            tokens.append(Token("RETURN_LAST"))
+                    else:
+                        tokens.append(Token("RETURN_LAST"))
+            if len(tokens) == 0:
+                return False
+        return True
+
+    def parse_tokens(self, tokens, customize, code):
+        """Customize the grammar for `tokens` and parse them. When nested
+        code objects are being parsed in other processes, a tree from
+        there is used if it was parsed under the same grammar."""
+        profile = self.profile
+        if self.nested_parses is not None:
+            with profile.phase("parse"):
+                ast = self.nested_parses.parse(self, tokens, customize, code)
+            if ast is not None:
+                return ast
+        with profile.phase("customize"):
+            self.p.customize_grammar_rules(tokens, customize)
+        with profile.phase("parse"):
+            return self.p.parse(tokens)
+
+    def _get_mapping(self, node):
+        return self.MAP.get(node, self.MAP_DIRECT)
 
 
 #
@@ -2555,10 +2954,36 @@ def code_deparse(
     compile_mode="exec",
     is_pypy=IS_PYPY,
     walker=SourceWalker,
+    nested_procs=None,
+    profile=None,
+    stream=False,
+    parse_budget=None,
+    fast_path=False,
 ):
     """
     ingests and deparses a given code block 'co'. If version is None,
     we will use the current Python interpreter version.
+
+    If `nested_procs` is greater than 1, the code objects nested in 'co'
+    are parsed ahead of time by that many processes.
+
+    If `profile` is a profiling.Profile, the time spent in each phase of
+    deparsing and counts of what was done are added to it.
+
+    If `stream` is True, the source for each top-level statement is
+    written to `out` as soon as it has been generated, rather than all
+    at once at the end. The output is the same, but the returned
+    walker then has no `text`, and its `ast` has no statements left.
+
+    If `parse_budget` is a parser.ParseBudget, a function or class
+    whose parse takes more work than it allows is written out as its
+    disassembly, in comments, and the rest of the code is deparsed as
+    usual. The names of these are in the returned walker's
+    `budget_overruns`.
+
+    If `fast_path` is True, the parser builds the trees of simple
+    statements outside of any control flow itself, and leaves less
+    to the Earley parser; see PythonParser.fast_path().
     """
 
     assert iscode(co)
@@ -2567,7 +2992,12 @@ def code_deparse(
         version = sysinfo2float()
 
     # store final output stream for case of error
-    scanner = get_scanner(version, is_pypy=is_pypy)
+    if profile is not None:
+        # Profiling replaces some of the scanner's methods.
+        scanner = get_scanner(version, is_pypy=is_pypy)
+        instrument(profile, scanner=scanner)
+    else:
+        scanner = shared_scanner(version, is_pypy=is_pypy)
 
     tokens, customize = scanner.ingest(
         co, code_objects=code_objects, show_asm=debug_opts["asm"]
@@ -2590,71 +3020,90 @@ def code_deparse(
         is_pypy=is_pypy,
         linestarts=linestarts,
     )
+    deparsed.p.budget = parse_budget
+    deparsed.p.use_fast_path = fast_path
+    if profile is not None:
+        deparsed.profile = profile
+        instrument(profile, parser=deparsed.p)
+
+    if nested_procs and nested_procs > 1 and not (
+        debug_opts.get("asm", None) or debug_opts.get("ast", None)
+        or debug_opts.get("grammar", None)
+    ):
+        from uncompyle6.semantics.parallel import NestedParses
 
-    isTopLevel = co.co_name == "<module>"
-    deparsed.ast = deparsed.build_ast(tokens, customize, co, isTopLevel=isTopLevel)
+        deparsed.nested_parses = NestedParses(deparsed, co, nested_procs)
+    try:
+        isTopLevel = co.co_name == "<module>"
+        deparsed.ast = deparsed.build_ast(tokens, customize, co, isTopLevel=isTopLevel)
 
-    #### XXX workaround for profiling
-    if deparsed.ast is None:
-        return None
+        #### XXX workaround for profiling
+        if deparsed.ast is None:
+            return None
 
-    assert deparsed.ast == "stmts", "Should have parsed grammar start"
+        assert deparsed.ast == "stmts", "Should have parsed grammar start"
 
-    # save memory
-    del tokens
+        # save memory
+        del tokens
 
-    deparsed.mod_globs, nonlocals = find_globals_and_nonlocals(
-        deparsed.ast, set(), set(), co, version
-    )
+        with deparsed.profile.phase("globals"):
+            deparsed.mod_globs, nonlocals = find_globals_and_nonlocals(
+                deparsed.ast, set(), set(), co, version
+            )
 
-    assert not nonlocals
+        assert not nonlocals
 
-    if version >= 3.0:
-        load_op = "LOAD_STR"
-    else:
-        load_op = "LOAD_CONST"
+        if version >= 3.0:
+            load_op = "LOAD_STR"
+        else:
+            load_op = "LOAD_CONST"
 
-    # convert leading '__doc__ = "..." into doc string
-    try:
-        stmts = deparsed.ast
-        first_stmt = stmts[0][0]
-        if version >= 3.6:
-            if first_stmt[0] == "SETUP_ANNOTATIONS":
-                del stmts[0]
-                assert stmts[0] == "sstmt"
-                # Nuke sstmt
-                first_stmt = stmts[0][0]
+        # convert leading '__doc__ = "..." into doc string
+        try:
+            stmts = deparsed.ast
+            first_stmt = stmts[0][0]
+            if version >= 3.6:
+                if first_stmt[0] == "SETUP_ANNOTATIONS":
+                    del stmts[0]
+                    assert stmts[0] == "sstmt"
+                    # Nuke sstmt
+                    first_stmt = stmts[0][0]
+                    pass
                 pass
+            if first_stmt == ASSIGN_DOC_STRING(co.co_consts[0], load_op):
+                print_docstring(deparsed, "", co.co_consts[0])
+                del stmts[0]
+            if stmts[-1] == RETURN_NONE:
+                stmts.pop()  # remove last node
+                # todo: if empty, add 'pass'
+        except:
             pass
-        if first_stmt == ASSIGN_DOC_STRING(co.co_consts[0], load_op):
-            print_docstring(deparsed, "", co.co_consts[0])
-            del stmts[0]
-        if stmts[-1] == RETURN_NONE:
-            stmts.pop()  # remove last node
-            # todo: if empty, add 'pass'
-    except:
-        pass
-
-    deparsed.FUTURE_UNICODE_LITERALS = (
-        COMPILER_FLAG_BIT["FUTURE_UNICODE_LITERALS"] & co.co_flags != 0
-    )
-
-    # What we've been waiting for: Generate source from Syntax Tree!
-    deparsed.gen_source(deparsed.ast, co.co_name, customize)
 
-    for g in sorted(deparsed.mod_globs):
-        deparsed.write("# global %s ## Warning: Unused global\n" % g)
-
-    if deparsed.ast_errors:
-        deparsed.write("# NOTE: have internal decompilation grammar errors.\n")
-        deparsed.write("# Use -t option to show full context.")
-        for err in deparsed.ast_errors:
-            deparsed.write(err)
-        raise SourceWalkerError("Deparsing hit an internal grammar-rule bug")
+        deparsed.FUTURE_UNICODE_LITERALS = (
+            COMPILER_FLAG_BIT["FUTURE_UNICODE_LITERALS"] & co.co_flags != 0
+        )
 
-    if deparsed.ERROR:
-        raise SourceWalkerError("Deparsing stopped due to parse error")
-    return deparsed
+        # What we've been waiting for: Generate source from Syntax Tree!
+        with deparsed.profile.phase("gen_source"):
+            deparsed.gen_source(deparsed.ast, co.co_name, customize, stream=stream)
+
+        for g in sorted(deparsed.mod_globs):
+            deparsed.write("# global %s ## Warning: Unused global\n" % g)
+
+        if deparsed.ast_errors:
+            deparsed.write("# NOTE: have internal decompilation grammar errors.\n")
+            deparsed.write("# Use -t option to show full context.")
+            for err in deparsed.ast_errors:
+                deparsed.write(err)
+            raise SourceWalkerError("Deparsing hit an internal grammar-rule bug")
+
+        if deparsed.ERROR:
+            raise SourceWalkerError("Deparsing stopped due to parse error")
+        return deparsed
+    finally:
+        if deparsed.nested_parses is not None:
+            deparsed.nested_parses.close()
+            deparsed.nested_parses = None
 
 
 def deparse_code2str(
@@ -17,7 +17,7 @@ from uncompyle6.show import maybe_show_tree
 from copy import copy
 from spark_parser import GenericASTTraversal, GenericASTTraversalPruningException
 
-from uncompyle6.semantics.helper import find_code_node
+from uncompyle6.semantics.helper import DispatchTable, find_code_node, name_ops
 from uncompyle6.parsers.treenode import SyntaxTree
 from uncompyle6.scanners.tok import NoneToken, Token
 from uncompyle6.semantics.consts import RETURN_NONE, ASSIGN_DOC_STRING
@@ -71,8 +71,18 @@ class TreeTransform(GenericASTTraversal, object):
         self.version = version
         self.showast = show_ast
         self.is_pypy = is_pypy
+        self.dispatch = DispatchTable(self.find_handler)
+
+        # State for the checks and the name-token collection that
+        # transform() does while it walks the tree; see preorder().
+        self.ast_errors = None
+        self.in_loop = False
+        self.name_tokens = []
         return
 
+    def find_handler(self, kind):
+        return getattr(self, "n_" + kind, None)
+
     def maybe_show_tree(self, ast):
         if isinstance(self.showast, dict) and self.showast:
             maybe_show_tree(self, ast)
@@ -87,21 +97,82 @@ class TreeTransform(GenericASTTraversal, object):
         order it wants which may skip children or order then in ways
         other than first to last.  In fact, this this happens.  So in
         this sense this function not strictly preorder.
+
+        The tree is walked using an explicit stack rather than
+        recursively, so deep trees don't run into Python's recursion limit.
         """
         if node is None:
             node = self.ast
 
-        try:
-            name = "n_" + self.typestring(node)
-            if hasattr(self, name):
-                func = getattr(self, name)
-                node = func(node)
-        except GenericASTTraversalPruningException:
-            return
-
-        for i, kid in enumerate(node):
-            node[i] = self.preorder(kid)
-        return node
+        errors = self.ast_errors
+        # Each entry is [tree, index of the child being walked, in_loop
+        # value to restore once the tree is done].
+        stack = []
+        while True:
+            kind = node.kind
+            if isinstance(node, Token):
+                # Tokens have no children and no transformations. Note the
+                # ones that find_globals_and_nonlocals() is interested in.
+                if kind in name_ops:
+                    self.name_tokens.append(node)
+                result = node
+            else:
+                # Do the parse tree checks of check_ast.checker() on the tree
+                # as it was before this node's transformation.
+                in_loop = self.in_loop
+                if errors is not None:
+                    if node is not self.ast:
+                        if not in_loop and kind in ("continue", "break"):
+                            text = str(node)
+                            errors.append(
+                                "\n# not in loop:\n#\t"
+                                + "\n# ".join(text.split("\n"))
+                            )
+                    if kind in ("aug_assign1", "aug_assign2") and node[0][0] == "and":
+                        text = str(node)
+                        errors.append(
+                            "\n# improper augmented assigment (e.g. +=, *=, ...):\n#\t"
+                            + "\n# ".join(text.split("\n"))
+                            + "\n"
+                        )
+
+                try:
+                    func = self.dispatch[kind]
+                    if func is not None:
+                        node = func(node)
+                except GenericASTTraversalPruningException:
+                    result = None
+                else:
+                    if errors is not None:
+                        self.in_loop = (
+                            in_loop
+                            or kind.startswith("for")
+                            or kind.startswith("while")
+                            or kind.startswith("async_for")
+                        )
+                    if len(node):
+                        stack.append([node, 0, in_loop])
+                        node = node[0]
+                        continue
+                    self.in_loop = in_loop
+                    result = node
+
+            # Put the result in its parent and move on to the next child,
+            # finishing off the trees whose children are all done.
+            while stack:
+                frame = stack[-1]
+                parent, i = frame[0], frame[1]
+                parent[i] = result
+                i += 1
+                if i < len(parent):
+                    frame[1] = i
+                    node = parent[i]
+                    break
+                stack.pop()
+                self.in_loop = frame[2]
+                result = parent
+            else:
+                return result
 
     def n_mkfunc(self, node):
         """If the function has a docstring (this is found in the code
@@ -438,10 +509,20 @@ class TreeTransform(GenericASTTraversal, object):
         node = self.preorder(node)
         return node
 
-    def transform(self, ast, code):
+    def transform(self, ast, code, ast_errors=None):
+        """Transform parse tree `ast` of `code`. If `ast_errors` is a list,
+        the problems check_ast.checker() looks for are added to it along
+        the way."""
         self.maybe_show_tree(ast)
         self.ast = copy(ast)
-        self.ast = self.traverse(self.ast, is_lambda=False)
+        self.ast_errors = ast_errors
+        self.in_loop = False
+        self.name_tokens = name_tokens = []
+        try:
+            self.ast = self.traverse(self.ast, is_lambda=False)
+        finally:
+            self.ast_errors = None
+            self.name_tokens = []
 
         try:
             # Disambiguate a string (expression) which appears as a "call_stmt" at
@@ -486,6 +567,8 @@ class TreeTransform(GenericASTTraversal, object):
         except:
             pass
 
+        # What was removed above has no global or nonlocal names in it.
+        self.ast.name_tokens = name_tokens
         return self.ast
 
     # Write template_engine
@@ -0,0 +1,488 @@
+#  Copyright (c) 2020 by Rocky Bernstein
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Decompile for other programs over a Unix domain socket, so that they
+don't pay for starting Python, importing the decompiler and building
+its grammars each time.
+
+serve() listens on the socket and starts a number of worker processes,
+each of which takes connections and answers the requests on them one at
+a time. The grammars and scanners for the bytecode versions asked for are
+built before the workers are started, and every worker keeps the ones it
+builds after that, so after the first file for a version only the
+decompilation itself is paid for. Like pool_main(), a worker that takes
+too long over a request is killed and replaced, as is one that dies, and
+workers can be replaced after a fixed number of requests.
+
+Requests and responses are JSON objects, one to a line. A request names
+a bytecode file with "path", or gives its contents with "bytecode"
+(base64-encoded), and may set these options:
+
+  fragments     use the fragments deparser, unless linemaps is set
+  linemaps      return the line number map in "linemap"
+  verify        "weak", "strong" or "verify-run", as for --syntax-verify,
+                --verify and --verify-run
+  encoding      the source encoding to give in the output
+  parse_items   the parse budget in Earley items, as for --parse-items
+  parse_seconds the parse budget in seconds, as for --parse-seconds
+  fast_path     parse simple statements directly, as for --fast-path
+
+The response has a "status" of "ok", "failed" or "verify failed", the
+"source" written out, and "error" giving what went wrong, if anything.
+"budget_overruns" lists what went over the parse budget. With fragments,
+"fragments" lists [name, offset, start, finish] for each instruction
+offset that the deparser found the source text of, where start and
+finish are positions in "source".
+
+Client connects to a server; client_main() is what "uncompyle6
+--connect" runs, and doesn't import the decompiler at all.
+"""
+
+from __future__ import print_function
+
+import base64, io, json, os, socket, sys, time
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+# How often, in seconds, we check for workers that are stuck or have died
+POLL_INTERVAL = 0.5
+
+REQUEST_OPTIONS = (
+    "fragments",
+    "linemaps",
+    "verify",
+    "encoding",
+    "parse_items",
+    "parse_seconds",
+    "fast_path",
+)
+
+
+class ServerError(Exception):
+    pass
+
+
+def send_message(sock, message):
+    sock.sendall((json.dumps(message) + "\n").encode("utf-8"))
+
+
+def read_message(stream):
+    """Return the next message from file object `stream`, or None if
+    the other end has closed the connection."""
+    line = stream.readline()
+    if not line:
+        return None
+    return json.loads(line.decode("utf-8"))
+
+
+class Client(object):
+    """A connection to the server listening on `socket_path`."""
+
+    def __init__(self, socket_path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(socket_path)
+        except socket.error as e:
+            self.sock.close()
+            raise ServerError("can't connect to %s: %s" % (socket_path, e))
+        self.stream = self.sock.makefile("rb")
+
+    def request(self, request):
+        send_message(self.sock, request)
+        response = read_message(self.stream)
+        if response is None:
+            raise ServerError("server closed the connection")
+        return response
+
+    def decompile(self, path=None, bytecode=None, **options):
+        """Decompile the bytecode file `path`, or the contents of one
+        in `bytecode`. `options` are the request options in the module
+        docstring. Returns the response.
+        """
+        request = dict(options)
+        if path is not None:
+            request["path"] = os.path.abspath(path)
+        if bytecode is not None:
+            request["bytecode"] = base64.b64encode(bytecode).decode("ascii")
+        return self.request(request)
+
+    def close(self):
+        self.stream.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def handle_request(request, defaults={}, cache=None):
+    """Decompile what `request` asks for and return the response.
+    Options not in `request` are taken from `defaults`.
+    """
+    import shutil, tempfile
+    from uncompyle6 import verify
+    from uncompyle6.main import decompile_file
+    from uncompyle6.parser import ParseBudget
+
+    options = dict(defaults)
+    for key, value in request.items():
+        if key not in REQUEST_OPTIONS + ("path", "bytecode"):
+            return {"status": "failed", "source": "", "error": "unknown key %r" % key}
+        options[key] = value
+
+    out = StringIO()
+    mapstream = StringIO() if options.get("linemaps") else None
+    parse_budget = None
+    if options.get("parse_items") or options.get("parse_seconds"):
+        parse_budget = ParseBudget(options.get("parse_items"), options.get("parse_seconds"))
+    do_verify = options.get("verify")
+
+    tmpdir = None
+    try:
+        filename = options.get("path")
+        if "bytecode" in options or do_verify:
+            tmpdir = tempfile.mkdtemp(prefix="uncompyle6-")
+        if "bytecode" in options:
+            filename = os.path.join(tmpdir, "bytecode.pyc")
+            with open(filename, "wb") as fp:
+                fp.write(base64.b64decode(options["bytecode"].encode("ascii")))
+        elif filename is None:
+            raise ValueError('request has neither "path" nor "bytecode"')
+
+        deparsed = decompile_file(
+            filename,
+            out,
+            source_encoding=options.get("encoding"),
+            mapstream=mapstream,
+            do_fragments=options.get("fragments", False),
+            cache=cache,
+            parse_budget=parse_budget,
+            fast_path=options.get("fast_path", False),
+        )
+        response = {
+            "status": "ok",
+            "source": out.getvalue(),
+            "budget_overruns": [
+                name for d in deparsed for name in getattr(d, "budget_overruns", ())
+            ],
+        }
+        if mapstream is not None:
+            response["linemap"] = mapstream.getvalue()
+        # As for main(), line maps come from their own deparser.
+        if options.get("fragments") and mapstream is None:
+            # The fragments deparser keeps its text rather than writing
+            # it out, so add it here and make positions relative to it.
+            response["fragments"] = []
+            for d in deparsed:
+                base = len(response["source"])
+                response["source"] += d.text
+                for name, offset in sorted(
+                    k for k in d.offsets.keys() if isinstance(k[1], int)
+                ):
+                    info = d.offsets[name, offset]
+                    response["fragments"].append(
+                        [name, offset, base + info.start, base + info.finish]
+                    )
+
+        if do_verify:
+            source_file = os.path.join(tmpdir, "source.py")
+            with io.open(source_file, "w", encoding="utf-8") as fp:
+                fp.write(response["source"])
+            try:
+                msg = verify.compare_code_with_srcfile(filename, source_file, do_verify)
+            except verify.VerifyCmpError as e:
+                msg = str(e)
+            if msg:
+                response["status"] = "verify failed"
+                response["error"] = msg
+        return response
+    except Exception as e:
+        return {"status": "failed", "source": out.getvalue(), "error": str(e)}
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def warm(versions):
+    """Build the grammars and scanners for bytecode `versions`."""
+    from uncompyle6.parser import get_python_parser
+    from uncompyle6.scanner import shared_scanner
+
+    for version in versions:
+        get_python_parser(version)
+        shared_scanner(version)
+
+
+def _open_cache(options):
+    if options.get("cache_dir") is None:
+        return None
+    from uncompyle6.cache import DecompileCache
+
+    if options.get("cache_size") is None:
+        return DecompileCache(options["cache_dir"])
+    return DecompileCache(options["cache_dir"], options["cache_size"])
+
+
+def _serve_worker(worker_id, listener, busy, defaults, options, versions, max_requests):
+    import signal
+
+    # Interrupts go to the server, which stops the workers.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    warm(versions)
+    cache = _open_cache(options)
+    requests = 0
+    while not max_requests or requests < max_requests:
+        conn, _ = listener.accept()
+        stream = conn.makefile("rb")
+        try:
+            while True:
+                request = read_message(stream)
+                if request is None:
+                    break
+                busy[worker_id] = time.time()
+                response = handle_request(request, defaults, cache)
+                busy[worker_id] = 0
+                send_message(conn, response)
+                requests += 1
+        except (socket.error, ValueError) as e:
+            # The client went away or sent something that isn't JSON.
+            busy[worker_id] = 0
+            sys.stderr.write("\n# worker %d: %s\n" % (worker_id, e))
+        finally:
+            stream.close()
+            conn.close()
+
+
+def _listen(socket_path):
+    if os.path.exists(socket_path):
+        # Take over from a server that has gone away, but not from one
+        # that is still running.
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+        except socket.error:
+            os.remove(socket_path)
+        else:
+            raise ServerError("a server is already listening on %s" % socket_path)
+        finally:
+            probe.close()
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(128)
+    return listener
+
+
+def serve(
+    socket_path,
+    numproc=None,
+    timeout=None,
+    max_worker_requests=None,
+    versions=(),
+    do_fragments=False,
+    do_linemaps=False,
+    do_verify=None,
+    source_encoding=None,
+    parse_budget=None,
+    fast_path=False,
+    cache_dir=None,
+    cache_size=None,
+):
+    """Answer decompilation requests on Unix domain socket `socket_path`
+    using `numproc` worker processes, one per CPU by default, until
+    interrupted.
+
+    timeout	 number of seconds after which a request is given up on
+    max_worker_requests replace a worker once it has answered this many
+                and its client has closed the connection
+    versions	 bytecode versions to build the grammars of up front
+
+    The options after those are the defaults for requests that don't set
+    them, named as for main(). Results are cached in `cache_dir` as for
+    main().
+    """
+    import signal
+    from multiprocessing import Array, Process, cpu_count
+
+    if not numproc:
+        numproc = cpu_count()
+    defaults = {
+        "fragments": do_fragments,
+        "linemaps": do_linemaps,
+        "verify": do_verify,
+        "encoding": source_encoding,
+        "fast_path": fast_path,
+    }
+    if parse_budget is not None:
+        defaults["parse_items"] = parse_budget.items
+        defaults["parse_seconds"] = parse_budget.seconds
+    options = {"cache_dir": cache_dir, "cache_size": cache_size}
+
+    # Workers started by forking get what is built here for nothing.
+    warm(versions)
+
+    listener = _listen(socket_path)
+    # When each worker started on its current request, or 0 when idle.
+    busy = Array("d", numproc, lock=False)
+    workers = [None] * numproc
+
+    def start_worker(worker_id):
+        busy[worker_id] = 0
+        worker = Process(
+            target=_serve_worker,
+            args=(
+                worker_id,
+                listener,
+                busy,
+                defaults,
+                options,
+                versions,
+                max_worker_requests,
+            ),
+        )
+        worker.daemon = True
+        worker.start()
+        workers[worker_id] = worker
+
+    def stop(signum, frame):
+        sys.exit(0)
+
+    old_handler = signal.signal(signal.SIGTERM, stop)
+    try:
+        for worker_id in range(numproc):
+            start_worker(worker_id)
+        sys.stderr.write(
+            "# serving on %s with %d workers\n" % (socket_path, numproc)
+        )
+        while True:
+            time.sleep(POLL_INTERVAL)
+            now = time.time()
+            for worker_id, worker in enumerate(workers):
+                started = busy[worker_id]
+                if timeout and started and now - started > timeout:
+                    sys.stderr.write(
+                        "\n# worker %d timed out after %s seconds\n" % (worker_id, timeout)
+                    )
+                    worker.terminate()
+                    worker.join()
+                    start_worker(worker_id)
+                elif not worker.is_alive():
+                    if worker.exitcode:
+                        sys.stderr.write(
+                            "\n# worker %d exited with code %s\n"
+                            % (worker_id, worker.exitcode)
+                        )
+                    start_worker(worker_id)
+    finally:
+        signal.signal(signal.SIGTERM, old_handler)
+        for worker in workers:
+            if worker is not None:
+                worker.terminate()
+                worker.join()
+        listener.close()
+        os.remove(socket_path)
+
+
+def _write_text(path, text):
+    dir = os.path.dirname(path)
+    if dir and not os.path.isdir(dir):
+        os.makedirs(dir)
+    with io.open(path, "w", encoding="utf-8") as fp:
+        fp.write(text)
+
+
+def client_main(
+    socket_path, in_base, out_base, compiled_files, outfile=None, **options
+):
+    """Like main(), but have the server at `socket_path` do the
+    decompiling. `options` are the request options in the module
+    docstring. Returns the same totals as main().
+    """
+    tot_files = okay_files = failed_files = verify_failed_files = 0
+    over_budget_files = 0
+    out = None
+    if outfile:
+        out = io.open(outfile, "w", encoding="utf-8")
+    client = None
+    try:
+        for filename in compiled_files:
+            infile = os.path.join(in_base, filename)
+            if client is None:
+                client = Client(socket_path)
+            try:
+                response = client.decompile(infile, **options)
+            except ServerError as e:
+                # Most likely the server gave up on the file; carry on
+                # with a new connection.
+                client.close()
+                client = None
+                response = {"status": "failed", "source": "", "error": str(e)}
+            tot_files += 1
+
+            if out_base is not None:
+                if filename.endswith(".pyc"):
+                    current_outfile = os.path.join(out_base, filename[0:-1])
+                else:
+                    current_outfile = os.path.join(out_base, filename) + "_dis"
+                if response["status"] == "failed":
+                    current_outfile += "_failed"
+                elif response["status"] == "verify failed":
+                    current_outfile += "_unverified"
+                _write_text(current_outfile, response["source"])
+            elif out is not None:
+                out.write(response["source"])
+            else:
+                sys.stdout.write(response["source"])
+
+            if "linemap" in response:
+                if out_base is None and out is None:
+                    sys.stdout.write(response["linemap"])
+                else:
+                    _write_text(infile + ".pymap", response["linemap"])
+
+            if response.get("budget_overruns"):
+                over_budget_files += 1
+                sys.stderr.write(
+                    "\n# file %s\n# parse budget exceeded in: %s\n"
+                    % (infile, ", ".join(response["budget_overruns"]))
+                )
+            if response["status"] == "failed":
+                failed_files += 1
+                sys.stderr.write("\n# file %s\n# %s\n" % (infile, response["error"]))
+            elif response["status"] == "verify failed":
+                verify_failed_files += 1
+                sys.stderr.write("### Error Verifying %s\n" % filename)
+                sys.stderr.write(response["error"] + "\n")
+            else:
+                okay_files += 1
+                if out_base is None and out is None:
+                    print("\n# okay decompiling", infile)
+    finally:
+        if client is not None:
+            client.close()
+        if out is not None:
+            out.close()
+    return (
+        tot_files,
+        okay_files,
+        failed_files,
+        verify_failed_files,
+        over_budget_files,
+    )
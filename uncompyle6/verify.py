@@ -25,7 +25,7 @@ import xdis.std as dis
 from subprocess import call
 
 import uncompyle6
-from uncompyle6.scanner import Token as ScannerToken, get_scanner
+from uncompyle6.scanner import Token as ScannerToken, shared_scanner
 from uncompyle6 import PYTHON3
 from xdis import iscode, load_file, load_module, pretty_code_flags, PYTHON_MAGIC_INT
 
@@ -227,7 +227,7 @@ def cmp_code_objects(version, is_pypy, code_obj1, code_obj2, verify, name=""):
         elif member == "co_code":
             if verify != "strong":
                 continue
-            scanner = get_scanner(version, is_pypy, show_asm=False)
+            scanner = shared_scanner(version, is_pypy, show_asm=False)
 
             global JUMP_OPS
             JUMP_OPS = list(scan.JUMP_OPS) + ["JUMP_BACK"]